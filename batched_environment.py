@@ -0,0 +1,85 @@
+import time
+import config
+import numpy as np
+from environment import Environment
+from trajectory_buffer import TrajectoryBuffer
+
+class BatchedEnvironment:
+    """Runs num_scenarios two-agent scenarios in lockstep.
+
+    States and goals are (num_scenarios, num_agents, num_states) arrays, and the dynamics and state and control limits
+    are vectorized over all scenarios. There is one controller per agent index, whose reset_state / make_step take and
+    return one row per scenario. The metrics are computed from the trajectories afterwards, like for single runs.
+    """
+    def __init__(self, initial_states, goals, num_iterations=None):
+        self.initial_states = np.array(initial_states, dtype=float)
+        self.goals = np.array(goals, dtype=float)
+        self.num_scenarios, self.num_agents = self.initial_states.shape[:2]
+        assert self.num_agents == 2, "Controllers see agent 1-agent_idx as the opponent."
+        self.sim_iteration = 0
+        self.buffer = TrajectoryBuffer(self.initial_states, num_iterations)
+
+    @property
+    def history(self):
+        return self.buffer.history
+
+    @property
+    def compute_history(self):
+        return self.buffer.compute_history
+
+    @staticmethod
+    def from_scenarios(scenarios):
+        initial_states = np.array([scenario.initial for scenario in scenarios])
+        goals = np.array([scenario.goals for scenario in scenarios])
+        return BatchedEnvironment(initial_states, goals)
+
+    def get_opp_states(self):
+        return self.initial_states[:, ::-1, :].copy()
+
+    def apply_state_lims(self, states):
+        states[..., 3] = np.clip(states[..., 3], -config.v_limit, config.v_limit)
+        return states
+
+    def apply_control_lims(self, controls):
+        controls[..., 0] = np.clip(controls[..., 0], -config.omega_limit, config.omega_limit)
+        controls[..., 1] = np.clip(controls[..., 1], -config.accel_limit, config.accel_limit)
+        return controls
+
+    def step_dynamics(self, states, controls):
+        flat_states = states.reshape(-1, config.num_states)
+        A, B = Environment.get_dynamics_np(flat_states)
+        new_states = flat_states + A*config.sim_ts + np.einsum('inm,im->in', B, controls.reshape(-1, config.num_controls))*config.sim_ts
+        return self.apply_state_lims(new_states.reshape(states.shape))
+
+    def run_simulation(self, sim_iteration, controllers):
+        """Runs one closed-loop tick of all scenarios."""
+        self.sim_iteration = sim_iteration
+        sim_time = self.sim_iteration * config.sim_ts
+
+        opp_states = self.get_opp_states()
+        controls = np.zeros((self.num_scenarios, self.num_agents, config.num_controls))
+        compute_times = []
+        for agent_idx, controller in enumerate(controllers):
+            cycle_start_time = time.time()
+            controller.reset_state(self.initial_states[:, agent_idx, :], opp_states[:, agent_idx, :])
+            controls[:, agent_idx, :] = np.array(controller.make_step(sim_time, self.initial_states[:, agent_idx, :])).reshape(self.num_scenarios, config.num_controls)
+            compute_times.append(time.time() - cycle_start_time)
+        controls = self.apply_control_lims(controls)
+
+        new_states = self.step_dynamics(self.initial_states, controls)
+        self.buffer.record_tick(controls, compute_times, new_states)
+        self.initial_states = new_states.copy()
+        return new_states, controls
+
+
+def run_batched_simulation(env, controllers):
+    """Runs all scenarios for config.runtime. Returns (num_scenarios, num_agents, num_iterations, ...) trajectories
+    and controls, laid out like simulation.run_simulation's x_cum and u_cum for each scenario."""
+    for controller in controllers:
+        controller.initialize_controller(env)
+
+    num_iterations = int(config.runtime / config.sim_ts)
+    for sim_iteration in range(num_iterations):
+        env.run_simulation(sim_iteration, controllers)
+
+    return env.buffer.get_state_trajectories(num_iterations), env.buffer.get_control_trajectories(num_iterations)
@@ -0,0 +1,59 @@
+import time
+import config
+import numpy as np
+from environment import Environment
+from mpc_cbf import MPC
+from blank_controller import BlankController
+from data_logger import BlankLogger
+from spatial import SpatialHash
+
+NUM_AGENTS = [2, 4, 8, 16, 32, 64]
+NUM_TICKS = 10
+# CONTROLLER = 'Blank'
+CONTROLLER = 'MPC'
+NUM_NEIGHBORS = 3
+
+"""Agents evenly spaced on a circle, each with the antipodal point as its goal."""
+def get_circle_swap_states(num_agents):
+    spacing = 2 * (config.agent_radius + config.safety_dist) + 0.2
+    radius = max(1.5, num_agents * spacing / (2 * np.pi))
+    angles = np.linspace(0, 2 * np.pi, num_agents, endpoint=False)
+    initial_states = np.array([[radius * np.cos(a), radius * np.sin(a), a + np.pi, 0.0] for a in angles])
+    goals = np.array([[-radius * np.cos(a), -radius * np.sin(a), a + np.pi, 0.0] for a in angles])
+    return initial_states, goals
+
+
+def get_controllers(num_agents, goals):
+    if CONTROLLER == 'Blank':
+        return [BlankController() for _ in range(num_agents)]
+    return [MPC(agent_idx=agent_idx, opp_gamma=config.opp_gamma, obs_gamma=config.obs_gamma, live_gamma=config.liveliness_gamma, liveness_thresh=config.liveness_threshold, goal=goals[agent_idx, :].copy()) for agent_idx in range(num_agents)]
+
+
+if __name__ == '__main__':
+    config.num_neighbors = NUM_NEIGHBORS
+    config.simulator_backend = 'numpy'
+    config.mpc_persistent_controller = True
+    logger = BlankLogger()
+
+    print(f"{CONTROLLER} controllers, {NUM_NEIGHBORS} neighbors, {NUM_TICKS} ticks")
+    for num_agents in NUM_AGENTS:
+        initial_states, goals = get_circle_swap_states(num_agents)
+        env = Environment(initial_states, goals)
+        controllers = get_controllers(num_agents, goals)
+        for controller in controllers:
+            controller.initialize_controller(env)
+
+        tick_times = []
+        for sim_iteration in range(NUM_TICKS):
+            start = time.time()
+            env.run_simulation(sim_iteration, controllers, logger)
+            tick_times.append(time.time() - start)
+
+        # Neighbor search alone, on the final states.
+        start = time.time()
+        env.neighbor_index = SpatialHash(env.initial_states, config.neighbor_cell_size)
+        for agent_idx in range(num_agents):
+            env.get_neighbor_states(agent_idx)
+        neighbor_time = time.time() - start
+
+        print(f"{num_agents:3d} agents: {np.mean(tick_times) * 1000:9.2f} ms/tick ({np.mean(tick_times) / num_agents * 1000:7.2f} ms/agent), neighbor search {neighbor_time * 1000:.3f} ms")
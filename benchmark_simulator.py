@@ -0,0 +1,40 @@
+import time
+import config
+import numpy as np
+from environment import Environment
+from run_experiments import get_scenario
+
+SCENARIO = 'Doorway'
+NUM_TICKS = int(config.runtime / config.sim_ts)
+NUM_ROLLOUTS = 20
+SEED = 0
+
+"""Rolls out the same control sequence on one simulator backend. Returns the states and the mean time per tick."""
+def rollout(backend, initial_states, goals, controls):
+    config.simulator_backend = backend
+    env = Environment(initial_states.copy(), goals.copy())
+    states = [env.initial_states.copy()]
+    start = time.time()
+    for tick_controls in controls:
+        tick_controls = np.array([env.apply_control_lims(u.copy()) for u in tick_controls])
+        states.append(env.step_dynamics(states[-1], tick_controls))
+    return np.array(states), (time.time() - start) / len(controls)
+
+
+if __name__ == '__main__':
+    scenario = get_scenario(SCENARIO)
+    rng = np.random.default_rng(SEED)
+    limits = np.array([config.omega_limit, config.accel_limit])
+
+    max_errors, do_mpc_times, numpy_times = [], [], []
+    for _ in range(NUM_ROLLOUTS):
+        controls = rng.uniform(-limits, limits, size=(NUM_TICKS, scenario.initial.shape[0], config.num_controls))
+        do_mpc_states, do_mpc_time = rollout('do_mpc', scenario.initial, scenario.goals, controls)
+        numpy_states, numpy_time = rollout('numpy', scenario.initial, scenario.goals, controls)
+        max_errors.append(np.max(np.abs(do_mpc_states - numpy_states)))
+        do_mpc_times.append(do_mpc_time)
+        numpy_times.append(numpy_time)
+
+    print(f"{NUM_ROLLOUTS} rollouts of {NUM_TICKS} ticks with {scenario.initial.shape[0]} agents in {SCENARIO}")
+    print(f"Max state difference between backends: {np.max(max_errors):.3e}")
+    print(f"do_mpc: {np.mean(do_mpc_times) * 1000:.3f} ms/tick, numpy: {np.mean(numpy_times) * 1000:.3f} ms/tick, speedup {np.mean(do_mpc_times) / np.mean(numpy_times):.1f}x")
@@ -0,0 +1,60 @@
+import copy
+import pickle
+
+"""Deep copy of the attributes in obj.CHECKPOINT_ATTRS that are set, or what obj's own get_checkpoint_state returns."""
+def get_checkpoint_state(obj):
+    if hasattr(obj, 'get_checkpoint_state'):
+        return obj.get_checkpoint_state()
+    return {name: copy.deepcopy(getattr(obj, name)) for name in getattr(obj, 'CHECKPOINT_ATTRS', ()) if hasattr(obj, name)}
+
+
+"""Restores a state from get_checkpoint_state. Only attributes in obj.CHECKPOINT_ATTRS are set, so the state of one
+controller type can be applied to another (e.g. MPC warm starts to a QPMPC) without adding unused attributes."""
+def set_checkpoint_state(obj, state):
+    if hasattr(obj, 'set_checkpoint_state'):
+        obj.set_checkpoint_state(state)
+        return
+    for name in getattr(obj, 'CHECKPOINT_ATTRS', ()):
+        if name in state:
+            setattr(obj, name, copy.deepcopy(state[name]))
+
+
+class Checkpoint:
+    """State of a run at the start of a tick: the environment (trajectory so far, held controls, early-termination
+    counters), each controller's tick-to-tick state (opponent estimates, warm starts, previous plans) and optionally
+    the metrics accumulator's running totals.
+
+    Solvers are not part of it. restore() applies the state to an environment and to controllers that have already
+    been initialized, which simulation.run_simulation does when it is given a checkpoint. A branch can therefore use
+    new controllers, e.g. MPCs with other gammas, that start from the saved warm starts.
+    """
+    def __init__(self, sim_iteration, env_state, controller_states, metrics_state=None):
+        self.sim_iteration = sim_iteration
+        self.env_state = env_state
+        self.controller_states = controller_states
+        self.metrics_state = metrics_state
+
+    @staticmethod
+    def capture(env, controllers, metrics_accumulator=None):
+        metrics_state = None if metrics_accumulator is None else get_checkpoint_state(metrics_accumulator)
+        return Checkpoint(env.buffer.num_ticks, get_checkpoint_state(env), [get_checkpoint_state(controller) for controller in controllers], metrics_state)
+
+    """Restores the checkpoint into env (and the controllers and accumulator, if given). Returns the iteration to
+    continue from."""
+    def restore(self, env, controllers=None, metrics_accumulator=None):
+        set_checkpoint_state(env, self.env_state)
+        if controllers is not None:
+            for controller, controller_state in zip(controllers, self.controller_states):
+                set_checkpoint_state(controller, controller_state)
+        if metrics_accumulator is not None and self.metrics_state is not None:
+            set_checkpoint_state(metrics_accumulator, self.metrics_state)
+        return self.sim_iteration
+
+    def save(self, filepath):
+        with open(filepath, 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(filepath):
+        with open(filepath, 'rb') as f:
+            return pickle.load(f)
@@ -28,6 +28,65 @@ agent_zero_offset = 0
 consider_intersects = True
 mpc_use_new_liveness_filter = True
 mpc_static_obs_non_cbf_constraint = False
+# Build the MPC-CBF NLP once per agent and pass the opponent / liveness terms in as time-varying parameters,
+# instead of rebuilding it on every control tick.
+mpc_persistent_controller = False
+# Initialize IPOPT from the previous tick's primal/dual solution, shifted by one step.
+mpc_warm_start = False
+# Generate C code for the NLP, compile it once and load it from solver_cache_dir in later runs.
+# Only used together with mpc_persistent_controller.
+mpc_compiled_solver_cache = False
+solver_cache_dir = 'solver_cache/'
+solver_cache_compiler = 'gcc'
+# Only give the MPC the mpc_obs_slots nearest static obstacles that can be reached within the horizon.
+mpc_cull_static_obs = False
+mpc_obs_slots = 10
+mpc_obs_cull_margin = 0.1
+# Per-tick solver budget in seconds (IPOPT max_cpu_time), e.g. sim_ts. None solves to convergence.
+# When a budgeted solve fails, MPC uses the last iterate if it is feasible, else the previous plan shifted by one step.
+mpc_compute_budget = None
+mpc_fallback_feas_tol = 1e-4
+# LRU cache of MPC solutions (solution_cache.py), keyed by the quantized ego state and relative opponent state.
+# 'control' returns the cached control without solving, 'warm_start' uses the cached solution as the initial guess.
+mpc_solution_cache = False
+mpc_solution_cache_mode = 'control'
+mpc_solution_cache_resolution = 0.02
+mpc_solution_cache_size = 10000
+# QP-based MPC-CBF (qp_mpc_cbf.QPMPC). Each SQP iteration re-linearizes around the latest plan.
+qp_solver = 'osqp'
+qp_solver_opts = {
+    'osqp': {'osqp': {'verbose': False, 'eps_abs': 1e-6, 'eps_rel': 1e-6}, 'error_on_fail': False},
+    'qpoases': {'printLevel': 'none', 'error_on_fail': False},
+}
+qp_mpc_sqp_iters = 1
+# Stop a simulation early once every agent has reached its goal, agents have collided, or all agents have been
+# stopped short of their goals for deadlock_ticks ticks. Trajectories are padded to the full runtime with the last state.
+# After a collision stop, the metrics other than the collision describe the run up to the collision.
+stop_on_goal = False
+stop_on_collision = False
+stop_on_deadlock = False
+deadlock_ticks = 20
+deadlock_vel_threshold = 0.01
+# Each agent's controller sees its num_neighbors nearest agents, found with a spatial hash of neighbor_cell_size cells.
+# The nearest is the opponent, and MPC adds an opponent CBF for each of the others.
+num_neighbors = 1
+neighbor_cell_size = 1.0
+# An agent with no other agent to observe gets a stopped opponent this far away, out of range of every barrier.
+absent_opponent_dist = 1000.0
+# Multi-rate simulation: the plant is stepped every plant_ts (None: once per sim_ts tick), and each controller class is
+# called every controller_periods[class name] seconds (default sim_ts), holding its control in between.
+# e.g. plant_ts = 0.05, controller_periods = {'MPC': 0.4, 'ModelController': 0.1}
+plant_ts = None
+controller_periods = {}
+# Environment simulator: 'do_mpc' (do_mpc Simulator, one agent at a time) or 'numpy' (all agents in one array operation).
+simulator_backend = 'do_mpc'
+# Run each agent's controller in its own worker process (parallel.ParallelController) and solve all agents at once.
+parallel_agents = False
+# DataLogger file format: 'json' rewrites the whole history as one JSON document every tick. 'jsonl' (opt-in, since
+# readers of the old logs expect one document) appends a header record and then one record per tick, written every
+# logger_flush_interval ticks.
+logger_format = 'json'
+logger_flush_interval = 50
 
 if dynamics == DynamicsModel.SINGLE_INTEGRATOR:
     num_states = 3 # (x, y, theta)
@@ -78,6 +137,8 @@ COST_MATRICES = {
 train_data_paths = ['datasets/doorway_scenario_suite_5/']
 
 agents_to_train_on = [0, 1]
+# Extracted features are cached here, keyed by the training data contents and the feature flags (None: no cache).
+feature_cache_dir = 'feature_cache'
 
 # Liveness / CBF Filters (all the cool shit)
 add_liveness_filter = True
@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+from data_logger import DataLogger
+from trajectory_store import RUN_SUFFIX, get_run_dirname, is_run_up_to_date, data_to_arrays, get_solver_stats, write_run
+
+# Folders searched (recursively) for JSON / JSONL logs when no paths are given on the command line.
+ROOTS = ['datasets', 'experiment_results']
+# Convert logs again even if their run directory is newer than the log.
+OVERWRITE = False
+
+"""Reads a file as a DataLogger log, or returns None for other JSON files (e.g. model definitions)."""
+def read_log(filename):
+    try:
+        data = DataLogger.read_data(filename)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or 'iterations' not in data or 'obstacles' not in data:
+        return None
+    return data
+
+
+def convert_log(filename):
+    run_dirname = get_run_dirname(filename)
+    if not OVERWRITE and is_run_up_to_date(run_dirname, filename):
+        return False
+    data = read_log(filename)
+    if data is None:
+        return False
+    metadata = {
+        'source': filename,
+        # The scenario parameters are only recorded in the file and folder names.
+        'suite': os.path.basename(os.path.dirname(filename)),
+        'name': os.path.splitext(os.path.basename(filename))[0],
+    }
+    write_run(run_dirname, data_to_arrays(data), metadata, get_solver_stats(data))
+    return True
+
+
+def find_logs(root):
+    if os.path.isfile(root):
+        return [root]
+    logs = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Skip the run directories themselves.
+        dirnames[:] = [dirname for dirname in dirnames if not dirname.endswith(RUN_SUFFIX)]
+        logs += [os.path.join(dirpath, filename) for filename in sorted(filenames) if filename.endswith(('.json', '.jsonl'))]
+    return logs
+
+
+if __name__ == '__main__':
+    roots = sys.argv[1:] if len(sys.argv) > 1 else ROOTS
+    num_converted = 0
+    for root in roots:
+        for filename in find_logs(root):
+            if convert_log(filename):
+                print(f"{filename} -> {get_run_dirname(filename)}")
+                num_converted += 1
+    print(f"Converted {num_converted} logs")
@@ -3,7 +3,9 @@ import json
 import torch
 import config
 import numpy as np
-from util import perturb_model_input, calculate_all_metrics
+from util import perturb_model_input_batch, calculate_liveness_batch
+from feature_cache import get_feature_cache_key, load_features, save_features
+from trajectory_store import RUN_SUFFIX, is_run_dir, is_run_up_to_date, get_run_dirname, read_run, data_to_arrays, arrays_to_data
 
 class Dataset(torch.utils.data.Dataset):
     # Characterizes a dataset for PyTorch
@@ -24,35 +26,110 @@ class Dataset(torch.utils.data.Dataset):
 
 
 class DataLogger:
+    """Logs a run's obstacles and each tick's states, goals, controls, use_for_training flags and compute times.
+
+    With config.logger_format == 'jsonl', the file holds a header record with the obstacles and goals, then one
+    record per tick, appended every config.logger_flush_interval ticks and by flush() (which run_simulation calls at
+    the end of a run). With 'json' the whole history is rewritten as one document every tick. read_data and
+    load_file read both formats, and run directories written by convert_logs.py, into the same dict.
+    """
     def __init__(self, filename):
         self.filename = filename
         self.data = {
             'iterations': [],
             'obstacles': []
         }
+        self.format = config.logger_format
+        self.pending_iterations = []
+        self.header_goals = None
+        self.header_written = False
     
     def set_obstacles(self, obstacles):
         self.data['obstacles'] = obstacles
 
 
-    def log_iteration(self, states, goals, controls, use_for_training, compute_times):
+    def log_iteration(self, states, goals, controls, use_for_training, compute_times, solver_stats=None):
         states = [state.reshape(-1).tolist() for state in states]
         goals = [goal.reshape(-1).tolist() for goal in goals]
         controls = [control.reshape(-1).tolist() for control in controls]
-        self.data['iterations'].append({
+        iteration = {
             'states': states,
             'goals': goals,
             'controls': controls,
             'use_for_training': use_for_training,
             'compute_times': compute_times,
-        })
-        json.dump(self.data, open(self.filename, 'w'))
+        }
+        # Per-agent solver stats (None for agents without an optimizer, or that did not solve this tick).
+        if solver_stats is not None:
+            iteration['solver_stats'] = [None if stats is None else dict(stats) for stats in solver_stats]
+        if self.format == 'json':
+            self.data['iterations'].append(iteration)
+            json.dump(self.data, open(self.filename, 'w'))
+            return
+
+        # The goals go in the header, and a tick record only repeats them if they changed.
+        if self.header_goals is None:
+            self.header_goals = goals
+        if goals == self.header_goals:
+            del iteration['goals']
+        self.pending_iterations.append(iteration)
+        if len(self.pending_iterations) >= config.logger_flush_interval:
+            self.flush()
+
+
+    """Appends the ticks logged since the last flush (writing the header first)."""
+    def flush(self):
+        if self.format == 'json' or (self.header_written and len(self.pending_iterations) == 0):
+            return
+        with open(self.filename, 'a' if self.header_written else 'w') as f:
+            if not self.header_written:
+                f.write(json.dumps({'type': 'header', 'obstacles': self.data['obstacles'], 'goals': self.header_goals}) + '\n')
+                self.header_written = True
+            for iteration in self.pending_iterations:
+                f.write(json.dumps(iteration) + '\n')
+        self.pending_iterations = []
+
+
+    """Reads a log in any format. Returns {'obstacles': ..., 'iterations': [...]} with the goals in every iteration."""
+    @staticmethod
+    def read_data(filename):
+        if is_run_dir(filename):
+            arrays, meta = read_run(filename)
+            return arrays_to_data(arrays, meta.get('solver_stats'))
+        with open(filename) as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                # A JSON document over several lines.
+                f.seek(0)
+                return json.load(f)
+            if not isinstance(header, dict) or header.get('type') != 'header':
+                # The 'json' format writes the whole document on its first line.
+                return header
+
+            iterations = []
+            for line in f:
+                if not line.strip():
+                    continue
+                iteration = json.loads(line)
+                iteration.setdefault('goals', header['goals'])
+                iterations.append(iteration)
+        return {'obstacles': header['obstacles'], 'iterations': iterations}
+
+
+    """Reads a log in any format as the run arrays of trajectory_store. Run directories are loaded without parsing,
+    and memory-mapped with mmap_mode='r'."""
+    @staticmethod
+    def read_arrays(filename, mmap_mode=None):
+        if is_run_dir(filename):
+            return read_run(filename, mmap_mode)[0]
+        return data_to_arrays(DataLogger.read_data(filename))
 
 
     @staticmethod
     def load_file(filename):
         logger = DataLogger(filename)
-        logger.data = json.load(open(filename))
+        logger.data = DataLogger.read_data(filename)
         return logger
 
 
@@ -63,13 +140,19 @@ class BlankLogger:
     def set_obstacles(self, obstacles):
         pass
 
-    def log_iteration(self, states, goals, controls, use_for_training, compute_times):
+    def log_iteration(self, states, goals, controls, use_for_training, compute_times, solver_stats=None):
+        pass
+
+    def flush(self):
         pass
 
 
 # Extracts inputs and outputs from data files.
+# Run directories are memory-mapped (mmap_mode), so only the ticks that are used as samples are read from disk.
+# JSON / JSONL logs are converted to arrays on load and the parsed logs are not kept. Logs are only loaded once they
+# are needed, so get_training_data does not read them on a feature cache hit.
 class DataGenerator:
-    def __init__(self, filenames, x_is_d_goal, add_liveness_as_input, fixed_liveness_input, num_opponents, static_obs_xy_only, ego_frame_inputs, add_new_liveness_as_input, add_dist_to_static_obs):
+    def __init__(self, filenames, x_is_d_goal, add_liveness_as_input, fixed_liveness_input, num_opponents, static_obs_xy_only, ego_frame_inputs, add_new_liveness_as_input, add_dist_to_static_obs, mmap_mode='r'):
         self.x_is_d_goal = x_is_d_goal
         self.add_liveness_as_input = add_liveness_as_input
         self.fixed_liveness_input = fixed_liveness_input
@@ -78,57 +161,133 @@ class DataGenerator:
         self.ego_frame_inputs = ego_frame_inputs
         self.add_new_liveness_as_input = add_new_liveness_as_input
         self.add_dist_to_static_obs = add_dist_to_static_obs
+        self.mmap_mode = mmap_mode
 
-        self.data_streams = []
+        self.run_paths = []
         self.filenames = filenames
         for filename in filenames:
-            if os.path.isdir(filename):
+            if os.path.isdir(filename) and not is_run_dir(filename):
                 folder = filename
-                for subfile in os.listdir(folder):
-                    if not subfile.endswith('.json'):
-                        continue
+                for subfile in self.get_run_files(folder):
                     print(os.path.join(folder, subfile))
-                    self.data_streams.append(json.load(open(os.path.join(folder, subfile))))
+                    self.run_paths.append(os.path.join(folder, subfile))
             else:
                 print(filename)
-                self.data_streams.append(json.load(open(filename)))
-        print("Number of file streams:", len(self.data_streams))
+                self.run_paths.append(filename)
+        print("Number of file streams:", len(self.run_paths))
+        self.loaded_runs = None
+
+
+    """One dict of trajectory_store arrays per run, loaded on first use."""
+    @property
+    def runs(self):
+        if self.loaded_runs is None:
+            self.loaded_runs = [DataLogger.read_arrays(run_path, self.mmap_mode) for run_path in self.run_paths]
+        return self.loaded_runs
+
+
+    """The ModelDefinition fields that the inputs depend on."""
+    def get_feature_fields(self):
+        return {
+            'x_is_d_goal': self.x_is_d_goal,
+            'add_liveness_as_input': self.add_liveness_as_input,
+            'fixed_liveness_input': self.fixed_liveness_input,
+            'n_opponents': self.num_opponents,
+            'static_obs_xy_only': self.static_obs_xy_only,
+            'ego_frame_inputs': self.ego_frame_inputs,
+            'add_new_liveness_as_input': self.add_new_liveness_as_input,
+            'add_dist_to_static_obs': self.add_dist_to_static_obs,
+            # Used by the new liveness input.
+            'agent_radius': config.agent_radius,
+        }
+
+
+    def get_training_data(self, agent_idxs, cache_dir=None):
+        """Normalized inputs and outputs with their means and stds:
+        (norm_inputs, input_mean, input_std, norm_outputs, output_mean, output_std).
+
+        With a cache_dir, the arrays are stored under a key made from the contents of the logs, the feature fields
+        and agent_idxs. When the key is already cached, they are returned as read-only memory maps without loading
+        the logs.
+        """
+        if cache_dir is not None:
+            key = get_feature_cache_key(self.run_paths, self.get_feature_fields(), agent_idxs)
+            cached = load_features(cache_dir, key)
+            if cached is not None:
+                print(f"Loaded features from {os.path.join(cache_dir, key)}")
+                return cached
+
+        norm_inputs, input_mean, input_std = self.get_inputs(agent_idxs=agent_idxs, normalize=True)
+        norm_outputs, output_mean, output_std = self.get_outputs(agent_idxs=agent_idxs, normalize=True)
+        training_data = (norm_inputs, input_mean, input_std, norm_outputs, output_mean, output_std)
+        if cache_dir is not None:
+            metadata = {'sources': self.run_paths, 'features': self.get_feature_fields(), 'agents': [int(agent_idx) for agent_idx in agent_idxs]}
+            save_features(cache_dir, key, training_data, metadata)
+        return training_data
+
+
+    """Logs in a folder. A converted run directory is used instead of the JSON / JSONL log it was converted from,
+    unless the log changed after it was converted (the same check as convert_logs.convert_log)."""
+    @staticmethod
+    def get_run_files(folder):
+        subfiles = sorted(os.listdir(folder))
+        logs = [subfile for subfile in subfiles if subfile.endswith(('.json', '.jsonl'))]
+        run_dirs = [subfile for subfile in subfiles if subfile.endswith(RUN_SUFFIX) and is_run_dir(os.path.join(folder, subfile))]
+        stale = set(get_run_dirname(log) for log in logs if not is_run_up_to_date(os.path.join(folder, get_run_dirname(log)), os.path.join(folder, log)))
+        converted = set(run_dir for run_dir in run_dirs if run_dir not in stale)
+        logs = [log for log in logs if get_run_dirname(log) not in converted]
+        return sorted(list(converted) + logs)
+
+
+    """(run, tick, agent) of every training sample, in the order that get_inputs and get_outputs return them.
+    Only reads the runs' use_for_training flags."""
+    def get_sample_index(self, agent_idxs):
+        agent_idxs = np.array(agent_idxs)
+        sample_index = [np.zeros((0, 3), dtype=int)]
+        for run_idx, run in enumerate(self.runs):
+            # A log without ticks has no agents to index either.
+            if len(run['use_for_training']) == 0:
+                continue
+            ticks, agent_slots = np.nonzero(run['use_for_training'][:, agent_idxs])
+            sample_index.append(np.stack([np.full(len(ticks), run_idx), ticks, agent_idxs[agent_slots]], axis=1))
+        return np.concatenate(sample_index)
+
+
+    """Splits a sample index, which is sorted by run, into each run's samples."""
+    def split_sample_index(self, sample_index):
+        bounds = np.searchsorted(sample_index[:, 0], np.arange(len(self.runs) + 1))
+        return [sample_index[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
 
 
     def get_inputs(self, agent_idxs, normalize):
+        sample_index = self.get_sample_index(agent_idxs)
         data = []
-        total_count = 0
         num_unlive = 0
-        for data_stream in self.data_streams:
-            for iteration in data_stream['iterations']:
-                for agent_idx in agent_idxs:
-                    if 'use_for_training' in iteration and not iteration['use_for_training'][agent_idx]:
-                        continue
-                    # 4 + 4 = 8 inputs.
-                    inputs = iteration['states'][agent_idx] + iteration['states'][1 - agent_idx]
-
-                    metrics = calculate_all_metrics(np.array(iteration['states'][agent_idx]), np.array(iteration['states'][1 - agent_idx]), config.liveness_threshold)
-                    if not metrics[-1]:
-                        num_unlive += 1
-
-                    total_count += 1
-                    inputs = perturb_model_input(
-                        inputs,
-                        data_stream['obstacles'],
-                        self.num_opponents,
-                        self.x_is_d_goal,
-                        self.add_liveness_as_input,
-                        self.fixed_liveness_input,
-                        self.static_obs_xy_only,
-                        self.ego_frame_inputs,
-                        self.add_new_liveness_as_input,
-                        self.add_dist_to_static_obs,
-                        iteration['goals'][agent_idx],
-                        metrics
-                    )
-
-                    data.append(np.array(inputs))
-        data = np.array(data)
+        for run, run_samples in zip(self.runs, self.split_sample_index(sample_index)):
+            if len(run_samples) == 0:
+                continue
+            ticks, sample_agent_idxs = run_samples[:, 1], run_samples[:, 2]
+            # 4 + 4 = 8 inputs per sample, all of the run's samples at once.
+            ego_states, opp_states = run['states'][ticks, sample_agent_idxs], run['states'][ticks, 1 - sample_agent_idxs]
+            _, _, is_live = calculate_liveness_batch(ego_states, opp_states, config.liveness_threshold)
+            num_unlive += int(np.sum(~is_live))
+
+            data.append(perturb_model_input_batch(
+                ego_states,
+                opp_states,
+                run['goals'][ticks, sample_agent_idxs],
+                run['obstacles'],
+                self.num_opponents,
+                self.x_is_d_goal,
+                self.add_liveness_as_input,
+                self.fixed_liveness_input,
+                self.static_obs_xy_only,
+                self.ego_frame_inputs,
+                self.add_new_liveness_as_input,
+                self.add_dist_to_static_obs
+            ))
+        data = np.concatenate(data) if len(data) > 0 else np.zeros((0, 0))
+        total_count = len(data)
         print(f"Num unlive: {num_unlive}, total count: {total_count}")
 
         if not normalize:
@@ -141,15 +300,11 @@ class DataGenerator:
 
 
     def get_outputs(self, agent_idxs, normalize):
-        data = []
-        for data_stream in self.data_streams:
-            for iteration in data_stream['iterations']:
-                for agent_idx in agent_idxs:
-                    if 'use_for_training' in iteration and not iteration['use_for_training'][agent_idx]:
-                        continue
-                    controls = iteration['controls'][agent_idx]
-                    data.append(controls)
-        data = np.array(data)
+        sample_index = self.get_sample_index(agent_idxs)
+        data = [np.zeros((0, config.num_controls))]
+        for run, run_samples in zip(self.runs, self.split_sample_index(sample_index)):
+            data.append(run['controls'][run_samples[:, 1], run_samples[:, 2]])
+        data = np.concatenate(data)
 
         if not normalize:
             return data, np.zeros(data.shape[1]), np.ones(data.shape[1])
@@ -162,5 +317,5 @@ class DataGenerator:
 
     # TODO: Fix this when obstacles become part of the input (dynamic).
     def get_obstacles(self):
-        return self.data_streams[0]['obstacles'].copy()
+        return self.runs[0]['obstacles'].tolist()
 
@@ -7,7 +7,8 @@ from data_logger import DataLogger
 from environment import Environment
 from simulation import run_simulation
 
-from metrics import gather_all_metric_data
+from solution_cache import get_solution_cache
+from metrics import SOLVER_STATS_HEADER, MetricsAccumulator
 import numpy as np
 
 SCENARIO = 'Doorway'
@@ -232,13 +233,16 @@ for scenario, mpc_params in zip(scenarios, best_params):
             controllers.append(MPC(agent_idx=0, goal=goals[0,:], opp_gamma=config.opp_gamma, obs_gamma=config.obs_gamma, live_gamma=config.liveliness_gamma, liveness_thresh=config.liveness_threshold, static_obs=scenario.obstacles.copy(), delay_start=max(config.agent_zero_offset, 0.0)))
             controllers.append(MPC(agent_idx=1, goal=goals[1,:], opp_gamma=config.opp_gamma, obs_gamma=config.obs_gamma, live_gamma=config.liveliness_gamma, liveness_thresh=config.liveness_threshold, static_obs=scenario.obstacles.copy(), delay_start=max(-config.agent_zero_offset, 0.0)))
 
-            x_cum, u_cum = run_simulation(scenario, env, controllers, logger, plotter)
+            metrics_accumulator = MetricsAccumulator(scenario, scenario.goals)
+            x_cum, u_cum = run_simulation(scenario, env, controllers, logger, plotter, metrics_accumulator)
             print("Saving scenario to:", log_filename)
 
-            metric_data = gather_all_metric_data(scenario, x_cum[0], x_cum[1], scenario.goals, env.compute_history)
+            metric_data = metrics_accumulator.get_metric_data(include_solver_stats=True)
             all_metric_data.append(metric_data)
 
             all_metric_data_save = np.array(all_metric_data)
             save_filename = f"{folder_to_save_to.rstrip('/')}_{start_idx}_{end_idx}.csv"
             print(f"Saving experiment results to {save_filename}")
-            np.savetxt(save_filename, all_metric_data_save, fmt='%0.4f', delimiter=', ', header='goal_reach_idx0, goal_reach_idx1, min_agent_dist, traj_collision, obs_min_dist_0, obs_collision_0, obs_min_dist_1, obs_collision_1, delta_vel_0, delta_vel_1, path_dev_0, path_dev_1, avg_compute_0, avg_compute_1')
+            np.savetxt(save_filename, all_metric_data_save, fmt='%0.4f', delimiter=', ', header='goal_reach_idx0, goal_reach_idx1, min_agent_dist, traj_collision, obs_min_dist_0, obs_collision_0, obs_min_dist_1, obs_collision_1, delta_vel_0, delta_vel_1, path_dev_0, path_dev_1, avg_compute_0, avg_compute_1' + ', ' + SOLVER_STATS_HEADER)
+            if config.mpc_solution_cache:
+                print("MPC solution cache:", get_solution_cache().get_stats())
@@ -4,18 +4,43 @@ from casadi import *
 import config
 from config import DynamicsModel
 import numpy as np
+from spatial import SpatialHash
+from trajectory_buffer import TrajectoryBuffer
 from memory_profiler import profile
 
 class Environment:
-    def __init__(self, initial_states, goals):
+    # State that run_simulation advances from tick to tick, see checkpoint.py.
+    CHECKPOINT_ATTRS = ('initial_states', 'buffer', 'solver_stats_history', 'phase_compute_history', 'tick_time_history', 'goal_reached', 'held_controls', 'stopped_ticks', 'prev_states')
+
+    def __init__(self, initial_states, goals, num_iterations=None):
         self.num_agents = len(initial_states)
         self.initial_states = initial_states
         self.goals = goals
-        self.history = [initial_states.copy()]
-        self.compute_history = []
+        # States, controls and compute times of every tick, preallocated for the run (config.runtime by default).
+        self.buffer = TrajectoryBuffer(initial_states, num_iterations)
+        self.solver_stats_history = []
+        self.phase_compute_history = []
+        self.tick_time_history = []
+        self.goal_reached = np.zeros(self.num_agents, dtype=bool)
+        self.held_controls = np.zeros((self.num_agents, config.num_controls))
+        self.stopped_ticks = 0
+        # States before the last plant step (None before the first one), for the observed single-integrator velocity.
+        self.prev_states = None
+        # Checkpoints captured by simulation.run_simulation, by iteration.
+        self.checkpoints = {}
 
         self.model = self.define_model()
-        self.simulator = self.define_simulator()
+        self.simulator_backend = config.simulator_backend
+        if self.simulator_backend == 'do_mpc':
+            self.simulator = self.define_simulator()
+
+    @property
+    def history(self):
+        return self.buffer.history
+
+    @property
+    def compute_history(self):
+        return self.buffer.compute_history
 
     def define_model(self, call_setup=True):
         """Configures the dynamical model of the system (and part of the objective function).
@@ -98,6 +123,47 @@ class Environment:
         B[3, 1] = 1 # dv = a
         return A, B
 
+    """Batched dynamics for the NumPy simulator. x is (num_agents, num_states), returns A (num_agents, num_states) and
+    B (num_agents, num_states, num_controls). Same matrices as get_dynamics, including the relative-degree terms."""
+    @staticmethod
+    def get_dynamics_np(x):
+        a = 1e-9
+        A = np.zeros(x.shape)
+        B = np.zeros(x.shape + (config.num_controls,))
+        cos_theta, sin_theta = np.cos(x[:, 2]), np.sin(x[:, 2])
+        if config.dynamics == DynamicsModel.SINGLE_INTEGRATOR:
+            B[:, 0, 0] = cos_theta
+            B[:, 0, 1] = -a*sin_theta
+            B[:, 1, 0] = sin_theta
+            B[:, 1, 1] = a*cos_theta
+            B[:, 2, 1] = 1
+        else:
+            A[:, 0] = x[:, 3] * cos_theta
+            A[:, 1] = x[:, 3] * sin_theta
+            B[:, 0, 1] = -a*sin_theta
+            B[:, 1, 1] = a*cos_theta
+            B[:, 2, 0] = 1
+            B[:, 3, 1] = 1
+        return A, B
+
+    """Advances all agents by one step of dt (sim_ts by default) and applies the state limits.
+    The do_mpc simulator has a fixed sim_ts step, so other steps always use the NumPy dynamics."""
+    def step_dynamics(self, states, controls, dt=None):
+        dt = config.sim_ts if dt is None else dt
+        states = np.array(states, dtype=float)
+        controls = np.array(controls, dtype=float).reshape(self.num_agents, config.num_controls)
+        if self.simulator_backend == 'numpy' or dt != config.sim_ts:
+            A, B = self.get_dynamics_np(states)
+            new_states = states + A*dt + np.einsum('inm,im->in', B, controls)*dt
+        else:
+            new_states = np.zeros(states.shape)
+            for agent_idx in range(self.num_agents):
+                self.reset_state(states[agent_idx, :])
+                new_states[agent_idx, :] = self.simulator.make_step(controls[agent_idx, :].reshape(-1, 1)).ravel()
+        for agent_idx in range(self.num_agents):
+            new_states[agent_idx, :] = self.apply_state_lims(new_states[agent_idx, :])
+        return new_states
+
     """Configures the simulator."""
     def define_simulator(self):
         simulator = do_mpc.simulator.Simulator(self.model)
@@ -129,37 +195,144 @@ class Environment:
             control[1] = -config.accel_limit
         return control
 
+    """Checks the current states against the early-termination conditions. Returns the reason to stop, or None.
+    Uses the same criteria as metrics.check_when_reached_goal and metrics.check_for_traj_collisions."""
+    def get_termination_reason(self):
+        states = self.initial_states
+        at_goal = (np.linalg.norm(states[:, :2] - self.goals[:, :2], axis=1) < 0.05) & (np.abs(states[:, 3]) < 0.05)
+        self.goal_reached |= at_goal
+        if config.stop_on_goal and np.all(self.goal_reached):
+            return 'goal'
+
+        if config.stop_on_collision:
+            dists = np.linalg.norm(states[:, None, :2] - states[None, :, :2], axis=-1)
+            np.fill_diagonal(dists, np.inf)
+            if np.min(dists) < config.agent_radius * 2 + config.safety_dist:
+                return 'collision'
+
+        if config.stop_on_deadlock:
+            stopped = np.all(np.abs(states[:, 3]) < config.deadlock_vel_threshold) and not np.all(self.goal_reached)
+            self.stopped_ticks = self.stopped_ticks + 1 if stopped else 0
+            if self.stopped_ticks >= config.deadlock_ticks:
+                return 'deadlock'
+        return None
+
     # @profile
     def run_simulation(self, sim_iteration, controllers, logger):
-        """Runs a closed-loop control simulation."""
+        """Runs one sim_ts tick of the closed-loop simulation.
+
+        The plant is stepped every config.plant_ts within the tick. Each controller is called at its own period
+        (config.controller_periods) and its last control is held in between.
+        """
         self.sim_iteration = sim_iteration
         sim_time = self.sim_iteration * config.sim_ts
+        plant_ts = self.get_plant_ts()
+        num_substeps = self.get_num_steps(config.sim_ts, plant_ts, 'sim_ts')
 
-        new_states = np.zeros((self.num_agents, config.num_states))
-        outputted_controls = np.zeros((self.num_agents, config.num_controls))
-        use_for_training = []
-        compute_times = []
-        for agent_idx in range(self.num_agents):
-            controller = controllers[agent_idx]
-            initial_state = self.initial_states[agent_idx, :]
-            opp_state = self.initial_states[1-agent_idx, :].copy()
-            # If single-integrator dynamics, add velocity to this state.
-            if config.dynamics == DynamicsModel.SINGLE_INTEGRATOR:
-                opp_vel = 0.0 if len(self.history) < 2 else np.linalg.norm(opp_state[:2] - self.history[-2][1-agent_idx, :2]) / config.sim_ts
-                opp_state = np.append(opp_state, [opp_vel])
-            self.reset_state(initial_state)
-            cycle_start_time = time.time()
-            controller.reset_state(initial_state, opp_state)
-            u1 = self.apply_control_lims(controller.make_step(sim_time, initial_state))
-            compute_times.append(time.time() - cycle_start_time)
-            x1 = self.simulator.make_step(u1)
-            new_states[agent_idx, :] = self.apply_state_lims(x1.ravel())
-            outputted_controls[agent_idx, :] = u1.ravel()
-            use_for_training.append(controller.use_for_training)
+        outputted_controls = None
+        use_for_training = [False] * self.num_agents
+        compute_times = np.zeros(self.num_agents)
+        phase_times = np.zeros((self.num_agents, 2))
+        solver_stats = [None] * self.num_agents
+        tick_time = 0.0
+        for substep in range(num_substeps):
+            plant_step = sim_iteration * num_substeps + substep
+            due_agents = [agent_idx for agent_idx in range(self.num_agents) if plant_step % self.get_controller_steps(controllers[agent_idx], plant_ts) == 0]
+            if len(due_agents) > 0:
+                controllers_start_time = time.time()
+                results = self.step_controllers(due_agents, controllers, sim_time + substep * plant_ts)
+                tick_time += time.time() - controllers_start_time
 
+                for agent_idx, (u1, agent_phase_times) in zip(due_agents, results):
+                    controller = controllers[agent_idx]
+                    self.held_controls[agent_idx, :] = np.array(self.apply_control_lims(u1), dtype=float).ravel()
+                    compute_times[agent_idx] += sum(agent_phase_times)
+                    # Preparation (reset_state) and feedback (make_step) times, e.g. for real-time iteration controllers.
+                    phase_times[agent_idx] += agent_phase_times
+                    # The logged control is the one of substep 0, so only that solve's stats and label belong to it.
+                    # A held control was not computed from the logged state, so it is not a training label for it.
+                    if substep == 0:
+                        solver_stats[agent_idx] = getattr(controller, 'solver_stats', None)
+                        use_for_training[agent_idx] = controller.use_for_training
+
+            if substep == 0:
+                outputted_controls = self.held_controls.copy()
+            self.prev_states = self.initial_states
+            self.initial_states = self.step_dynamics(self.initial_states, self.held_controls, plant_ts)
+        self.tick_time_history.append(tick_time)
+        new_states = self.initial_states.copy()
+
+        tick = self.buffer.num_ticks
+        self.buffer.record_tick(outputted_controls, compute_times, new_states)
         # if sim_time >= abs(config.agent_zero_offset):
-        logger.log_iteration(self.initial_states, self.goals, outputted_controls, use_for_training, compute_times)
-        self.compute_history.append(compute_times)
-        self.initial_states = new_states.copy()
-        self.history.append(new_states.copy())
+        logger.log_iteration(self.buffer.states[tick], self.goals, self.buffer.controls[tick], use_for_training, compute_times.tolist(), solver_stats)
+        self.solver_stats_history.append(solver_stats)
+        self.phase_compute_history.append([tuple(times) for times in phase_times])
         return new_states, outputted_controls
+
+    """Calls the given agents' controllers on the current states. Returns each one's control and phase times."""
+    def step_controllers(self, agent_idxs, controllers, sim_time):
+        # Each agent sees its config.num_neighbors nearest agents. The nearest one is its opponent.
+        self.neighbor_index = SpatialHash(self.initial_states, config.neighbor_cell_size)
+        opp_states = {}
+        for agent_idx in agent_idxs:
+            neighbor_states = self.get_neighbor_states(agent_idx)
+            opp_states[agent_idx] = neighbor_states[0] if len(neighbor_states) > 0 else self.get_absent_opponent_state(agent_idx)
+            if hasattr(controllers[agent_idx], 'set_neighbor_states'):
+                controllers[agent_idx].set_neighbor_states(neighbor_states[1:])
+
+        if all(hasattr(controllers[agent_idx], 'submit') for agent_idx in agent_idxs):
+            # Worker-process controllers: start every agent's solve before waiting on any of them.
+            for agent_idx in agent_idxs:
+                controllers[agent_idx].submit(sim_time, self.initial_states[agent_idx, :], opp_states[agent_idx])
+            return [controllers[agent_idx].collect() for agent_idx in agent_idxs]
+        return [self.step_controller(controllers[agent_idx], sim_time, self.initial_states[agent_idx, :], opp_states[agent_idx]) for agent_idx in agent_idxs]
+
+    @staticmethod
+    def get_plant_ts():
+        return config.sim_ts if config.plant_ts is None else config.plant_ts
+
+    """Number of plant steps in a period. Raises a ValueError if the period is not a whole number of plant steps."""
+    @staticmethod
+    def get_num_steps(period, plant_ts, name):
+        num_steps = int(round(period / plant_ts))
+        if num_steps < 1 or not np.isclose(num_steps * plant_ts, period):
+            raise ValueError(f"{name} ({period}) is not a multiple of plant_ts ({plant_ts})")
+        return num_steps
+
+    """Number of plant steps between calls of the controller."""
+    @staticmethod
+    def get_controller_steps(controller, plant_ts):
+        controller_type = getattr(controller, 'controller_type', type(controller).__name__)
+        period = config.controller_periods.get(controller_type, config.sim_ts)
+        return Environment.get_num_steps(period, plant_ts, f'controller_periods[{controller_type!r}]')
+
+    def get_neighbor_states(self, agent_idx):
+        neighbor_idxs = self.neighbor_index.query(agent_idx, config.num_neighbors)
+        return [self.get_observed_state(neighbor_idx) for neighbor_idx in neighbor_idxs]
+
+    """Opponent state for an agent without neighbors: stopped, config.absent_opponent_dist away along x."""
+    def get_absent_opponent_state(self, agent_idx):
+        opp_state = self.get_observed_state(agent_idx)
+        opp_state[0] += config.absent_opponent_dist
+        opp_state[3] = 0.0
+        return opp_state
+
+    """State of an agent as other agents observe it."""
+    def get_observed_state(self, agent_idx):
+        opp_state = self.initial_states[agent_idx, :].copy()
+        # If single-integrator dynamics, add velocity to this state, differenced over the last plant step.
+        if config.dynamics == DynamicsModel.SINGLE_INTEGRATOR:
+            opp_vel = 0.0 if self.prev_states is None else np.linalg.norm(opp_state[:2] - self.prev_states[agent_idx, :2]) / self.get_plant_ts()
+            opp_state = np.append(opp_state, [opp_vel])
+        return opp_state
+
+    """Runs one controller in this process. Returns the control and the (reset_state, make_step) times."""
+    @staticmethod
+    def step_controller(controller, sim_time, initial_state, opp_state):
+        cycle_start_time = time.time()
+        controller.reset_state(initial_state, opp_state)
+        feedback_start_time = time.time()
+        u1 = controller.make_step(sim_time, initial_state)
+        cycle_end_time = time.time()
+        return u1, (feedback_start_time - cycle_start_time, cycle_end_time - feedback_start_time)
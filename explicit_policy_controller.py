@@ -0,0 +1,117 @@
+import itertools
+import numpy as np
+
+# Relative state an explicit policy table is indexed by, in this order.
+POLICY_FEATURES = ['goal_dx', 'goal_dy', 'theta', 'v', 'opp_dx', 'opp_dy', 'opp_theta', 'opp_v']
+
+def wrap_angle(angle):
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+
+"""Relative state of the ego agent: its offset to the goal, heading and speed, and the opponent's relative pose and speed."""
+def get_policy_features(ego_state, opp_state, goal):
+    ego_state = np.asarray(ego_state, dtype=float).ravel()
+    opp_state = np.asarray(opp_state, dtype=float).ravel()
+    goal = np.asarray(goal, dtype=float).ravel()
+    return np.array([
+        goal[0] - ego_state[0],
+        goal[1] - ego_state[1],
+        wrap_angle(ego_state[2]),
+        ego_state[3],
+        opp_state[0] - ego_state[0],
+        opp_state[1] - ego_state[1],
+        wrap_angle(opp_state[2]),
+        opp_state[3],
+    ])
+
+
+"""Inverse of get_policy_features for a fixed goal. Returns the ego and opponent states."""
+def get_policy_states(features, goal):
+    goal_dx, goal_dy, theta, v, opp_dx, opp_dy, opp_theta, opp_v = features
+    ego_state = np.array([goal[0] - goal_dx, goal[1] - goal_dy, theta, v])
+    opp_state = np.array([ego_state[0] + opp_dx, ego_state[1] + opp_dy, opp_theta, opp_v])
+    return ego_state, opp_state
+
+
+class PolicyTable:
+    """Controls solved on a regular grid over POLICY_FEATURES, interpolated multilinearly between grid points."""
+    def __init__(self, axes, controls, success=None, metadata=None):
+        self.axes = [np.asarray(axis, dtype=float) for axis in axes]
+        self.controls = np.asarray(controls)
+        # Whether each grid point's solve converged. None counts every grid point as converged.
+        self.success = None if success is None else np.asarray(success, dtype=bool)
+        self.metadata = metadata if metadata is not None else {}
+        # Offsets of the corners of a grid cell. Axes with a single grid point only have the lower corner.
+        sizes = np.array([len(axis) for axis in self.axes])
+        corners = np.array(list(itertools.product([0, 1], repeat=len(self.axes))))
+        self.corners = corners[np.all((corners == 0) | (sizes > 1), axis=1)]
+
+    @staticmethod
+    def load(filename):
+        data = np.load(filename, allow_pickle=False)
+        num_axes = len(POLICY_FEATURES)
+        axes = [data[f'axis_{i}'] for i in range(num_axes)]
+        metadata = {key: data[key] for key in data.files if key not in ['controls', 'success'] and not key.startswith('axis_')}
+        success = data['success'] if 'success' in data.files else None
+        return PolicyTable(axes, data['controls'], success, metadata)
+
+    def save(self, filename, **metadata):
+        arrays = {f'axis_{i}': axis for i, axis in enumerate(self.axes)}
+        # A table without a success mask is saved without the key, since None cannot be loaded without pickle.
+        if self.success is not None:
+            arrays['success'] = self.success
+        np.savez_compressed(filename, controls=self.controls, feature_names=np.array(POLICY_FEATURES), **arrays, **metadata)
+
+    def interpolate(self, features):
+        lower_idxs = np.zeros(len(self.axes), dtype=int)
+        fractions = np.zeros(len(self.axes))
+        for i, (axis, value) in enumerate(zip(self.axes, features)):
+            if len(axis) == 1:
+                continue
+            # Values outside the grid are clamped to its boundary.
+            value = np.clip(value, axis[0], axis[-1])
+            idx = np.clip(np.searchsorted(axis, value, side='right') - 1, 0, len(axis) - 2)
+            lower_idxs[i] = idx
+            fractions[i] = (value - axis[idx]) / (axis[idx + 1] - axis[idx])
+
+        weights = np.prod(np.where(self.corners == 1, fractions, 1.0 - fractions), axis=1)
+        corner_idxs = tuple((lower_idxs + self.corners).T)
+        values = self.controls[corner_idxs]
+        if self.success is None:
+            return weights @ values
+
+        # Corners whose solve did not converge are left out, and the other corners' weights renormalized.
+        weights = weights * self.success[corner_idxs]
+        if np.sum(weights) > 0:
+            return weights @ values / np.sum(weights)
+        return self.get_nearest_converged_control(lower_idxs + fractions)
+
+    """Control of the converged grid point nearest to a position in grid index units, for cells without a converged
+    corner."""
+    def get_nearest_converged_control(self, grid_position):
+        converged_idxs = np.argwhere(self.success)
+        if len(converged_idxs) == 0:
+            raise ValueError("None of the policy table's solves converged")
+        nearest_idx = converged_idxs[np.argmin(np.linalg.norm(converged_idxs - grid_position, axis=1))]
+        return self.controls[tuple(nearest_idx)].astype(float)
+
+
+class ExplicitPolicyController:
+    """Looks up precomputed MPC controls (gen_policy_table.py) instead of solving online."""
+    def __init__(self, table_filepath, goal, static_obs=None):
+        self.table = PolicyTable.load(table_filepath)
+        self.goal = goal
+        self.static_obs = static_obs
+        self.use_for_training = False
+
+    def initialize_controller(self, env):
+        pass
+
+    def reset_state(self, initial_state, opp_state):
+        self.initial_state = initial_state
+        self.opp_state = opp_state
+
+    def make_step(self, timestamp, initial_state):
+        self.initial_state = initial_state
+        features = get_policy_features(self.initial_state, self.opp_state, self.goal)
+        return self.table.interpolate(features).reshape(-1, 1)
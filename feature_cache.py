@@ -0,0 +1,65 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+# Bump when the features computed from the same data and flags change, to invalidate existing cache entries.
+FEATURE_CACHE_VERSION = 1
+# Arrays of a cache entry, in the order DataGenerator.get_training_data returns them.
+FEATURE_ARRAYS = ['norm_inputs', 'input_mean', 'input_std', 'norm_outputs', 'output_mean', 'output_std']
+HASH_CHUNK_SIZE = 1 << 20
+
+def hash_file(filename, hasher):
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+
+
+"""SHA-256 of a log's contents: the file, or every file of a run directory. Paths and timestamps are not part of it."""
+def get_source_hash(path):
+    hasher = hashlib.sha256()
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            hasher.update(name.encode())
+            hash_file(os.path.join(path, name), hasher)
+    else:
+        hash_file(path, hasher)
+    return hasher.hexdigest()
+
+
+"""Cache key of the features of the given logs (in order, since it sets the sample order) with the given
+feature settings and agents."""
+def get_feature_cache_key(source_paths, feature_fields, agent_idxs):
+    key_data = {
+        'version': FEATURE_CACHE_VERSION,
+        'sources': [get_source_hash(path) for path in source_paths],
+        'features': feature_fields,
+        'agents': [int(agent_idx) for agent_idx in agent_idxs],
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+
+"""Returns the cached arrays as read-only memory maps, or None if the key is not cached."""
+def load_features(cache_dir, key):
+    entry_dir = os.path.join(cache_dir, key)
+    if not os.path.exists(os.path.join(entry_dir, 'meta.json')):
+        return None
+    return tuple(np.load(os.path.join(entry_dir, f'{name}.npy'), mmap_mode='r') for name in FEATURE_ARRAYS)
+
+
+"""Writes a cache entry. The entry is written to a temporary directory first and renamed, so concurrent or
+interrupted runs never see a partial one."""
+def save_features(cache_dir, key, arrays, metadata):
+    entry_dir = os.path.join(cache_dir, key)
+    tmp_dir = f'{entry_dir}.tmp{os.getpid()}'
+    os.makedirs(tmp_dir, exist_ok=True)
+    for name, array in zip(FEATURE_ARRAYS, arrays):
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), np.asarray(array))
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(metadata, f)
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        # Another run cached the same key first.
+        shutil.rmtree(tmp_dir, ignore_errors=True)
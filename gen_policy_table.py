@@ -0,0 +1,107 @@
+import os
+import time
+import multiprocessing
+import config
+import numpy as np
+import run_experiments
+from run_experiments import get_mpc_live_controllers, get_scenario
+from environment import Environment
+from explicit_policy_controller import PolicyTable, POLICY_FEATURES, get_policy_states
+
+SCENARIO = 'Doorway'
+# SCENARIO = 'Intersection'
+
+NUM_WORKERS = os.cpu_count()
+CHUNK_SIZE = 64
+
+# Grid over POLICY_FEATURES for each (scenario, agent_idx), covering the relative states that agent goes through. An
+# axis with one value fixes that feature.
+DOORWAY_GRID = [
+    np.linspace(0.0, 3.5, 15),            # goal_dx
+    np.linspace(-1.0, 1.0, 9),            # goal_dy
+    np.linspace(-np.pi / 2, np.pi / 2, 7),# theta
+    np.linspace(0.0, config.v_limit, 4),  # v
+    np.linspace(-1.5, 1.5, 7),            # opp_dx
+    np.linspace(-1.5, 1.5, 7),            # opp_dy
+    np.array([0.0]),                      # opp_theta
+    np.linspace(0.0, config.v_limit, 3),  # opp_v
+]
+GRIDS = {
+    # Both agents drive along +x through the doorway.
+    ('Doorway', 0): DOORWAY_GRID,
+    ('Doorway', 1): DOORWAY_GRID,
+    # Agent 0 drives along +y, and its opponent along +x.
+    ('Intersection', 0): [
+        np.linspace(-0.5, 0.5, 5),            # goal_dx
+        np.linspace(0.0, 2.0, 11),            # goal_dy
+        np.linspace(0.0, np.pi, 7),           # theta
+        np.linspace(0.0, config.v_limit, 4),  # v
+        np.linspace(-1.5, 1.5, 7),            # opp_dx
+        np.linspace(-1.5, 1.5, 7),            # opp_dy
+        np.array([0.0]),                      # opp_theta
+        np.linspace(0.0, config.v_limit, 3),  # opp_v
+    ],
+    # Agent 1 drives along +x, and its opponent along +y.
+    ('Intersection', 1): [
+        np.linspace(0.0, 2.0, 11),            # goal_dx
+        np.linspace(-0.5, 0.5, 5),            # goal_dy
+        np.linspace(-np.pi / 2, np.pi / 2, 7),# theta
+        np.linspace(0.0, config.v_limit, 4),  # v
+        np.linspace(-1.5, 1.5, 7),            # opp_dx
+        np.linspace(-1.5, 1.5, 7),            # opp_dy
+        np.array([np.pi / 2]),                # opp_theta
+        np.linspace(0.0, config.v_limit, 3),  # opp_v
+    ],
+}
+
+worker_controller = None
+worker_goal = None
+
+def init_worker(agent_idx):
+    global worker_controller, worker_goal
+    # get_mpc_live_controllers sets the gammas for run_experiments.SCENARIO.
+    run_experiments.SCENARIO = SCENARIO
+    # Every grid point is a new problem, so build the NLP once and only update its parameters.
+    config.mpc_persistent_controller = True
+    config.mpc_warm_start = False
+    config.mpc_solution_cache = False
+    scenario = get_scenario(SCENARIO)
+    worker_controller = get_mpc_live_controllers(scenario, True)[agent_idx]
+    worker_controller.initialize_controller(Environment(scenario.initial.copy(), scenario.goals.copy()))
+    worker_goal = scenario.goals[agent_idx].copy()
+
+
+def solve_point(features):
+    ego_state, opp_state = get_policy_states(features, worker_goal)
+    worker_controller.reset_state(ego_state, opp_state)
+    u1 = np.array(worker_controller.make_step(0.0, ego_state)).ravel()
+    return u1, worker_controller.solver_stats['success']
+
+
+def gen_policy_table(agent_idx, axes):
+    grid_shape = tuple(len(axis) for axis in axes)
+    points = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, len(axes))
+    print(f"Solving {len(points)} grid points for agent {agent_idx} with {NUM_WORKERS} workers")
+
+    controls = np.zeros((len(points), config.num_controls), dtype=np.float32)
+    success = np.zeros(len(points), dtype=bool)
+    start = time.time()
+    with multiprocessing.get_context('fork').Pool(NUM_WORKERS, initializer=init_worker, initargs=(agent_idx,)) as pool:
+        for i, (u1, solved) in enumerate(pool.imap(solve_point, points, chunksize=CHUNK_SIZE)):
+            controls[i] = u1
+            success[i] = solved
+            if (i + 1) % 10000 == 0:
+                print(f"{i+1}/{len(points)} points, {time.time() - start:.1f}s")
+
+    print(f"Done in {time.time() - start:.1f}s, {np.mean(~success) * 100:.2f}% of solves did not converge")
+    return PolicyTable(axes, controls.reshape(grid_shape + (config.num_controls,)), success.reshape(grid_shape))
+
+
+if __name__ == '__main__':
+    assert config.dynamics == config.DynamicsModel.DOUBLE_INTEGRATOR, "Policy tables are defined over double-integrator states."
+    os.makedirs('policy_tables', exist_ok=True)
+    for agent_idx in range(2):
+        table = gen_policy_table(agent_idx, GRIDS[(SCENARIO, agent_idx)])
+        save_filename = f"policy_tables/{SCENARIO}_MPC_{agent_idx}.npz"
+        print(f"Saving policy table with features {POLICY_FEATURES} to {save_filename}")
+        table.save(save_filename, scenario=SCENARIO, agent_idx=agent_idx)
@@ -1,5 +1,6 @@
 import config
 import numpy as np
+from scipy.spatial import cKDTree
 from data_logger import DataLogger
 
 def dist_between_line_and_point(target_point, line_point, line_heading):
@@ -85,6 +86,24 @@ def check_for_obs_collisions(traj, obstacles, early_exit = False):
     return min_dist, collides
 
 
+# Extra columns appended by gather_all_metric_data when it is given the solver stats history.
+SOLVER_STATS_HEADER = 'avg_iters_0, avg_iters_1, max_iters_0, max_iters_1, fail_rate_0, fail_rate_1, avg_nlp_eval_time_0, avg_nlp_eval_time_1, avg_lin_alg_time_0, avg_lin_alg_time_1, fallback_rate_0, fallback_rate_1'
+
+
+def summarize_solver_stats(solver_stats_history, agent_idx):
+    stats = [tick_stats[agent_idx] for tick_stats in solver_stats_history if tick_stats[agent_idx] is not None]
+    if len(stats) == 0:
+        return [np.nan] * 6
+
+    iters = np.array([s['iter_count'] for s in stats], dtype=float)
+    failures = np.array([not s['success'] for s in stats], dtype=float)
+    nlp_eval_times = np.array([s['t_nlp_eval'] for s in stats], dtype=float)
+    lin_alg_times = np.array([s['t_linear_algebra'] for s in stats], dtype=float)
+    # 'unavailable' means there was no plan to fall back to, so the solver's own control was applied.
+    fallbacks = np.array([s.get('fallback') in ('iterate', 'previous_plan') for s in stats], dtype=float)
+    return [np.nanmean(iters), np.nanmax(iters), np.mean(failures), np.nanmean(nlp_eval_times), np.nanmean(lin_alg_times), np.mean(fallbacks)]
+
+
 def load_desired_path(filename, agent_idx):
     logger = DataLogger.load_file(filename)
     path = []
@@ -93,7 +112,7 @@ def load_desired_path(filename, agent_idx):
     return np.array(path)
 
 
-def gather_all_metric_data(scenario, traj0, traj1, goals, compute_history, desired_path_0=None, desired_path_1=None):
+def gather_all_metric_data(scenario, traj0, traj1, goals, compute_history, desired_path_0=None, desired_path_1=None, solver_stats_history=None):
     if desired_path_0 is None:
         desired_path_0 = get_straight_line_desired_path(scenario.initial[0], scenario.goals[0])
     if desired_path_1 is None:
@@ -124,4 +143,107 @@ def gather_all_metric_data(scenario, traj0, traj1, goals, compute_history, desir
     compute_history = np.array(compute_history)
     avg_compute_0, avg_compute_1 = np.mean(compute_history, axis=0)
 
-    return [goal_reach_idx0, goal_reach_idx1, min_agent_dist, traj_collision, obs_min_dist_0, obs_collision_0, obs_min_dist_1, obs_collision_1, delta_vel_0, delta_vel_1, path_dev_0, path_dev_1, avg_compute_0, avg_compute_1]
+    metric_data = [goal_reach_idx0, goal_reach_idx1, min_agent_dist, traj_collision, obs_min_dist_0, obs_collision_0, obs_min_dist_1, obs_collision_1, delta_vel_0, delta_vel_1, path_dev_0, path_dev_1, avg_compute_0, avg_compute_1]
+    if solver_stats_history is not None:
+        # Interleave the agents' values to match SOLVER_STATS_HEADER.
+        solver_metrics_0 = summarize_solver_stats(solver_stats_history, 0)
+        solver_metrics_1 = summarize_solver_stats(solver_stats_history, 1)
+        for value_0, value_1 in zip(solver_metrics_0, solver_metrics_1):
+            metric_data += [value_0, value_1]
+    return metric_data
+
+
+class MetricsAccumulator:
+    """Incremental version of gather_all_metric_data for a two-agent run.
+
+    update() is called with the agents' states once per tick, in the same order as the trajectories passed to
+    gather_all_metric_data, and add_compute() with each tick's compute times. get_metric_data() then returns the
+    same row without a second pass over the trajectories.
+    """
+    # Running totals, see checkpoint.py.
+    CHECKPOINT_ATTRS = ('iteration', 'min_agent_dist', 'goal_reach_idxs', 'num_considered', 'obs_min_dists', 'obs_collisions', 'prev_vels', 'total_delta_vels', 'total_path_devs', 'total_compute_times', 'num_compute_ticks', 'solver_stats_history')
+
+    def __init__(self, scenario, goals, desired_path_0=None, desired_path_1=None):
+        if desired_path_0 is None:
+            desired_path_0 = get_straight_line_desired_path(scenario.initial[0], scenario.goals[0])
+        if desired_path_1 is None:
+            desired_path_1 = get_straight_line_desired_path(scenario.initial[1], scenario.goals[1])
+        self.desired_paths = [np.asarray(desired_path_0), np.asarray(desired_path_1)]
+        self.desired_path_trees = [cKDTree(path) for path in self.desired_paths]
+        self.goals = np.asarray(goals)
+        self.obstacles = np.array(scenario.obstacles, dtype=float).reshape(-1, 3)
+
+        self.iteration = 0
+        self.min_agent_dist = float("inf")
+        # Per agent, over the states before it reaches its goal.
+        self.goal_reach_idxs = [None, None]
+        self.num_considered = [0, 0]
+        self.obs_min_dists = [float("inf"), float("inf")]
+        self.obs_collisions = [False, False]
+        self.prev_vels = [None, None]
+        self.total_delta_vels = [0.0, 0.0]
+        self.total_path_devs = [0.0, 0.0]
+
+        self.total_compute_times = np.zeros(2)
+        self.num_compute_ticks = 0
+        self.solver_stats_history = []
+
+    def update(self, states):
+        states = np.asarray(states)
+        self.min_agent_dist = min(self.min_agent_dist, np.linalg.norm(states[0, :2] - states[1, :2]))
+        for agent_idx in range(2):
+            state = states[agent_idx]
+            if self.prev_vels[agent_idx] is None:
+                self.prev_vels[agent_idx] = state[3]
+            if self.goal_reach_idxs[agent_idx] is not None:
+                continue
+            # Same criterion as check_when_reached_goal. The goal state itself is not considered.
+            if np.linalg.norm(state[:2] - self.goals[agent_idx, :2]) < 0.05 and np.abs(state[3]) < 0.05:
+                self.goal_reach_idxs[agent_idx] = self.iteration
+                continue
+
+            self.num_considered[agent_idx] += 1
+            self.total_delta_vels[agent_idx] += abs(state[3] - self.prev_vels[agent_idx])
+            self.prev_vels[agent_idx] = state[3]
+            self.total_path_devs[agent_idx] += self.get_path_deviation(state, agent_idx)
+            if len(self.obstacles) > 0:
+                obs_dists = np.linalg.norm(self.obstacles[:, :2] - state[:2], axis=1)
+                self.obs_min_dists[agent_idx] = min(self.obs_min_dists[agent_idx], np.min(obs_dists))
+                if np.any(obs_dists < config.agent_radius + self.obstacles[:, 2] + config.safety_dist):
+                    self.obs_collisions[agent_idx] = True
+        self.iteration += 1
+
+    """Distance to the line through the two nearest desired path points, as in calculate_path_deviation."""
+    def get_path_deviation(self, state, agent_idx):
+        if len(self.desired_paths[agent_idx]) < 2:
+            # calculate_path_deviation uses the only point twice, which gives a heading of 0.
+            _, closest_idx = self.desired_path_trees[agent_idx].query(state[:2], k=1)
+            second_closest_idx = closest_idx
+        else:
+            _, (closest_idx, second_closest_idx) = self.desired_path_trees[agent_idx].query(state[:2], k=2)
+        path1 = self.desired_paths[agent_idx][closest_idx]
+        path2 = self.desired_paths[agent_idx][second_closest_idx]
+        line_heading = np.arctan2(path2[1] - path1[1], path2[0] - path1[0])
+        return dist_between_line_and_point(state[:2], path1, line_heading)
+
+    def add_compute(self, compute_times, solver_stats=None):
+        self.total_compute_times += np.asarray(compute_times, dtype=float)[:2]
+        self.num_compute_ticks += 1
+        if solver_stats is not None:
+            self.solver_stats_history.append(solver_stats)
+
+    def get_metric_data(self, include_solver_stats=False):
+        goal_reach_idxs = [-1 if idx is None else idx for idx in self.goal_reach_idxs]
+        traj_collision = self.min_agent_dist < config.agent_radius * 2 + config.safety_dist
+        delta_vels = [total / count for total, count in zip(self.total_delta_vels, self.num_considered)]
+        path_devs = [total / count for total, count in zip(self.total_path_devs, self.num_considered)]
+        avg_compute_0, avg_compute_1 = self.total_compute_times / self.num_compute_ticks
+
+        metric_data = [goal_reach_idxs[0], goal_reach_idxs[1], self.min_agent_dist, traj_collision, self.obs_min_dists[0], self.obs_collisions[0], self.obs_min_dists[1], self.obs_collisions[1], delta_vels[0], delta_vels[1], path_devs[0], path_devs[1], avg_compute_0, avg_compute_1]
+        if include_solver_stats:
+            # Interleave the agents' values to match SOLVER_STATS_HEADER.
+            solver_metrics_0 = summarize_solver_stats(self.solver_stats_history, 0)
+            solver_metrics_1 = summarize_solver_stats(self.solver_stats_history, 1)
+            for value_0, value_1 in zip(solver_metrics_0, solver_metrics_1):
+                metric_data += [value_0, value_1]
+        return metric_data
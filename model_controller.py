@@ -26,10 +26,14 @@ class ModelController:
     def make_step(self, timestamp, initial_state):
         self.use_for_training = False
         self.initial_state = initial_state
-        model_input_original = np.append(self.initial_state, self.opp_state)
+        return self.get_control(self.initial_state, self.opp_state, self.goal, self.static_obs)
+
+    """Runs the network and its CBF QP (cvxopt, with the reference control fallback) on one state."""
+    def get_control(self, initial_state, opp_state, goal, static_obs):
+        model_input_original = np.append(initial_state, opp_state)
         model_input_original = perturb_model_input(
             model_input_original,
-            self.static_obs,
+            static_obs,
             self.model_definition.n_opponents,
             self.model_definition.x_is_d_goal,
             self.model_definition.add_liveness_as_input,
@@ -38,7 +42,7 @@ class ModelController:
             self.model_definition.ego_frame_inputs,
             self.model_definition.add_new_liveness_as_input,
             self.model_definition.add_dist_to_static_obs,
-            self.goal
+            goal
         )
 
         model_input = np.nan_to_num((model_input_original - self.model_definition.input_mean) / self.model_definition.input_std)
@@ -54,3 +58,19 @@ class ModelController:
         output = output.reshape(-1, 1)
 
         return output
+
+
+class BatchedModelController(ModelController):
+    """ModelController for BatchedEnvironment: the same agent of every scenario, one scenario after another."""
+    def __init__(self, model_definition_filepath, goals, static_obs):
+        super().__init__(model_definition_filepath, goals[0], static_obs[0])
+        self.goals = goals
+        self.static_obs = static_obs
+
+    def make_step(self, timestamp, initial_states):
+        self.use_for_training = False
+        self.initial_state = initial_states
+        # Each scenario goes through ModelController's path (sgn=0: cvxopt and its fallback), so a batched run
+        # applies the same controls as running the scenarios one at a time.
+        controls = [self.get_control(initial_state, opp_state, goal, static_obs).ravel() for initial_state, opp_state, static_obs, goal in zip(initial_states, self.opp_state, self.static_obs, self.goals)]
+        return np.array(controls)
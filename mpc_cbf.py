@@ -1,12 +1,27 @@
+import os
+import json
 import math
+import shutil
+import hashlib
+import subprocess
 import do_mpc
 from casadi import *
 import config
 from config import DynamicsModel
 import numpy as np
 from util import calculate_all_metrics, get_ray_intersection_point
+from spatial import ObstacleIndex
+from solution_cache import get_solution_cache, quantize
 from memory_profiler import profile
 
+# Time-varying parameters holding the liveness constraint's activation, role and coefficients.
+LIVENESS_TVPS = ['live_active', 'live_faster', 'live_d0', 'live_d1', 'live_opp_v', 'live_zeta']
+# Value of a switched-off constraint row (g <= 0), so that its slack stays strictly inside the bound. A row that is
+# multiplied out to 0 <= 0 pins its slack at the bound and changes IPOPT's path compared to leaving the row out.
+INACTIVE_CONSTRAINT_VALUE = -1.0
+# CasADi timers of the NLP function and derivative evaluations done for the solver.
+NLP_EVAL_TIMERS = ['t_wall_nlp_f', 't_wall_nlp_g', 't_wall_nlp_grad', 't_wall_nlp_grad_f', 't_wall_nlp_jac_g', 't_wall_nlp_hess_l']
+
 class MPC:
     """MPC-CBF Optimization problem:
 
@@ -20,30 +35,65 @@ class MPC:
 
     where x'_k = x_{des_k} - x_k
     """
+    # State carried from one tick to the next (opponent estimate, warm starts, fallback plan), see checkpoint.py.
+    CHECKPOINT_ATTRS = ('initial_state', 'opp_state', 'neighbor_states', 'liveness_params', 'obs_slot_values', 'prev_solution', 'fallback_plan', 'solver_stats', 'use_for_training')
+
     def __init__(self, agent_idx, opp_gamma, obs_gamma, live_gamma, liveness_thresh, goal, static_obs = [], delay_start = 0.0):
         self.agent_idx = agent_idx
         self.goal = goal
         self.static_obs = static_obs
+        self.obstacle_index = ObstacleIndex(static_obs)
+        self.obs_slot_values = [(0.0, 0.0, 0.0, 0.0)] * config.mpc_obs_slots
         self.delay_start = delay_start
         self.opp_state = None
+        self.neighbor_states = []
         self.opp_gamma = opp_gamma
         self.obs_gamma = obs_gamma
         self.live_gamma = live_gamma
         self.liveness_thresh = liveness_thresh
         self.Q = config.COST_MATRICES[config.dynamics]['Q']
         self.R = config.COST_MATRICES[config.dynamics]['R']
+        self.prev_solution = None
+        self.solver_stats = None
+        self.fallback_plan = None
+        self.cached_solution = None
 
     def initialize_controller(self, env):
-        self.model = env.define_model(call_setup = False)
-        self.model.set_variable('_tvp', 'x_moving_obs')
-        self.model.set_variable('_tvp', 'y_moving_obs')
-        self.model.setup()
         self.env = env
+        self.model = self.define_model(env)
+        self.liveness_params = {name: 0.0 for name in LIVENESS_TVPS}
+        if config.mpc_solution_cache:
+            self.solution_cache = get_solution_cache()
+            self.problem_key = self.get_problem_key()
+
+        # In persistent mode the NLP is built once here, and reset_state only updates its parameters.
+        if config.mpc_persistent_controller:
+            self.mpc = self.define_mpc()
+
+    """Extends the environment's model with the time-varying parameters used by the controller."""
+    def define_model(self, env):
+        model = env.define_model(call_setup = False)
+        model.set_variable('_tvp', 'x_moving_obs')
+        model.set_variable('_tvp', 'y_moving_obs')
+        model.set_variable('_tvp', 'vx_moving_obs')
+        model.set_variable('_tvp', 'vy_moving_obs')
+        model.set_variable('_tvp', 'goal', shape=(config.num_states, 1))
+        if config.mpc_cull_static_obs:
+            for slot in range(config.mpc_obs_slots):
+                for name in self.get_obs_slot_tvps(slot):
+                    model.set_variable('_tvp', name)
+        for slot in range(config.num_neighbors - 1):
+            for name in self.get_neighbor_slot_tvps(slot):
+                model.set_variable('_tvp', name)
+        for name in LIVENESS_TVPS:
+            model.set_variable('_tvp', name)
+        model.setup()
+        return model
 
     """Defines the objective function wrt the state cost depending on the type of control."""
     def get_cost_expression(self, model):
-        # Define state error
-        X = model.x['x'] - self.goal
+        # Define state error. The goal is a tvp so that a compiled solver can be shared between scenarios.
+        X = model.x['x'] - model.tvp['goal']
         cost_expression = transpose(X)@self.Q@X
         return cost_expression
 
@@ -63,7 +113,17 @@ class MPC:
                      }
         if self.agent_idx == 1:
             setup_mpc['nlpsol_opts'] = {'ipopt.print_level':0, 'print_time':0}
+        if config.mpc_warm_start:
+            # Let IPOPT start from the supplied primal/dual point instead of pushing it back into the interior.
+            setup_mpc['nlpsol_opts'].update({
+                'ipopt.warm_start_init_point': 'yes',
+                'ipopt.warm_start_bound_push': 1e-6,
+                'ipopt.warm_start_mult_bound_push': 1e-6,
+            })
+        if config.mpc_compute_budget is not None:
+            setup_mpc['nlpsol_opts']['ipopt.max_cpu_time'] = config.mpc_compute_budget
         mpc.set_param(**setup_mpc)
+        self.nlpsol_opts = setup_mpc['nlpsol_opts']
 
         # Configure objective function
         mterm = self.get_cost_expression(self.model)
@@ -73,17 +133,10 @@ class MPC:
         mpc.set_rterm(u=self.R)         # Input penalty (R diagonal matrix in objective fun)
 
         # State and input bounds
-        if config.dynamics == DynamicsModel.SINGLE_INTEGRATOR:
-            max_u = np.array([config.v_limit, config.omega_limit])
-            mpc.bounds['lower', '_u', 'u'] = -max_u
-            mpc.bounds['upper', '_u', 'u'] = max_u
-        else:
-            max_u = np.array([config.omega_limit, config.accel_limit])
-            mpc.bounds['lower', '_u', 'u'] = -max_u
-            mpc.bounds['upper', '_u', 'u'] = max_u
-
-            min_x = np.array([-float("inf"), -float("inf"), -float("inf"), 0.0])
-            max_x = np.array([float("inf"), float("inf"), float("inf"), config.v_limit])
+        min_x, max_x, max_u = self.get_bounds()
+        mpc.bounds['lower', '_u', 'u'] = -max_u
+        mpc.bounds['upper', '_u', 'u'] = max_u
+        if config.dynamics == DynamicsModel.DOUBLE_INTEGRATOR:
             mpc.bounds['lower', '_x', 'x'] = min_x
             mpc.bounds['upper', '_x', 'x'] = max_x
         
@@ -97,8 +150,85 @@ class MPC:
             self.add_liveliness_constraint(mpc)
 
         mpc.setup()
+        # A compiled solver is only worth it when the NLP is not rebuilt every tick.
+        if config.mpc_persistent_controller and config.mpc_compiled_solver_cache:
+            self.load_compiled_solver(mpc)
         return mpc
 
+    def get_solver_cache_key(self):
+        """Hash of everything that ends up in the generated NLP. Per-tick values are tvps and are not part of it."""
+        key_data = {
+            'dynamics': config.dynamics.name,
+            'T_horizon': config.T_horizon,
+            'MPC_Ts': config.MPC_Ts,
+            'sim_ts': config.sim_ts,
+            'static_obs': config.mpc_obs_slots if config.mpc_cull_static_obs else [[float(value) for value in obs] for obs in self.static_obs],
+            'obstacle_avoidance': config.obstacle_avoidance,
+            'mpc_use_opp_cbf': config.mpc_use_opp_cbf,
+            'liveliness': config.liveliness,
+            'mpc_use_new_liveness_filter': config.mpc_use_new_liveness_filter,
+            'mpc_static_obs_non_cbf_constraint': config.mpc_static_obs_non_cbf_constraint,
+            'gammas': [self.opp_gamma, self.obs_gamma, self.live_gamma],
+            'Q': np.asarray(self.Q).tolist(),
+            'R': np.asarray(self.R).tolist(),
+            'limits': [config.v_limit, config.omega_limit, config.accel_limit],
+            'radii': [config.agent_radius, config.safety_dist],
+            'zeta': config.zeta,
+            'num_neighbors': config.num_neighbors,
+            'inactive_constraint_value': INACTIVE_CONSTRAINT_VALUE,
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()[:16]
+
+    """Everything that fixes this controller's problem apart from the per-tick states, for the solution cache."""
+    def get_problem_key(self):
+        obstacles = [[float(value) for value in obs] for obs in self.static_obs]
+        obs_hash = hashlib.sha256(json.dumps(obstacles).encode()).hexdigest()[:16]
+        role = (self.agent_idx, config.mpc_p0_faster, self.liveness_thresh)
+        return (self.get_solver_cache_key(), obs_hash, role, quantize(self.goal, config.mpc_solution_cache_resolution))
+
+    """Problem key plus the quantized ego state and the opponent and neighbor states relative to it."""
+    def get_solution_cache_key(self):
+        ego_state = np.array(self.initial_state, dtype=float).ravel()
+        opp_state = np.array(self.opp_state, dtype=float).ravel().copy()
+        opp_state[:2] -= ego_state[:2]
+        resolution = config.mpc_solution_cache_resolution
+        neighbor_states = []
+        for neighbor_state in self.neighbor_states:
+            neighbor_state = np.array(neighbor_state, dtype=float).ravel().copy()
+            neighbor_state[:2] -= ego_state[:2]
+            neighbor_states.append(quantize(neighbor_state, resolution))
+        return self.problem_key + (quantize(ego_state, resolution), quantize(opp_state, resolution), tuple(neighbor_states))
+
+    def load_compiled_solver(self, mpc):
+        """Replaces the do_mpc solver with one loaded from a compiled shared library, compiling it first if it is not cached."""
+        key = self.get_solver_cache_key()
+        cache_dir = os.path.join(config.solver_cache_dir, key)
+        libname = os.path.abspath(os.path.join(cache_dir, 'nlp.so'))
+        if not os.path.exists(libname):
+            print(f"Compiling MPC solver {key} to {cache_dir}")
+            os.makedirs(cache_dir, exist_ok=True)
+            # CasADi writes the generated code to the working directory. The pid keeps parallel processes apart,
+            # and the rename makes sure no process loads a partially written library.
+            cname = f'nlp_{key}_{os.getpid()}.c'
+            tmp_libname = f'{libname}.{os.getpid()}.tmp'
+            mpc.S.generate_dependencies(cname)
+            subprocess.run([config.solver_cache_compiler, '-fPIC', '-shared', '-O1', cname, '-o', tmp_libname], check=True)
+            shutil.move(cname, os.path.join(cache_dir, 'nlp.c'))
+            os.replace(tmp_libname, libname)
+        mpc.S = nlpsol('solver_compiled', 'ipopt', libname, self.nlpsol_opts)
+
+    """State and input bounds. The single-integrator model has no state bounds."""
+    def get_bounds(self):
+        if config.dynamics == DynamicsModel.SINGLE_INTEGRATOR:
+            min_x = np.full(config.num_states, -float("inf"))
+            max_x = np.full(config.num_states, float("inf"))
+            max_u = np.array([config.v_limit, config.omega_limit])
+        else:
+            min_x = np.array([-float("inf"), -float("inf"), -float("inf"), 0.0])
+            max_x = np.array([float("inf"), float("inf"), float("inf"), config.v_limit])
+            max_u = np.array([config.omega_limit, config.accel_limit])
+        return min_x, max_x, max_u
+
     def add_cbf_constraints(self, mpc):
         cbf_constraints = self.get_cbf_constraints()
         for i, cbc in enumerate(cbf_constraints):
@@ -110,37 +240,76 @@ class MPC:
         A, B = self.env.get_dynamics(self.model.x['x'])
         x_k1 = self.model.x['x'] + A*config.MPC_Ts + B@self.model.u['u']*config.MPC_Ts
 
+        # With culling, the static obstacles are read from fixed tvp slots, and empty slots are switched off.
+        if config.mpc_cull_static_obs:
+            static_obs = []
+            for slot in range(config.mpc_obs_slots):
+                x_name, y_name, r_name, active_name = self.get_obs_slot_tvps(slot)
+                static_obs.append(((self.model.tvp[x_name], self.model.tvp[y_name], self.model.tvp[r_name]), self.model.tvp[active_name]))
+        else:
+            static_obs = [(obs, None) for obs in self.static_obs]
+
         # Compute CBF constraints
         cbf_constraints = []
-        for obs in self.static_obs:
+        for obs, active in static_obs:
             # delta_h_k + gamma*h_k >= 0
             # h_k1 - h_k + gamma*h_k >= 0
             # -h_k1 + h_k - gamma*h_k <= 0
             # -h_k1 + (1 - gamma)*h_k <= 0
             h_k = self.h_obs(self.model.x['x'], obs)
             if config.mpc_static_obs_non_cbf_constraint:
-                cbf_constraints.append(-h_k + 0.001)
+                cbf_constraints.append(self.switch_constraint(active, -h_k + 0.001))
             else:
                 h_k1 = self.h_obs(x_k1, obs)
-                cbf_constraints.append(-h_k1 + (1-self.obs_gamma)*h_k)
+                cbf_constraints.append(self.switch_constraint(active, -h_k1 + (1-self.obs_gamma)*h_k))
 
         if config.mpc_use_opp_cbf:
-            obs = (self.model.tvp['x_moving_obs'], self.model.tvp['y_moving_obs'], config.agent_radius)
-            opp_k1 = (self.model.tvp['x_moving_obs'] + self.opp_state[3] * math.cos(self.opp_state[2]) * config.MPC_Ts,
-                      self.model.tvp['y_moving_obs'] + self.opp_state[3] * math.sin(self.opp_state[2]) * config.MPC_Ts,
-                      config.agent_radius)
-            h_k = self.h_obs(self.model.x['x'], obs)
-            h_k1 = self.h_obs(x_k1, opp_k1)
-
-            # delta_h_k + gamma*h_k >= 0
-            # h_k1 - h_k + gamma*h_k >= 0
-            # -h_k1 + h_k - gamma*h_k <= 0
-            # -h_k1 + (1 - gamma)*h_k <= 0
-            cbf_constraints.append(-h_k1 + (1-self.opp_gamma)*h_k)
-            # print(cbf_constraints[-1])
+            # The opponent, then the other neighbors' slots (switched off when empty).
+            moving_obs = [(('x_moving_obs', 'y_moving_obs', 'vx_moving_obs', 'vy_moving_obs'), None)]
+            for slot in range(config.num_neighbors - 1):
+                x_name, y_name, vx_name, vy_name, active_name = self.get_neighbor_slot_tvps(slot)
+                moving_obs.append(((x_name, y_name, vx_name, vy_name), self.model.tvp[active_name]))
+
+            for (x_name, y_name, vx_name, vy_name), active in moving_obs:
+                obs = (self.model.tvp[x_name], self.model.tvp[y_name], config.agent_radius)
+                opp_k1 = (self.model.tvp[x_name] + self.model.tvp[vx_name] * config.MPC_Ts,
+                          self.model.tvp[y_name] + self.model.tvp[vy_name] * config.MPC_Ts,
+                          config.agent_radius)
+                h_k = self.h_obs(self.model.x['x'], obs)
+                h_k1 = self.h_obs(x_k1, opp_k1)
+
+                # delta_h_k + gamma*h_k >= 0
+                # h_k1 - h_k + gamma*h_k >= 0
+                # -h_k1 + h_k - gamma*h_k <= 0
+                # -h_k1 + (1 - gamma)*h_k <= 0
+                cbf_constraints.append(self.switch_constraint(active, -h_k1 + (1-self.opp_gamma)*h_k))
+                # print(cbf_constraints[-1])
 
         return cbf_constraints
+
+    @staticmethod
+    def get_neighbor_slot_tvps(slot):
+        return [f'nbr_{slot}_x', f'nbr_{slot}_y', f'nbr_{slot}_vx', f'nbr_{slot}_vy', f'nbr_{slot}_active']
+
+    """Neighbors other than the opponent, set by the environment every tick."""
+    def set_neighbor_states(self, neighbor_states):
+        self.neighbor_states = neighbor_states[:config.num_neighbors - 1]
     
+    @staticmethod
+    def get_obs_slot_tvps(slot):
+        return [f'obs_{slot}_x', f'obs_{slot}_y', f'obs_{slot}_r', f'obs_{slot}_active']
+
+    def get_obs_slot_values(self):
+        """Fills the obstacle slots with the nearest obstacles that the horizon can reach from the current state."""
+        # The prediction model steps with sim_ts while the CBFs use MPC_Ts, so bound the travel with the larger one.
+        reach = config.T_horizon * max(config.MPC_Ts, config.sim_ts) * config.v_limit
+        radius = reach + config.agent_radius + config.safety_dist + self.obstacle_index.max_radius + config.mpc_obs_cull_margin
+        nearby_obs = self.obstacle_index.query(self.initial_state[:2], config.mpc_obs_slots, radius)
+
+        slot_values = [(obs_x, obs_y, obs_r, 1.0) for obs_x, obs_y, obs_r in nearby_obs]
+        slot_values += [(0.0, 0.0, 0.0, 0.0)] * (config.mpc_obs_slots - len(slot_values))
+        return slot_values
+
     """Computes the Control Barrier Function for an obstacle."""
     def h_obs(self, x, obstacle):
         x_obs, y_obs, r_obs = obstacle
@@ -158,78 +327,120 @@ class MPC:
         tvp_struct_mpc = mpc.get_tvp_template()
 
         def tvp_fun_mpc(t_now):
-            # Moving obstacles trajectory
+            # do_mpc evaluates the function once when it is set, before any opponent state is known.
+            if self.opp_state is None:
+                return tvp_struct_mpc
+
             for k in range(config.T_horizon + 1):
-                tvp_struct_mpc['_tvp', k, 'x_moving_obs'] = self.opp_state[0] + self.opp_state[3] * math.cos(self.opp_state[2]) * config.MPC_Ts * k
-                tvp_struct_mpc['_tvp', k, 'y_moving_obs'] = self.opp_state[1] + self.opp_state[3] * math.sin(self.opp_state[2]) * config.MPC_Ts * k
+                for name, value in self.get_tvp_values(k).items():
+                    tvp_struct_mpc['_tvp', k, name] = value
 
             return tvp_struct_mpc
 
         mpc.set_tvp_fun(tvp_fun_mpc)
         return mpc
 
+    """Values of the time-varying parameters at step k of the horizon."""
+    def get_tvp_values(self, k):
+        # Moving obstacles trajectory
+        opp_vx = self.opp_state[3] * math.cos(self.opp_state[2])
+        opp_vy = self.opp_state[3] * math.sin(self.opp_state[2])
+        values = {
+            'x_moving_obs': self.opp_state[0] + opp_vx * config.MPC_Ts * k,
+            'y_moving_obs': self.opp_state[1] + opp_vy * config.MPC_Ts * k,
+            'vx_moving_obs': opp_vx,
+            'vy_moving_obs': opp_vy,
+            'goal': self.goal,
+        }
+        values.update(self.liveness_params)
+        for slot in range(config.num_neighbors - 1):
+            if slot < len(self.neighbor_states):
+                neighbor_state = self.neighbor_states[slot]
+                vx = neighbor_state[3] * math.cos(neighbor_state[2])
+                vy = neighbor_state[3] * math.sin(neighbor_state[2])
+                slot_values = (neighbor_state[0] + vx * config.MPC_Ts * k, neighbor_state[1] + vy * config.MPC_Ts * k, vx, vy, 1.0)
+            else:
+                slot_values = (0.0, 0.0, 0.0, 0.0, 0.0)
+            values.update(zip(self.get_neighbor_slot_tvps(slot), slot_values))
+        if config.mpc_cull_static_obs:
+            for slot, slot_values in enumerate(self.obs_slot_values):
+                values.update(zip(self.get_obs_slot_tvps(slot), slot_values))
+        return values
+
     # Assumes that the double-integrator dynamic model is being used
     def add_liveliness_constraint(self, mpc):
-        if self.opp_state is None:
-            return
+        mpc.set_nl_cons('liveliness_constraint', self.get_liveliness_constraint(), ub=0)
 
-        l, _, _, _, intersecting, is_live = calculate_all_metrics(self.initial_state.copy(), self.opp_state, self.liveness_thresh)
-        # if is_live:
-        if config.mpc_use_new_liveness_filter:
-            if not intersecting:
-                return
-        else:
-            if is_live:
-                return
+    def get_liveliness_constraint(self):
+        """Liveness constraint with its coefficients, role and activation taken from time-varying parameters.
 
+        The constraint is always part of the NLP, so its structure does not depend on the current states.
+        """
         # Get state vector x_{t+k+1}
         A, B = self.env.get_dynamics(self.model.x['x'])
         x_k1 = self.model.x['x'] + A*config.MPC_Ts + B@self.model.u['u']*config.MPC_Ts
 
-        # Compute CBF constraints
-        opp_state = np.array(self.opp_state)
-
-        self.h_v = self.h_v_new if config.mpc_use_new_liveness_filter else self.h_v_old
-
-        h_k = self.h_v(self.model.x['x'], self.opp_state, ts=0.0)
-        h_k1 = self.h_v(x_k1, opp_state, ts=config.MPC_Ts)
-
-        if h_k is None or h_k1 is None:
-            return
+        h_k = self.h_v(self.model.x['x'], ts=0.0)
+        h_k1 = self.h_v(x_k1, ts=config.MPC_Ts)
 
         # -h_k1 + (1 - gamma)*h_k <= 0
         # h_k1 >= h_k - gamma*h_k
         # (h_k1 - h_k) >= -gamma*h_k
-        constraint = -h_k1 + (1-self.live_gamma)*h_k
-        mpc.set_nl_cons('liveliness_constraint', constraint, ub=0)
-
-    # Original liveness filter
-    def h_v_old(self, x, opp_x, ts):
-        self.A_matrix = SX.zeros(2, 2)
-        max_zeta = 0.3 / opp_x[3]
-        upper_zeta = min(max_zeta, config.zeta)
-
-        # The A matrix looks like this:
-        # [[1, -zeta]
-        #  [-zeta, 1]]
-        # So that when multiplied by the velocity vector [ego_v, opp_v], the result is [ego_v - zeta*opp_v, opp_v - zeta*ego_v]
-        self.A_matrix[0, 0] = 1.0
-        self.A_matrix[0, 1] = -upper_zeta
-        self.A_matrix[1, 0] = -config.zeta
-        self.A_matrix[1, 1] = 1.0
-
-        # ego_v - 3 * opp_v >= 0.0 -> ego_v >= 3 * opp_v
-        # opp_v - 3 * ego_v >= 0.0 -> ego_v <= 1/3 * opp_v
-        # Means that agent 1 will speed up and agent 2 will slow down.
-
-        vel_vector = vertcat(x[3], opp_x[3])
-        h_vec = self.A_matrix @ vel_vector
-        # If agent 0 should go faster, then h_idx = self.agent_idx, otherwise h_idx = 1 - self.agent_idx
-        h_idx = self.agent_idx if config.mpc_p0_faster else 1 - self.agent_idx
-        h = h_vec[h_idx]
-        return h
+        return self.switch_constraint(self.model.tvp['live_active'], -h_k1 + (1-self.live_gamma)*h_k)
+
+    """A g <= 0 constraint row switched on and off by a 0 / 1 tvp (None: always on). Switched off, the row is the
+    constant INACTIVE_CONSTRAINT_VALUE, which the solver treats like a row that is not there."""
+    @staticmethod
+    def switch_constraint(active, constraint):
+        if active is None:
+            return constraint
+        return active * constraint + (1 - active) * INACTIVE_CONSTRAINT_VALUE
+
+    def h_v(self, x, ts):
+        """Liveness barrier. live_faster is 1 if this agent should pass the intersection first and 0 otherwise."""
+        tvp = self.model.tvp
+        if config.mpc_use_new_liveness_filter:
+            # Faster: d1 / opp_v - d0 / ego_v >= 0 --> d1 * ego_v - d0 * opp_v >= 0
+            # Slower: d0 / ego_v - d1 / opp_v >= 0 --> d0 * opp_v - d1 * ego_v >= 0
+            d0 = tvp['live_d0'] - x[3]*ts
+            h_faster = tvp['live_d1'] * x[3] - d0 * tvp['live_opp_v']
+            h_slower = -h_faster
+        else:
+            # Original liveness filter, rows of [[1, -zeta], [-zeta, 1]] @ [ego_v, opp_v]. The faster agent's zeta is
+            # capped so that it does not have to exceed the velocity limit.
+            # ego_v - zeta * opp_v >= 0.0 -> ego_v >= zeta * opp_v
+            # opp_v - zeta * ego_v >= 0.0 -> ego_v <= 1/zeta * opp_v
+            h_faster = x[3] - tvp['live_zeta'] * tvp['live_opp_v']
+            h_slower = tvp['live_opp_v'] - config.zeta * x[3]
+        return tvp['live_faster'] * h_faster + (1 - tvp['live_faster']) * h_slower
+
+    def get_liveness_params(self):
+        """Computes the values of the liveness tvps for the current ego and opponent states."""
+        params = {name: 0.0 for name in LIVENESS_TVPS}
+        params['live_opp_v'] = self.opp_state[3]
+        params['live_zeta'] = min(0.3 / self.opp_state[3], config.zeta) if self.opp_state[3] != 0 else config.zeta
+        params['live_faster'] = 1.0 if self.should_go_faster() else 0.0
+
+        _, _, _, _, intersecting, is_live = calculate_all_metrics(self.initial_state.copy(), self.opp_state, self.liveness_thresh)
+        if config.mpc_use_new_liveness_filter:
+            if not intersecting:
+                return params
+            distances = self.get_liveness_distances(self.opp_state)
+            if distances is None:
+                return params
+            params['live_d0'], params['live_d1'] = distances
+        else:
+            if is_live:
+                return params
+
+        params['live_active'] = 1.0
+        return params
 
-    def h_v_new(self, x, opp_state, ts):
+    def should_go_faster(self):
+        return (config.mpc_p0_faster and self.agent_idx == 0) or (not config.mpc_p0_faster and self.agent_idx == 1)
+
+    """Distances from the closest points of the ego agent and the opponent to where their headings cross."""
+    def get_liveness_distances(self, opp_state):
         dir_to_opp = np.arctan2(opp_state[1] - self.initial_state[1], opp_state[0] - self.initial_state[0])
         vec_to_opp = np.array([np.cos(dir_to_opp), np.sin(dir_to_opp)])
         initial_closest_to_opp = np.array(self.initial_state[:2]) + vec_to_opp * (config.agent_radius + config.mpc_liveness_safety_buffer / 2.0)
@@ -238,45 +449,140 @@ class MPC:
         if intersection is None:
             return None
 
-        d0_reg = np.linalg.norm(initial_closest_to_opp - intersection)
+        d0 = np.linalg.norm(initial_closest_to_opp - intersection)
         d1 = np.linalg.norm(opp_closest_to_initial - intersection)
-        should_go_faster = (config.mpc_p0_faster and self.agent_idx == 0) or (not config.mpc_p0_faster and self.agent_idx == 1)
-
-        d0 = d0_reg
-        d0 -= x[3]*ts
-        d0_reg -= self.initial_state[3]*ts
-
-
-        if should_go_faster:
-            # d1 / opp_state[3] - d0 / x[3] >= 0
-            # --> d1 * x[3] - d0 * opp_state[3] >= 0
-            h = (d1 * x[3] - d0 * opp_state[3])
-        else:
-            # d0 / x[3] - d1 / opp_state[3] >= 0
-            # --> d0 * opp_state[3] - d1 * x[3] >= 0
-            h = (d0 * opp_state[3] - d1 * x[3])
+        return d0, d1
 
-        return h
+    """Updates the ego / opponent states and the tvp values computed from them."""
+    def set_states(self, initial_state, opp_state):
+        self.initial_state = initial_state
+        self.opp_state = opp_state
+        self.liveness_params = self.get_liveness_params()
+        if config.mpc_cull_static_obs:
+            self.obs_slot_values = self.get_obs_slot_values()
 
     """Sets the initial state in all components."""
     def reset_state(self, initial_state, opp_state):
-        self.initial_state = initial_state
-        self.opp_state = opp_state
-        self.mpc = self.define_mpc()
-        self.mpc.setup()
+        self.set_states(initial_state, opp_state)
+        if config.mpc_solution_cache:
+            self.solution_cache_key = self.get_solution_cache_key()
+            self.cached_solution = self.solution_cache.get(self.solution_cache_key)
+            if self.cached_solution is not None and config.mpc_solution_cache_mode == 'control':
+                # make_step returns the cached control, so the NLP does not need to be set up.
+                return
+        if not config.mpc_persistent_controller:
+            # define_mpc already calls setup.
+            self.mpc = self.define_mpc()
         self.mpc.reset_history()
         self.mpc.x0 = self.initial_state
         self.mpc.u0 = np.zeros_like(self.mpc.u0['u'])
         self.mpc.set_initial_guess()
+        if self.cached_solution is not None:
+            # A solution of (almost) the same problem beats the shifted previous one.
+            self.warm_start(self.cached_solution[1], shift=False)
+        elif config.mpc_warm_start and self.prev_solution is not None:
+            self.warm_start(self.prev_solution)
+
+    def warm_start(self, solution, shift=True):
+        """Uses a stored primal/dual solution, shifted by one step if it is the previous tick's, as the initial guess."""
+        opt_x, lam_x, lam_g = solution
+        opt_x = self.mpc.opt_x(opt_x)
+        lam_x = self.mpc.opt_x(lam_x)
+        if shift:
+            opt_x = self.shift_solution(opt_x)
+            lam_x = self.shift_solution(lam_x)
+        opt_x['_x', 0, 0, -1] = self.initial_state
+
+        self.mpc.opt_x_num = opt_x
+        self.mpc.lam_x_num = lam_x.cat
+        # The constraint multipliers are reused unshifted, and only if the constraint set is unchanged.
+        if lam_g.shape == self.mpc.lam_g_num.shape:
+            self.mpc.lam_g_num = lam_g
+        # do_mpc only passes the multipliers to the solver once this flag is set.
+        self.mpc.flags['initial_run'] = True
+
+    def apply_budget_fallback(self, u1):
+        """Picks the control to apply after a budgeted solve and records which plan it came from."""
+        if self.solver_stats['success']:
+            self.fallback_plan = self.get_planned_controls()
+            return u1
+        if self.get_constraint_violation() <= config.mpc_fallback_feas_tol:
+            # IPOPT stopped early, but its last iterate satisfies the constraints.
+            self.solver_stats['fallback'] = 'iterate'
+            self.fallback_plan = self.get_planned_controls()
+            return u1
+        if self.fallback_plan is None:
+            # Nothing to fall back to yet.
+            self.solver_stats['fallback'] = 'unavailable'
+            return u1
+
+        self.solver_stats['fallback'] = 'previous_plan'
+        self.fallback_plan = self.fallback_plan[1:] + self.fallback_plan[-1:]
+        u1 = self.fallback_plan[0].copy()
+        # Keep do_mpc's previous input consistent with what is applied.
+        self.mpc.u0 = u1
+        return u1
+
+    def get_planned_controls(self):
+        return [np.array(self.mpc.opt_x_num['_u', k, 0]).reshape(-1, 1) for k in range(config.T_horizon)]
+
+    """Largest violation of the NLP constraints at the solver's returned point."""
+    def get_constraint_violation(self):
+        g = np.array(self.mpc.opt_g_num).ravel()
+        lbg = np.array(self.mpc.nlp_cons_lb).ravel()
+        ubg = np.array(self.mpc.nlp_cons_ub).ravel()
+        if g.size == 0:
+            return 0.0
+        return max(0.0, np.max(np.maximum(lbg - g, g - ubg)))
+
+    """Summary of a solver's stats(): iterations, return status, convergence, and where the solve time went.
+    Everything that is not NLP function/derivative evaluation is counted as linear algebra (mostly the KKT solves).
+    """
+    @staticmethod
+    def get_solver_stats(stats):
+        t_total = stats.get('t_wall_total', np.nan)
+        t_nlp_eval = sum(stats.get(timer, 0.0) for timer in NLP_EVAL_TIMERS)
+        return {
+            'iter_count': stats.get('iter_count', np.nan),
+            'return_status': stats.get('return_status'),
+            'success': bool(stats.get('success', False)),
+            't_total': t_total,
+            't_nlp_eval': t_nlp_eval,
+            't_linear_algebra': t_total - t_nlp_eval,
+        }
+
+    """Moves the states and controls of a solution struct one step forward, repeating the last entry."""
+    def shift_solution(self, solution):
+        for k in range(config.T_horizon):
+            solution['_x', k, 0, -1] = solution['_x', k + 1, 0, -1]
+        for k in range(config.T_horizon - 1):
+            solution['_u', k, 0] = solution['_u', k + 1, 0]
+        return solution
 
     # @profile
     def make_step(self, timestamp, x0):
         if timestamp < self.delay_start:
             self.use_for_training = False
+            self.solver_stats = None
             return np.zeros((config.num_controls, 1))
         self.use_for_training = True
 
+        if self.cached_solution is not None and config.mpc_solution_cache_mode == 'control':
+            self.solver_stats = None
+            return self.cached_solution[0].copy()
+
         u1 = self.mpc.make_step(x0)
+        self.solver_stats = self.get_solver_stats(self.mpc.solver_stats)
+        self.solver_stats['fallback'] = None
+        if config.mpc_compute_budget is not None:
+            u1 = self.apply_budget_fallback(u1)
+        solution = None
+        if config.mpc_warm_start or (config.mpc_solution_cache and config.mpc_solution_cache_mode == 'warm_start'):
+            solution = (DM(self.mpc.opt_x_num.cat), DM(self.mpc.lam_x_num), DM(self.mpc.lam_g_num))
+        if config.mpc_warm_start:
+            self.prev_solution = solution
+        if config.mpc_solution_cache and self.solver_stats['success']:
+            self.solution_cache.put(self.solution_cache_key, (np.array(u1).copy(), solution))
 
         # Add liveliness condition here
         ego_state = self.initial_state.copy()
@@ -0,0 +1,83 @@
+import time
+import multiprocessing
+import numpy as np
+from environment import Environment
+from checkpoint import get_checkpoint_state, set_checkpoint_state
+
+"""Runs in the worker process. Holds the agent's controller (and its own Environment) for the whole run."""
+def controller_worker(conn, controller):
+    while True:
+        command, args = conn.recv()
+        if command == 'initialize':
+            initial_states, goals = args
+            controller.initialize_controller(Environment(initial_states, goals))
+            conn.send(None)
+        elif command == 'step':
+            sim_time, initial_state, opp_state, neighbor_states = args
+            if hasattr(controller, 'set_neighbor_states'):
+                controller.set_neighbor_states(neighbor_states)
+            cycle_start_time = time.time()
+            controller.reset_state(initial_state, opp_state)
+            feedback_start_time = time.time()
+            u1 = np.array(controller.make_step(sim_time, initial_state))
+            cycle_end_time = time.time()
+            phase_times = (feedback_start_time - cycle_start_time, cycle_end_time - feedback_start_time)
+            conn.send((u1, phase_times, controller.use_for_training, getattr(controller, 'solver_stats', None)))
+        elif command == 'get_checkpoint_state':
+            conn.send(get_checkpoint_state(controller))
+        elif command == 'set_checkpoint_state':
+            set_checkpoint_state(controller, args)
+            conn.send(None)
+        elif command == 'close':
+            conn.close()
+            return
+
+
+class ParallelController:
+    """Proxy that runs a controller in its own worker process, so that all agents can solve within a tick at the
+    same time. Environment.run_simulation submits every agent's step before collecting any of the controls.
+
+    The worker is forked when the proxy is created and keeps the controller (and any solver built by
+    initialize_controller) alive until close() is called.
+    """
+    def __init__(self, controller):
+        self.use_for_training = False
+        self.solver_stats = None
+        self.neighbor_states = []
+        # Scheduling looks up the period of the wrapped controller's class.
+        self.controller_type = type(controller).__name__
+        context = multiprocessing.get_context('fork')
+        self.conn, worker_conn = context.Pipe()
+        self.process = context.Process(target=controller_worker, args=(worker_conn, controller), daemon=True)
+        self.process.start()
+        worker_conn.close()
+
+    def initialize_controller(self, env):
+        self.conn.send(('initialize', (env.initial_states, env.goals)))
+        self.conn.recv()
+
+    def set_neighbor_states(self, neighbor_states):
+        self.neighbor_states = neighbor_states
+
+    def submit(self, timestamp, initial_state, opp_state):
+        self.conn.send(('step', (timestamp, initial_state, opp_state, self.neighbor_states)))
+
+    """Waits for the submitted step. Returns the control and the (reset_state, make_step) times in the worker."""
+    def collect(self):
+        u1, phase_times, self.use_for_training, self.solver_stats = self.conn.recv()
+        return u1, phase_times
+
+    """The wrapped controller's tick-to-tick state lives in the worker, so checkpoints go through it."""
+    def get_checkpoint_state(self):
+        self.conn.send(('get_checkpoint_state', None))
+        return self.conn.recv()
+
+    def set_checkpoint_state(self, state):
+        self.conn.send(('set_checkpoint_state', state))
+        self.conn.recv()
+
+    def close(self):
+        if self.process.is_alive():
+            self.conn.send(('close', None))
+            self.process.join()
+        self.conn.close()
@@ -35,8 +35,9 @@ class Plotter:
     # Function to update the plots
     def plot_live(self, iteration, scenario, x_cum, u_cum, metrics):
         self.scenario = scenario
-        self.x_cum = np.array(x_cum)
-        self.u_cum = np.array(u_cum)
+        # Simulation passes views into its trajectory buffer, so only lists (e.g. from replay.py) get converted.
+        self.x_cum = np.asarray(x_cum)
+        self.u_cum = np.asarray(u_cum)
         self.metrics = metrics
         self.update(len(x_cum[0]) - 1)
         plt.legend()
@@ -180,11 +181,11 @@ class Plotter:
         fontsize = 14
 
         if config.dynamics == config.DynamicsModel.SINGLE_INTEGRATOR:
-            speed1, speed2 = u_cum.copy()
+            speed1, speed2 = u_cum
             speed1 = [control[0] for control in speed1]
             speed2 = [control[0] for control in speed2]
         else:
-            agent_1_states, agent_2_states = x_cum.copy()
+            agent_1_states, agent_2_states = x_cum
             speed1 = [state[3] for state in agent_1_states]
             speed2 = [state[3] for state in agent_2_states]
 
@@ -0,0 +1,239 @@
+from casadi import *
+import config
+from config import DynamicsModel
+import numpy as np
+from mpc_cbf import MPC, LIVENESS_TVPS
+
+class QPMPC(MPC):
+    """MPC-CBF with the dynamics and the barrier constraints linearized around the previous plan:
+
+    min Σ_{k=0}{N-1} x'_k^T*Q*x'_k + Δu_k^T*R*Δu_k + x'_N^T*Q*x'_N   over x, u
+    s.t.
+        x_{k+1} = f(x̄_k, ū_k) + ∂f/∂x*(x_k - x̄_k) + ∂f/∂u*(u_k - ū_k)
+        c(x̄_k, ū_k) + ∂c/∂x*(x_k - x̄_k) + ∂c/∂u*(u_k - ū_k) <= 0
+        x_min <= x_k <= x_max
+        u_min <= u_k <= u_max
+        x_0 = x(0)
+
+    where c stacks the same CBF and liveness constraints as MPC, and (x̄, ū) is the previous tick's plan
+    shifted by one step. The result is a sparse QP solved with qpsol.
+    """
+    CHECKPOINT_ATTRS = MPC.CHECKPOINT_ATTRS + ('prev_plan',)
+
+    def initialize_controller(self, env):
+        self.env = env
+        self.model = self.define_model(env)
+        self.liveness_params = {name: 0.0 for name in LIVENESS_TVPS}
+        self.prev_plan = None
+        self.define_qp()
+
+    """Linear and Jacobian terms of fun(x, u, *args) around the point it is called at."""
+    @staticmethod
+    def get_linearization(name, fun, *arg_sizes):
+        x = SX.sym('x', config.num_states)
+        u = SX.sym('u', config.num_controls)
+        args = [SX.sym(f'arg{i}', size) for i, size in enumerate(arg_sizes)]
+        value = fun(x, u, *args)
+        return Function(name, [x, u, *args], [value, jacobian(value, x), jacobian(value, u)])
+
+    def define_qp(self):
+        qp = self.build_qp()
+        self.qp_solver = qpsol('qp_mpc', config.qp_solver, qp, config.qp_solver_opts[config.qp_solver])
+
+    """Builds the parametric QP once. The linearization point, tvps and goal are QP parameters."""
+    def build_qp(self):
+        n, m, N = config.num_states, config.num_controls, config.T_horizon
+        x, u, tvp = self.model.x['x'], self.model.u['u'], self.model.tvp.cat
+
+        # Same discrete prediction model as the do_mpc model in MPC.
+        A, B = self.env.get_dynamics(x)
+        x_next = x + A*config.sim_ts + B@u*config.sim_ts
+        self.dynamics_fun = Function('dynamics', [x, u], [x_next])
+        constraint_fun = Function('constraints', [x, u, tvp], [self.get_constraint_expressions()])
+
+        dynamics_lin = self.get_linearization('dynamics_lin', self.dynamics_fun)
+        constraint_lin = self.get_linearization('constraints_lin', constraint_fun, tvp.shape[0])
+
+        X = SX.sym('X', n, N + 1)
+        U = SX.sym('U', m, N)
+        X_bar = SX.sym('X_bar', n, N + 1)
+        U_bar = SX.sym('U_bar', m, N)
+        P = SX.sym('P', tvp.shape[0], N)
+        goal = SX.sym('goal', n)
+        u_prev = SX.sym('u_prev', m)
+        Q, R = DM(self.Q), diag(DM(self.R))
+
+        cost = 0
+        dynamics_cons, barrier_cons = [], []
+        for k in range(N):
+            dx, du = X[:, k] - X_bar[:, k], U[:, k] - U_bar[:, k]
+            f, f_x, f_u = dynamics_lin(X_bar[:, k], U_bar[:, k])
+            dynamics_cons.append(X[:, k + 1] - (f + f_x @ dx + f_u @ du))
+            c, c_x, c_u = constraint_lin(X_bar[:, k], U_bar[:, k], P[:, k])
+            barrier_cons.append(c + c_x @ dx + c_u @ du)
+
+            error = X[:, k] - goal
+            delta_u = U[:, k] - (u_prev if k == 0 else U[:, k - 1])
+            cost += error.T @ Q @ error + delta_u.T @ R @ delta_u
+        error = X[:, N] - goal
+        cost += error.T @ Q @ error
+
+        qp = {
+            'x': vertcat(vec(X), vec(U)),
+            'p': vertcat(goal, u_prev, vec(X_bar), vec(U_bar), vec(P)),
+            'f': cost,
+            'g': vertcat(*dynamics_cons, *barrier_cons),
+        }
+        num_dynamics_cons = n * N
+        num_barrier_cons = qp['g'].shape[0] - num_dynamics_cons
+        self.lbg = np.concatenate([np.zeros(num_dynamics_cons), np.full(num_barrier_cons, -np.inf)])
+        self.ubg = np.zeros(num_dynamics_cons + num_barrier_cons)
+        return qp
+
+    """CBF and liveness constraints of MPC, stacked into one vector (<= 0)."""
+    def get_constraint_expressions(self):
+        constraints = []
+        if config.obstacle_avoidance:
+            constraints += self.get_cbf_constraints()
+        if config.dynamics == DynamicsModel.DOUBLE_INTEGRATOR and config.liveliness:
+            constraints.append(self.get_liveliness_constraint())
+        return vertcat(*constraints)
+
+    """Bounds on the stacked [vec(X); vec(U)] decision vector, with x_0 fixed to the measured state."""
+    def get_variable_bounds(self, x0):
+        min_x, max_x, max_u = self.get_bounds()
+        lbx = np.concatenate([np.tile(min_x, config.T_horizon + 1), np.tile(-max_u, config.T_horizon)])
+        ubx = np.concatenate([np.tile(max_x, config.T_horizon + 1), np.tile(max_u, config.T_horizon)])
+        lbx[:config.num_states] = x0
+        ubx[:config.num_states] = x0
+        return lbx, ubx
+
+    """tvp values for every step of the horizon, one column per step."""
+    def get_tvp_matrix(self):
+        tvp_num = self.model.tvp(0)
+        columns = []
+        for k in range(config.T_horizon):
+            for name, value in self.get_tvp_values(k).items():
+                tvp_num[name] = value
+            columns.append(np.array(tvp_num.cat).ravel())
+        return np.array(columns).T
+
+    """Rolls out the previous plan's controls, shifted by one step, from x0. Zero controls on the first tick."""
+    def get_linearization_point(self, x0):
+        if self.prev_plan is None:
+            U_bar = np.zeros((config.num_controls, config.T_horizon))
+        else:
+            U_bar = np.hstack([self.prev_plan[1][:, 1:], self.prev_plan[1][:, -1:]])
+
+        X_bar = np.zeros((config.num_states, config.T_horizon + 1))
+        X_bar[:, 0] = x0
+        for k in range(config.T_horizon):
+            X_bar[:, k + 1] = np.array(self.dynamics_fun(X_bar[:, k], U_bar[:, k])).ravel()
+        return X_bar, U_bar
+
+    def reset_state(self, initial_state, opp_state):
+        self.set_states(initial_state, opp_state)
+
+    def make_step(self, timestamp, x0):
+        if timestamp < self.delay_start:
+            self.use_for_training = False
+            self.solver_stats = None
+            return np.zeros((config.num_controls, 1))
+        self.use_for_training = True
+
+        x0 = np.array(x0, dtype=float).ravel()
+        X_bar, U_bar = self.get_linearization_point(x0)
+        P = self.get_tvp_matrix()
+        lbx, ubx = self.get_variable_bounds(x0)
+
+        # Each pass re-linearizes around the previous pass's solution (one pass is a single SQP step).
+        for _ in range(config.qp_mpc_sqp_iters):
+            p = self.get_qp_parameters(X_bar, U_bar, P)
+            solution = self.qp_solver(x0=self.stack_plan(X_bar, U_bar), p=p, lbx=lbx, ubx=ubx, lbg=self.lbg, ubg=self.ubg)
+            X_bar, U_bar = self.unstack_plan(solution['x'])
+            if not self.qp_solver.stats()['success']:
+                break
+
+        return self.finish_step(X_bar, U_bar)
+
+    def get_qp_parameters(self, X_bar, U_bar, P):
+        # Like MPC, which resets u0 every tick, the first control's change is measured from zero.
+        u_prev = np.zeros(config.num_controls)
+        return np.concatenate([self.goal, u_prev, X_bar.flatten(order='F'), U_bar.flatten(order='F'), P.flatten(order='F')])
+
+    @staticmethod
+    def stack_plan(X, U):
+        return np.concatenate([X.flatten(order='F'), U.flatten(order='F')])
+
+    @staticmethod
+    def unstack_plan(w):
+        n, N = config.num_states, config.T_horizon
+        w = np.array(w).ravel()
+        return w[:n * (N + 1)].reshape(N + 1, n).T, w[n * (N + 1):].reshape(N, config.num_controls).T
+
+    """Stores the plan for the next tick's linearization and returns its first control. If the QP solve failed, the
+    previous plan shifted by one step is kept and applied instead, like MPC.apply_budget_fallback."""
+    def finish_step(self, X, U):
+        self.solver_stats = self.get_solver_stats(self.qp_solver.stats())
+        self.solver_stats['fallback'] = None
+        if self.solver_stats['success']:
+            self.prev_plan = (X, U)
+        elif self.prev_plan is None:
+            # Nothing to fall back to yet.
+            self.solver_stats['fallback'] = 'unavailable'
+        else:
+            self.solver_stats['fallback'] = 'previous_plan'
+            X_prev, U_prev = self.prev_plan
+            X = np.hstack([X_prev[:, 1:], X_prev[:, -1:]])
+            U = np.hstack([U_prev[:, 1:], U_prev[:, -1:]])
+            self.prev_plan = (X, U)
+        return U[:, :1].copy()
+
+
+class RTIMPC(QPMPC):
+    """Real-time iteration variant of QPMPC: exactly one Gauss-Newton SQP step per tick.
+
+    The preparation phase (reset_state) linearizes around the previous plan shifted by one step, without using
+    the measured state, and evaluates the QP matrices. The feedback phase (make_step) only fixes x_0 to the
+    measured state and solves the already prepared QP.
+    """
+    def define_qp(self):
+        qp = self.build_qp()
+        w, p = qp['x'], qp['p']
+        w_zero = SX.zeros(w.shape)
+
+        # The cost is quadratic, so its Hessian is the Gauss-Newton Hessian, and the constraints are affine in w.
+        H, _ = hessian(qp['f'], w)
+        grad = substitute(gradient(qp['f'], w), w, w_zero)
+        A = jacobian(qp['g'], w)
+        b = substitute(qp['g'], w, w_zero)
+        self.preparation_fun = Function('rti_preparation', [p], [H, grad, A, b])
+        self.qp_solver = conic('rti_mpc', config.qp_solver, {'h': H.sparsity(), 'a': A.sparsity()}, config.qp_solver_opts[config.qp_solver])
+
+    def reset_state(self, initial_state, opp_state):
+        self.set_states(initial_state, opp_state)
+        self.preparation_phase()
+
+    def preparation_phase(self):
+        if self.prev_plan is None:
+            X_bar, U_bar = self.get_linearization_point(np.array(self.initial_state, dtype=float).ravel())
+        else:
+            X_prev, U_prev = self.prev_plan
+            X_bar = np.hstack([X_prev[:, 1:], X_prev[:, -1:]])
+            U_bar = np.hstack([U_prev[:, 1:], U_prev[:, -1:]])
+
+        H, grad, A, b = self.preparation_fun(self.get_qp_parameters(X_bar, U_bar, self.get_tvp_matrix()))
+        b = np.array(b).ravel()
+        self.prepared_qp = {'h': H, 'g': grad, 'a': A, 'lba': self.lbg - b, 'uba': self.ubg - b}
+        self.plan_guess = self.stack_plan(X_bar, U_bar)
+
+    def make_step(self, timestamp, x0):
+        if timestamp < self.delay_start:
+            self.use_for_training = False
+            self.solver_stats = None
+            return np.zeros((config.num_controls, 1))
+        self.use_for_training = True
+
+        lbx, ubx = self.get_variable_bounds(np.array(x0, dtype=float).ravel())
+        solution = self.qp_solver(x0=self.plan_guess, lbx=lbx, ubx=ubx, **self.prepared_qp)
+        return self.finish_step(*self.unstack_plan(solution['x']))
@@ -0,0 +1,44 @@
+import functools
+import config
+import numpy as np
+import run_experiments
+from run_experiments import set_mpc_live_config, get_mpc_live_controllers, get_scenario
+from mpc_cbf import MPC
+from environment import Environment
+from data_logger import BlankLogger
+from metrics import gather_all_metric_data
+from simulation import run_simulation, fork_simulation
+
+SCENARIO = 'Doorway'
+# Time of the checkpoint that the branches continue from.
+BRANCH_TIME = 4.0
+# (opp_gamma, obs_gamma, live_gamma) of each branch's MPCs.
+BRANCH_GAMMAS = [
+    (0.5, 0.3, 0.3),
+    (0.3, 0.3, 0.3),
+    (0.7, 0.3, 0.3),
+    (0.5, 0.3, 0.1),
+    (0.5, 0.3, 0.5),
+]
+NUM_WORKERS = None
+
+def get_branch_controllers(scenario, opp_gamma, obs_gamma, live_gamma):
+    # The same liveness settings as the run up to the checkpoint, with the branch's gammas.
+    set_mpc_live_config(True)
+    return [MPC(agent_idx=agent_idx, opp_gamma=opp_gamma, obs_gamma=obs_gamma, live_gamma=live_gamma, liveness_thresh=config.liveness_threshold, goal=scenario.goals[agent_idx, :].copy(), static_obs=scenario.obstacles.copy()) for agent_idx in range(len(scenario.initial))]
+
+
+if __name__ == '__main__':
+    run_experiments.SCENARIO = SCENARIO
+    scenario = get_scenario(SCENARIO)
+    branch_iteration = int(BRANCH_TIME / config.sim_ts)
+
+    env = Environment(scenario.initial.copy(), scenario.goals.copy())
+    run_simulation(scenario, env, get_mpc_live_controllers(scenario, True), BlankLogger(), None, checkpoint_iterations=[branch_iteration])
+    checkpoint = env.checkpoints[branch_iteration]
+
+    branches = [functools.partial(get_branch_controllers, scenario, *gammas) for gammas in BRANCH_GAMMAS]
+    results = fork_simulation(scenario, checkpoint, branches, NUM_WORKERS)
+    for gammas, (x_cum, u_cum, compute_history) in zip(BRANCH_GAMMAS, results):
+        metric_data = gather_all_metric_data(scenario, x_cum[0], x_cum[1], scenario.goals, compute_history)
+        print(f"Gammas {gammas} from t={BRANCH_TIME}: goal reach idxs {metric_data[0]}, {metric_data[1]}, min agent dist {metric_data[2]:.3f}, collision {metric_data[3]}")
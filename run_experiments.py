@@ -1,17 +1,22 @@
 import config
 import numpy as np
-from metrics import gather_all_metric_data, load_desired_path
+from solution_cache import get_solution_cache
+from metrics import SOLVER_STATS_HEADER, MetricsAccumulator, load_desired_path
 from mpc_cbf import MPC
+from qp_mpc_cbf import QPMPC
 from scenarios import DoorwayScenario, IntersectionScenario
 from data_logger import BlankLogger, DataLogger
 from environment import Environment
 from model_controller import ModelController
+from explicit_policy_controller import ExplicitPolicyController
 from simulation import run_simulation
 
 SCENARIO = 'Doorway'
 # SCENARIO = 'Intersection'
 
 # RUN_AGENT = 'MPC'
+# RUN_AGENT = 'MPC_QP'
+# RUN_AGENT = 'MPC_TABLE'
 # RUN_AGENT = 'MPC_UNLIVE'
 RUN_AGENT = 'BarrierNet'
 # RUN_AGENT = 'LiveNet'
@@ -20,7 +25,14 @@ SIM_RESULTS_MODE = True
 
 NUM_SIMS = 50
 
-def get_mpc_live_controllers(scenario, zero_goes_faster):
+# Agents that are compared against another agent's desired paths.
+DESIRED_PATH_AGENTS = {
+    'MPC_QP': 'MPC',
+    'MPC_TABLE': 'MPC',
+}
+
+"""Sets the liveness and CBF parameters of the MPC controllers for SCENARIO in config."""
+def set_mpc_live_config(zero_goes_faster):
     if SCENARIO == 'Doorway':
         config.liveliness = True
         config.mpc_p0_faster = zero_goes_faster
@@ -38,9 +50,12 @@ def get_mpc_live_controllers(scenario, zero_goes_faster):
 
     config.mpc_use_new_liveness_filter = False
 
+
+def get_mpc_live_controllers(scenario, zero_goes_faster, controller_class=MPC):
+    set_mpc_live_config(zero_goes_faster)
     controllers = [
-        MPC(agent_idx=0, opp_gamma=config.opp_gamma, obs_gamma=config.obs_gamma, live_gamma=config.liveliness_gamma, liveness_thresh=config.liveness_threshold, goal=scenario.goals[0,:].copy(), static_obs=scenario.obstacles.copy()),
-        MPC(agent_idx=1, opp_gamma=config.opp_gamma, obs_gamma=config.obs_gamma, live_gamma=config.liveliness_gamma, liveness_thresh=config.liveness_threshold, goal=scenario.goals[1,:].copy(), static_obs=scenario.obstacles.copy())
+        controller_class(agent_idx=0, opp_gamma=config.opp_gamma, obs_gamma=config.obs_gamma, live_gamma=config.liveliness_gamma, liveness_thresh=config.liveness_threshold, goal=scenario.goals[0,:].copy(), static_obs=scenario.obstacles.copy()),
+        controller_class(agent_idx=1, opp_gamma=config.opp_gamma, obs_gamma=config.obs_gamma, live_gamma=config.liveliness_gamma, liveness_thresh=config.liveness_threshold, goal=scenario.goals[1,:].copy(), static_obs=scenario.obstacles.copy())
     ]
     return controllers
 
@@ -86,6 +101,14 @@ def get_livenet_controllers(scenario, scenario_type=SCENARIO):
     return controllers
 
 
+def get_explicit_policy_controllers(scenario):
+    controllers = [
+        ExplicitPolicyController(f"policy_tables/{SCENARIO}_MPC_0.npz", scenario.goals[0], scenario.obstacles.copy()),
+        ExplicitPolicyController(f"policy_tables/{SCENARIO}_MPC_1.npz", scenario.goals[1], scenario.obstacles.copy()),
+    ]
+    return controllers
+
+
 def get_scenario(scenario_type):
     if scenario_type == 'Doorway':
         scenario_params = (-1.0, 0.5, 2.0, 0.15)
@@ -111,6 +134,10 @@ if __name__ == '__main__':
         env = Environment(scenario.initial.copy(), scenario.goals.copy())
         if RUN_AGENT == 'MPC':
             controllers = get_mpc_live_controllers(scenario, True)
+        elif RUN_AGENT == 'MPC_QP':
+            controllers = get_mpc_live_controllers(scenario, True, controller_class=QPMPC)
+        elif RUN_AGENT == 'MPC_TABLE':
+            controllers = get_explicit_policy_controllers(scenario)
         elif RUN_AGENT == 'MPC_UNLIVE':
             controllers = get_mpc_unlive_controllers(scenario)
         elif RUN_AGENT == 'BarrierNet':
@@ -118,16 +145,24 @@ if __name__ == '__main__':
         elif RUN_AGENT == 'LiveNet':
             controllers = get_livenet_controllers(scenario)
 
-        env.compute_history = []
-        x_cum, u_cum = run_simulation(scenario, env, controllers, logger, plotter)
+        desired_path_agent = DESIRED_PATH_AGENTS.get(RUN_AGENT, RUN_AGENT)
+        desired_path_0 = load_desired_path(f"experiment_results/desired_paths/{SCENARIO}_{desired_path_agent}_0.json", 0)
+        desired_path_1 = load_desired_path(f"experiment_results/desired_paths/{SCENARIO}_{desired_path_agent}_1.json", 1)
+        metrics_accumulator = MetricsAccumulator(scenario, scenario.goals, desired_path_0=desired_path_0, desired_path_1=desired_path_1)
 
-        desired_path_0 = load_desired_path(f"experiment_results/desired_paths/{SCENARIO}_{RUN_AGENT}_0.json", 0)
-        desired_path_1 = load_desired_path(f"experiment_results/desired_paths/{SCENARIO}_{RUN_AGENT}_1.json", 1)
-        metric_data = gather_all_metric_data(scenario, x_cum[0], x_cum[1], scenario.goals, env.compute_history, desired_path_0=desired_path_0, desired_path_1=desired_path_1)
+        x_cum, u_cum = run_simulation(scenario, env, controllers, logger, plotter, metrics_accumulator)
+        metric_data = metrics_accumulator.get_metric_data(include_solver_stats=True)
         all_metric_data.append(metric_data)
 
+    # avg_iters_0, avg_iters_1, max_iters_0, max_iters_1 of SOLVER_STATS_HEADER (NaN for agents without a solver).
+    iter_metrics = np.array(all_metric_data)[:, -len(SOLVER_STATS_HEADER.split(', ')):][:, :4]
+    print(f"Solver iterations with warm start {config.mpc_warm_start}: avg {np.mean(iter_metrics[:, :2], axis=0)}, max {np.max(iter_metrics[:, 2:], axis=0)}")
+
+    if config.mpc_solution_cache:
+        print("MPC solution cache:", get_solution_cache().get_stats())
+
     if SIM_RESULTS_MODE:
         all_metric_data = np.array(all_metric_data)
         save_filename = f"experiment_results/{RUN_AGENT}_{SCENARIO}.csv"
         print(f"Saving experiment results to {save_filename}")
-        np.savetxt(save_filename, all_metric_data, fmt='%0.4f', delimiter=', ', header='goal_reach_idx0, goal_reach_idx1, min_agent_dist, traj_collision, obs_min_dist_0, obs_collision_0, obs_min_dist_1, obs_collision_1, delta_vel_0, delta_vel_1, path_dev_0, path_dev_1, avg_compute_0, avg_compute_1')
+        np.savetxt(save_filename, all_metric_data, fmt='%0.4f', delimiter=', ', header='goal_reach_idx0, goal_reach_idx1, min_agent_dist, traj_collision, obs_min_dist_0, obs_collision_0, obs_min_dist_1, obs_collision_1, delta_vel_0, delta_vel_1, path_dev_0, path_dev_1, avg_compute_0, avg_compute_1' + ', ' + SOLVER_STATS_HEADER)
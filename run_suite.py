@@ -5,9 +5,10 @@ from plotter import Plotter
 from data_logger import BlankLogger
 from environment import Environment
 from simulation import run_simulation
-from model_controller import ModelController
+from model_controller import ModelController, BatchedModelController
+from batched_environment import BatchedEnvironment, run_batched_simulation
 from run_experiments import get_mpc_live_controllers
-from metrics import gather_all_metric_data, load_desired_path
+from metrics import MetricsAccumulator, gather_all_metric_data, load_desired_path
 
 # start x, start y, goal x, goal y, opp gamma, obs gamma, liveness gamma
 scenario_configs = [
@@ -49,48 +50,82 @@ scenario_configs = [
 ]
 
 VIZ = False
+# Run all scenarios in lockstep in a BatchedEnvironment (LiveNet only).
+BATCHED = False
 SCENARIO = 'Doorway'
 
 # RUN_AGENT = 'MPC'
 RUN_AGENT = 'LiveNet'
 
-all_metric_data = []
-for scenario_config in scenario_configs:
-    scenario = DoorwayScenario(initial_x=scenario_config[0], initial_y=scenario_config[1], goal_x=scenario_config[2], goal_y=scenario_config[3], initial_vel=scenario_config[4], start_facing_goal=scenario_config[5])
-    print(f"Running scenario {str(scenario)}")
-
-    logger = BlankLogger()
-    if VIZ:
-        plotter = Plotter()
-    else:
-        plotter = None
-
-    # Add all initial and goal positions of the agents here (Format: [x, y, theta])
-    goals = scenario.goals.copy()
-    logger.set_obstacles(scenario.obstacles.copy())
-    env = Environment(scenario.initial.copy(), scenario.goals.copy())
-    if RUN_AGENT == "LiveNet":
-        model_def = f"weights/livenet_doorway_suite_definition.json"
-        print(model_def)
-        controllers = [
-            ModelController(model_def, scenario.goals[0], scenario.obstacles.copy()),
-            ModelController(model_def, scenario.goals[1], scenario.obstacles.copy()),
-        ]
-
-    elif RUN_AGENT == "MPC":
-        controllers = get_mpc_live_controllers(scenario, SCENARIO)
-
-    x_cum, u_cum = run_simulation(scenario, env, controllers, logger, plotter)
+METRIC_HEADER = 'goal_reach_idx0, goal_reach_idx1, min_agent_dist, traj_collision, obs_min_dist_0, obs_collision_0, obs_min_dist_1, obs_collision_1, delta_vel_0, delta_vel_1, path_dev_0, path_dev_1, avg_compute_0, avg_compute_1'
 
+def get_suite_scenarios():
+    return [DoorwayScenario(initial_x=c[0], initial_y=c[1], goal_x=c[2], goal_y=c[3], initial_vel=c[4], start_facing_goal=c[5]) for c in scenario_configs]
+
+
+def run_batched_suite():
+    assert RUN_AGENT == 'LiveNet', "Only the learned controllers have a batched version."
+    scenarios = get_suite_scenarios()
+    env = BatchedEnvironment.from_scenarios(scenarios)
+    model_def = f"weights/livenet_doorway_suite_definition.json"
+    goals = [[scenario.goals[agent_idx] for scenario in scenarios] for agent_idx in range(2)]
+    static_obs = [scenario.obstacles.copy() for scenario in scenarios]
+    controllers = [BatchedModelController(model_def, goals[agent_idx], static_obs) for agent_idx in range(2)]
+    x_cum, _ = run_batched_simulation(env, controllers)
+
+    # The batch's compute time is shared by its scenarios.
+    compute_history = np.array(env.compute_history) / env.num_scenarios
     desired_path_0 = load_desired_path(f"experiment_results/desired_paths/{SCENARIO}_{RUN_AGENT}_0.json", 0)
     desired_path_1 = load_desired_path(f"experiment_results/desired_paths/{SCENARIO}_{RUN_AGENT}_1.json", 1)
-    metric_data = gather_all_metric_data(scenario, x_cum[0], x_cum[1], scenario.goals, env.compute_history, desired_path_0=desired_path_0, desired_path_1=desired_path_1)
-    all_metric_data.append(metric_data)
+    all_metric_data = []
+    for scenario_idx, scenario in enumerate(scenarios):
+        all_metric_data.append(gather_all_metric_data(scenario, x_cum[scenario_idx, 0], x_cum[scenario_idx, 1], scenario.goals, compute_history, desired_path_0=desired_path_0, desired_path_1=desired_path_1))
+    return all_metric_data
 
-    all_metric_data_save = np.array(all_metric_data)
+
+if BATCHED:
+    all_metric_data_save = np.array(run_batched_suite())
     save_filename = f"experiment_results/{RUN_AGENT}_{SCENARIO}_suite.csv"
     print(f"Saving suite results to {save_filename}")
-    np.savetxt(save_filename, all_metric_data_save, fmt='%0.4f', delimiter=', ', header='goal_reach_idx0, goal_reach_idx1, min_agent_dist, traj_collision, obs_min_dist_0, obs_collision_0, obs_min_dist_1, obs_collision_1, delta_vel_0, delta_vel_1, path_dev_0, path_dev_1, avg_compute_0, avg_compute_1')
-
-    if VIZ:
-        plt.close()
+    np.savetxt(save_filename, all_metric_data_save, fmt='%0.4f', delimiter=', ', header=METRIC_HEADER)
+else:
+    all_metric_data = []
+    for scenario_config in scenario_configs:
+        scenario = DoorwayScenario(initial_x=scenario_config[0], initial_y=scenario_config[1], goal_x=scenario_config[2], goal_y=scenario_config[3], initial_vel=scenario_config[4], start_facing_goal=scenario_config[5])
+        print(f"Running scenario {str(scenario)}")
+
+        logger = BlankLogger()
+        if VIZ:
+            plotter = Plotter()
+        else:
+            plotter = None
+
+        # Add all initial and goal positions of the agents here (Format: [x, y, theta])
+        goals = scenario.goals.copy()
+        logger.set_obstacles(scenario.obstacles.copy())
+        env = Environment(scenario.initial.copy(), scenario.goals.copy())
+        if RUN_AGENT == "LiveNet":
+            model_def = f"weights/livenet_doorway_suite_definition.json"
+            print(model_def)
+            controllers = [
+                ModelController(model_def, scenario.goals[0], scenario.obstacles.copy()),
+                ModelController(model_def, scenario.goals[1], scenario.obstacles.copy()),
+            ]
+
+        elif RUN_AGENT == "MPC":
+            controllers = get_mpc_live_controllers(scenario, SCENARIO)
+
+        desired_path_0 = load_desired_path(f"experiment_results/desired_paths/{SCENARIO}_{RUN_AGENT}_0.json", 0)
+        desired_path_1 = load_desired_path(f"experiment_results/desired_paths/{SCENARIO}_{RUN_AGENT}_1.json", 1)
+        metrics_accumulator = MetricsAccumulator(scenario, scenario.goals, desired_path_0=desired_path_0, desired_path_1=desired_path_1)
+        x_cum, u_cum = run_simulation(scenario, env, controllers, logger, plotter, metrics_accumulator)
+        metric_data = metrics_accumulator.get_metric_data()
+        all_metric_data.append(metric_data)
+
+        all_metric_data_save = np.array(all_metric_data)
+        save_filename = f"experiment_results/{RUN_AGENT}_{SCENARIO}_suite.csv"
+        print(f"Saving suite results to {save_filename}")
+        np.savetxt(save_filename, all_metric_data_save, fmt='%0.4f', delimiter=', ', header=METRIC_HEADER)
+
+        if VIZ:
+            plt.close()
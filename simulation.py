@@ -1,36 +1,111 @@
+import os
+import multiprocessing
 import config
 import numpy as np
 from util import calculate_all_metrics
+from parallel import ParallelController
+from checkpoint import Checkpoint
+from environment import Environment
+from data_logger import BlankLogger
 from memory_profiler import profile
 
 # @profile
-def run_simulation(scenario, env, controllers, logger, plotter):
-    x_cum = [[], []]
-    u_cum = [[], []]
+def run_simulation(scenario, env, controllers, logger, plotter, metrics_accumulator=None, checkpoint=None, checkpoint_iterations=()):
+    """Runs the closed loop to config.runtime. Given a checkpoint, the run continues from it instead of the start.
+    A Checkpoint is stored in env.checkpoints at the start of each of checkpoint_iterations."""
+    # x_cum and u_cum are views into env.buffer, which is preallocated for the whole run.
     metrics = []
 
-    controllers[0].initialize_controller(env)
-    controllers[1].initialize_controller(env)
+    if config.parallel_agents:
+        controllers = [ParallelController(controller) for controller in controllers]
 
-    for sim_iteration in range(int(config.runtime / config.sim_ts)):
-        for agent_idx in range(config.n):
-            x_cum[agent_idx].append(env.initial_states[agent_idx])
+    num_iterations = int(config.runtime / config.sim_ts)
+    # The logged ticks are written and the worker processes stopped even if the run fails or is interrupted.
+    try:
+        for controller in controllers:
+            controller.initialize_controller(env)
 
-        if plotter is not None:
-            metrics.append(calculate_all_metrics(x_cum[0][-1], x_cum[1][-1], config.liveness_threshold))
-        new_states, outputted_controls = env.run_simulation(sim_iteration, controllers, logger)
+        start_iteration = 0
+        if checkpoint is not None:
+            start_iteration = checkpoint.restore(env, controllers, metrics_accumulator)
 
-        for agent_idx in range(config.n):
-            u_cum[agent_idx].append(outputted_controls[agent_idx])
-        
-        # Plots
-        if sim_iteration % config.plot_rate == 0 and config.plot_live and plotter is not None:
-            plotter.plot_live(sim_iteration, scenario, x_cum, u_cum, metrics)
+        for sim_iteration in range(start_iteration, num_iterations):
+            if sim_iteration in checkpoint_iterations:
+                env.checkpoints[sim_iteration] = Checkpoint.capture(env, controllers, metrics_accumulator)
+            if metrics_accumulator is not None:
+                metrics_accumulator.update(env.initial_states)
 
-    # Discard the first element of both x1 and x2
-    x_cum = np.array(x_cum)
-    u_cum = np.array(u_cum)
+            termination_reason = env.get_termination_reason()
+            if termination_reason is not None:
+                print(f"Stopping simulation at iteration {sim_iteration}: {termination_reason}")
+                # Agents hold their last state, so the metrics match a run that continued to the full runtime.
+                env.buffer.pad(num_iterations)
+                if metrics_accumulator is not None:
+                    for _ in range(num_iterations - sim_iteration - 1):
+                        metrics_accumulator.update(env.initial_states)
+                break
+
+            if plotter is not None:
+                metrics.append(calculate_all_metrics(env.initial_states[0], env.initial_states[1], config.liveness_threshold))
+            env.run_simulation(sim_iteration, controllers, logger)
+            if metrics_accumulator is not None:
+                metrics_accumulator.add_compute(env.compute_history[-1], env.solver_stats_history[-1])
+
+            # Plots
+            if sim_iteration % config.plot_rate == 0 and config.plot_live and plotter is not None:
+                plotter.plot_live(sim_iteration, scenario, env.buffer.get_state_trajectories(), env.buffer.get_control_trajectories(), metrics)
+    finally:
+        logger.flush()
+        if config.parallel_agents:
+            for controller in controllers:
+                controller.close()
+
+    x_cum = env.buffer.get_state_trajectories(num_iterations)
+    u_cum = env.buffer.get_control_trajectories(num_iterations)
     if config.plot_end and plotter is not None:
         plotter.plot(scenario, x_cum, u_cum, metrics)
     
     return x_cum, u_cum
+
+
+def run_branch(scenario, checkpoint, branch, in_worker=True):
+    controllers = branch()
+    if in_worker:
+        # The branches are already spread over processes, and pool workers cannot start their own.
+        config.parallel_agents = False
+    env = Environment(scenario.initial.copy(), scenario.goals.copy())
+    x_cum, u_cum = run_simulation(scenario, env, controllers, BlankLogger(), None, checkpoint=checkpoint)
+    return np.array(x_cum), np.array(u_cum), np.array(env.compute_history)
+
+
+# (scenario, checkpoint, branches) of a fork_simulation worker process, set by init_branch_worker.
+branch_worker_args = None
+
+def init_branch_worker(scenario, checkpoint, branches):
+    global branch_worker_args
+    branch_worker_args = (scenario, checkpoint, branches)
+
+
+def run_worker_branch(branch_idx):
+    scenario, checkpoint, branches = branch_worker_args
+    return run_branch(scenario, checkpoint, branches[branch_idx])
+
+
+def fork_simulation(scenario, checkpoint, branches, num_workers=None):
+    """Runs several continuations of one checkpoint, each in its own forked process when num_workers > 1.
+
+    Each branch is a function that returns the controllers to continue with, e.g. MPCs with other gammas. It is
+    called in the branch's process, so config changes it makes only apply to that branch (with one worker, the
+    branches run in this process one after another and such changes persist). Returns each branch's full x_cum,
+    u_cum and compute history, including the part before the checkpoint.
+
+    The workers inherit the scenario, checkpoint and branches through the fork instead of pickling them, so branches
+    can be closures. This needs the fork start method.
+    """
+    num_workers = min(len(branches), os.cpu_count()) if num_workers is None else num_workers
+    if num_workers <= 1:
+        return [run_branch(scenario, checkpoint, branch, in_worker=False) for branch in branches]
+    assert 'fork' in multiprocessing.get_all_start_methods(), "fork_simulation needs the fork start method for more than one worker."
+    # One branch per worker process, so that a branch's config changes do not leak into the next one.
+    with multiprocessing.get_context('fork').Pool(num_workers, initializer=init_branch_worker, initargs=(scenario, checkpoint, branches), maxtasksperchild=1) as pool:
+        return pool.map(run_worker_branch, range(len(branches)))
@@ -0,0 +1,55 @@
+from collections import OrderedDict
+import config
+import numpy as np
+
+class SolutionCache:
+    """Least-recently-used cache of MPC solutions, keyed by the quantized problem the MPC was asked to solve."""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries),
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+        }
+
+
+"""Quantizes an array to a hashable tuple of grid indices."""
+def quantize(values, resolution):
+    return tuple(np.round(np.asarray(values, dtype=float).ravel() / resolution).astype(int).tolist())
+
+
+# One cache per process, shared by all MPC controllers in it (and across the runs of a suite).
+solution_cache = None
+
+def get_solution_cache():
+    global solution_cache
+    if solution_cache is None:
+        solution_cache = SolutionCache(config.mpc_solution_cache_size)
+    return solution_cache
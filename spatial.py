@@ -0,0 +1,66 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class ObstacleIndex:
+    """KD-tree over a scenario's static obstacles, given as (x, y, r) tuples."""
+    def __init__(self, obstacles):
+        self.obstacles = np.array(obstacles, dtype=float).reshape(-1, 3)
+        self.max_radius = np.max(self.obstacles[:, 2]) if len(self.obstacles) > 0 else 0.0
+        self.tree = cKDTree(self.obstacles[:, :2]) if len(self.obstacles) > 0 else None
+
+    def query(self, pos, k, radius=np.inf):
+        """Returns up to k obstacles, nearest first, whose centers are within radius of pos."""
+        if self.tree is None or k == 0:
+            return self.obstacles[:0]
+
+        dists, idxs = self.tree.query(np.asarray(pos[:2], dtype=float), k=min(k, len(self.obstacles)), distance_upper_bound=radius)
+        dists, idxs = np.atleast_1d(dists), np.atleast_1d(idxs)
+        # Missing neighbors are reported with an infinite distance.
+        return self.obstacles[idxs[np.isfinite(dists)]]
+
+
+class SpatialHash:
+    """Uniform grid over the agents' positions for k-nearest-neighbor queries. Cheap enough to rebuild every tick."""
+    def __init__(self, positions, cell_size):
+        self.positions = np.asarray(positions, dtype=float)[:, :2]
+        self.cell_size = cell_size
+        self.cells = {}
+        for idx, cell in enumerate(np.floor(self.positions / cell_size).astype(int)):
+            self.cells.setdefault(tuple(cell), []).append(idx)
+
+    def get_ring(self, center, ring):
+        """Points in the cells whose Chebyshev distance to center is exactly ring."""
+        cx, cy = center
+        idxs = []
+        for dx in range(-ring, ring + 1):
+            # Interior columns only contribute their top and bottom cells.
+            dys = range(-ring, ring + 1) if abs(dx) == ring else (-ring, ring)
+            for dy in set(dys):
+                idxs += self.cells.get((cx + dx, cy + dy), [])
+        return idxs
+
+    def query(self, idx, k):
+        """Returns the indices of the k nearest other points to point idx, nearest first (ties by index)."""
+        k = min(k, len(self.positions) - 1)
+        if k <= 0:
+            return []
+
+        pos = self.positions[idx]
+        center = tuple(np.floor(pos / self.cell_size).astype(int))
+        candidates = []
+        ring = 0
+        while True:
+            candidates += [other for other in self.get_ring(center, ring) if other != idx]
+            if len(candidates) == len(self.positions) - 1:
+                break
+            # Points in unsearched cells are at least ring*cell_size away.
+            if len(candidates) >= k:
+                dists = np.linalg.norm(self.positions[candidates] - pos, axis=1)
+                if np.sort(dists)[k - 1] <= ring * self.cell_size:
+                    break
+            ring += 1
+
+        dists = np.linalg.norm(self.positions[candidates] - pos, axis=1)
+        order = np.lexsort((candidates, dists))
+        return [candidates[i] for i in order[:k]]
@@ -25,7 +25,19 @@ IDXS = {
     'path_dev_0': 10,
     'path_dev_1': 11,
     'avg_compute_0': 12,
-    'avg_compute_1': 13
+    'avg_compute_1': 13,
+    'avg_iters_0': 14,
+    'avg_iters_1': 15,
+    'max_iters_0': 16,
+    'max_iters_1': 17,
+    'fail_rate_0': 18,
+    'fail_rate_1': 19,
+    'avg_nlp_eval_time_0': 20,
+    'avg_nlp_eval_time_1': 21,
+    'avg_lin_alg_time_0': 22,
+    'avg_lin_alg_time_1': 23,
+    'fallback_rate_0': 24,
+    'fallback_rate_1': 25,
 }
 
 # Get num sims
@@ -69,3 +81,18 @@ print(f"Slower TTG: {avg_slower_ttg} +/- {err_slower_ttg}")
 print(f"Delta Velocity: {avg_delta_v} +/- {err_delta_v}")
 print(f"Path Deviation: {avg_delta_path} +/- {err_delta_path}")
 print(f"Compute Time: {avg_compute_time} +/- {err_compute_time}")
+
+# Solver stats, only in results that were saved with them (and not for learned agents, which have no solver).
+if metrics.shape[1] > IDXS['avg_lin_alg_time_1'] and not np.all(np.isnan(metrics[:, IDXS['avg_iters_0']])):
+    iters = metrics[:, [IDXS['avg_iters_0'], IDXS['avg_iters_1']]].flatten()
+    max_iters = np.nanmax(metrics[:, [IDXS['max_iters_0'], IDXS['max_iters_1']]])
+    fail_rates = metrics[:, [IDXS['fail_rate_0'], IDXS['fail_rate_1']]]
+    failing_sims = np.flatnonzero(np.any(fail_rates > 0, axis=1))
+    nlp_eval_times = metrics[:, [IDXS['avg_nlp_eval_time_0'], IDXS['avg_nlp_eval_time_1']]].flatten() * 1000.0
+    lin_alg_times = metrics[:, [IDXS['avg_lin_alg_time_0'], IDXS['avg_lin_alg_time_1']]].flatten() * 1000.0
+    print(f"Solver Iterations: {np.nanmean(iters)} (max {max_iters})")
+    print(f"Failed Solve Rate: {np.nanmean(fail_rates)}, simulations with failed solves: {failing_sims.tolist()}")
+    print(f"NLP Evaluation Time: {np.nanmean(nlp_eval_times)}, Linear Algebra Time: {np.nanmean(lin_alg_times)}")
+    if metrics.shape[1] > IDXS['fallback_rate_1']:
+        fallback_rates = metrics[:, [IDXS['fallback_rate_0'], IDXS['fallback_rate_1']]]
+        print(f"Budget Fallback Rate: {np.nanmean(fallback_rates)}")
@@ -0,0 +1,61 @@
+import os
+import itertools
+import pytest
+import config
+import numpy as np
+from conftest import REPO_DIR
+from data_logger import DataLogger
+from util import perturb_model_input, perturb_model_input_batch, calculate_all_metrics, calculate_liveness_batch
+
+FIXTURE_LOGS = [
+    os.path.join(REPO_DIR, 'datasets', 'doorway_scenario_suite_5', 's_doorway_-0.5_0.3_2.0_0.15_False_0.0_l_0_faster_off0.json'),
+    os.path.join(REPO_DIR, 'datasets', 'intersection_scenario_suite2', sorted(os.listdir(os.path.join(REPO_DIR, 'datasets', 'intersection_scenario_suite2')))[0]),
+]
+# Every few ticks of each log, for both agents.
+TICK_STRIDE = 8
+NUM_OPPONENTS = [1, 3, 6, 40]
+FLAG_COMBINATIONS = list(itertools.product([False, True], repeat=7))
+
+
+def get_fixture_samples(filename):
+    data = DataLogger.read_data(filename)
+    iterations = data['iterations'][::TICK_STRIDE]
+    ego_states = np.array([iteration['states'][agent_idx] for iteration in iterations for agent_idx in range(2)])
+    opp_states = np.array([iteration['states'][1 - agent_idx] for iteration in iterations for agent_idx in range(2)])
+    goals = np.array([iteration['goals'][agent_idx] for iteration in iterations for agent_idx in range(2)])
+    # Degenerate samples: stopped agents, agents on top of each other and parallel headings.
+    ego_states = np.concatenate([ego_states, [[0.0, 0.0, 0.0, 0.0], [0.5, 0.5, 1.0, 0.2], [0.0, 0.0, 0.0, 0.3]]])
+    opp_states = np.concatenate([opp_states, [[1.0, 0.0, np.pi, 0.0], [0.5, 0.5, -1.0, 0.2], [1.0, 0.0, 0.0, 0.3]]])
+    goals = np.concatenate([goals, goals[:3]])
+    return ego_states, opp_states, goals, data['obstacles']
+
+
+"""Features of each sample through the scalar perturb_model_input, as DataGenerator used to build them."""
+def get_scalar_features(ego_states, opp_states, goals, obstacles, num_opponents, flags):
+    features = []
+    with np.errstate(all='ignore'):
+        for ego_state, opp_state, goal in zip(ego_states, opp_states, goals):
+            metrics = calculate_all_metrics(ego_state, opp_state, config.liveness_threshold)
+            features.append(np.array(perturb_model_input(ego_state.tolist() + opp_state.tolist(), obstacles, num_opponents, *flags, goal.tolist(), metrics)))
+    return np.array(features).reshape(len(ego_states), -1)
+
+
+@pytest.mark.parametrize('filename', FIXTURE_LOGS)
+def test_batch_features_match_scalar(filename):
+    ego_states, opp_states, goals, obstacles = get_fixture_samples(filename)
+    for num_opponents in NUM_OPPONENTS:
+        for flags in FLAG_COMBINATIONS:
+            expected = get_scalar_features(ego_states, opp_states, goals, obstacles, num_opponents, flags)
+            features = perturb_model_input_batch(ego_states, opp_states, goals, obstacles, num_opponents, *flags)
+            assert np.array_equal(features, expected, equal_nan=True), (num_opponents, flags)
+
+
+@pytest.mark.parametrize('filename', FIXTURE_LOGS)
+def test_batch_liveness_matches_scalar(filename):
+    ego_states, opp_states, _, _ = get_fixture_samples(filename)
+    with np.errstate(all='ignore'):
+        metrics = [calculate_all_metrics(ego_state, opp_state, config.liveness_threshold) for ego_state, opp_state in zip(ego_states, opp_states)]
+    l, intersecting, is_live = calculate_liveness_batch(ego_states, opp_states, config.liveness_threshold)
+    assert np.array_equal(l, [m[0] for m in metrics], equal_nan=True)
+    assert np.array_equal(intersecting, [m[-2] for m in metrics])
+    assert np.array_equal(is_live, [m[-1] for m in metrics])
@@ -0,0 +1,77 @@
+import os
+import json
+import config
+import numpy as np
+from conftest import REPO_DIR
+from data_logger import DataGenerator
+from trajectory_store import data_to_arrays, write_run
+from util import perturb_model_input, calculate_all_metrics
+
+FIXTURE_LOGS = [
+    os.path.join(REPO_DIR, 'datasets', 'doorway_scenario_suite_5', 's_doorway_-0.5_0.3_2.0_0.15_False_0.0_l_0_faster_off0.json'),
+    os.path.join(REPO_DIR, 'datasets', 'doorway_scenario_suite_5', 's_doorway_-0.5_0.3_2.0_0.15_False_0.3_l_0_faster_off0.json'),
+]
+AGENT_IDXS = [0, 1]
+# x_is_d_goal, add_liveness_as_input, fixed_liveness_input, num_opponents, static_obs_xy_only, ego_frame_inputs,
+# add_new_liveness_as_input, add_dist_to_static_obs
+FEATURE_ARGS = (True, True, False, 4, True, True, True, True)
+
+
+"""Inputs and outputs the way DataGenerator built them from the parsed JSON logs, one sample at a time."""
+def get_reference_data(filenames, agent_idxs):
+    x_is_d_goal, add_liveness_as_input, fixed_liveness_input, num_opponents, static_obs_xy_only, ego_frame_inputs, add_new_liveness_as_input, add_dist_to_static_obs = FEATURE_ARGS
+    inputs, outputs = [], []
+    for filename in filenames:
+        with open(filename) as f:
+            data_stream = json.load(f)
+        for iteration in data_stream['iterations']:
+            for agent_idx in agent_idxs:
+                if 'use_for_training' in iteration and not iteration['use_for_training'][agent_idx]:
+                    continue
+                with np.errstate(all='ignore'):
+                    metrics = calculate_all_metrics(np.array(iteration['states'][agent_idx]), np.array(iteration['states'][1 - agent_idx]), config.liveness_threshold)
+                    inputs.append(np.array(perturb_model_input(iteration['states'][agent_idx] + iteration['states'][1 - agent_idx], data_stream['obstacles'], num_opponents, x_is_d_goal, add_liveness_as_input, fixed_liveness_input, static_obs_xy_only, ego_frame_inputs, add_new_liveness_as_input, add_dist_to_static_obs, iteration['goals'][agent_idx], metrics)))
+                outputs.append(iteration['controls'][agent_idx])
+    return np.array(inputs), np.array(outputs)
+
+
+def convert_fixture_logs(tmp_path):
+    run_dirnames = []
+    for idx, filename in enumerate(FIXTURE_LOGS):
+        with open(filename) as f:
+            data = json.load(f)
+        run_dirnames.append(str(tmp_path / f'{idx}.run'))
+        write_run(run_dirnames[-1], data_to_arrays(data))
+    return run_dirnames
+
+
+def check_generator(filenames):
+    generator = DataGenerator(filenames, *FEATURE_ARGS)
+    expected_inputs, expected_outputs = get_reference_data(FIXTURE_LOGS, AGENT_IDXS)
+    inputs, _, _ = generator.get_inputs(AGENT_IDXS, normalize=False)
+    outputs, _, _ = generator.get_outputs(AGENT_IDXS, normalize=False)
+    assert np.array_equal(inputs, expected_inputs, equal_nan=True)
+    assert np.array_equal(outputs, expected_outputs)
+    return generator
+
+
+def test_json_logs_match_reference():
+    check_generator(FIXTURE_LOGS)
+
+
+def test_memory_mapped_runs_match_reference(tmp_path):
+    generator = check_generator(convert_fixture_logs(tmp_path))
+    assert all(isinstance(run['states'], np.memmap) for run in generator.runs)
+
+
+def test_cached_training_data_matches(tmp_path):
+    generator = DataGenerator(FIXTURE_LOGS, *FEATURE_ARGS)
+    uncached = generator.get_training_data(AGENT_IDXS)
+    cache_dir = str(tmp_path / 'feature_cache')
+    generator.get_training_data(AGENT_IDXS, cache_dir)
+    # A new generator reads the cache entry without loading the logs.
+    generator = DataGenerator(FIXTURE_LOGS, *FEATURE_ARGS)
+    cached = generator.get_training_data(AGENT_IDXS, cache_dir)
+    assert generator.loaded_runs is None
+    for cached_array, array in zip(cached, uncached):
+        assert np.array_equal(cached_array, array, equal_nan=True)
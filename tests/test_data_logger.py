@@ -0,0 +1,72 @@
+import os
+import json
+import pytest
+import config
+import numpy as np
+from conftest import REPO_DIR
+from data_logger import DataLogger
+from scenarios import DoorwayScenario
+from environment import Environment
+from simulation import run_simulation
+from blank_controller import BlankController
+
+FIXTURE_LOG = os.path.join(REPO_DIR, 'datasets', 'doorway_scenario_suite_5', 's_doorway_-0.5_0.3_2.0_0.15_False_0.0_l_0_faster_off0.json')
+
+
+def write_log(filename, data, logger_format, monkeypatch):
+    monkeypatch.setattr(config, 'logger_format', logger_format)
+    logger = DataLogger(filename)
+    logger.set_obstacles(data['obstacles'])
+    for iteration in data['iterations']:
+        logger.log_iteration(np.array(iteration['states']), np.array(iteration['goals']), np.array(iteration['controls']), iteration['use_for_training'], iteration['compute_times'])
+    logger.flush()
+
+
+@pytest.mark.parametrize('logger_format', ['json', 'jsonl'])
+def test_log_reads_back_as_the_json_document(tmp_path, monkeypatch, logger_format):
+    with open(FIXTURE_LOG) as f:
+        data = json.load(f)
+    filename = str(tmp_path / f'log.{logger_format}')
+    write_log(filename, data, logger_format, monkeypatch)
+    assert DataLogger.read_data(filename) == data
+    assert DataLogger.read_data(FIXTURE_LOG) == data
+
+
+class InterruptingController(BlankController):
+    def __init__(self, interrupt_time):
+        super().__init__()
+        self.interrupt_time = interrupt_time
+
+    def make_step(self, timestamp, initial_state):
+        if timestamp >= self.interrupt_time:
+            raise KeyboardInterrupt
+        return super().make_step(timestamp, initial_state)
+
+
+def test_interrupted_run_keeps_logged_ticks(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'simulator_backend', 'numpy')
+    monkeypatch.setattr(config, 'parallel_agents', False)
+    monkeypatch.setattr(config, 'plot_end', False)
+    monkeypatch.setattr(config, 'logger_format', 'jsonl')
+    scenario = DoorwayScenario()
+    env = Environment(scenario.initial.copy(), scenario.goals.copy())
+    filename = str(tmp_path / 'log.jsonl')
+    logger = DataLogger(filename)
+    logger.set_obstacles(scenario.obstacles.copy())
+    controllers = [InterruptingController(3 * config.sim_ts), BlankController()]
+    with pytest.raises(KeyboardInterrupt):
+        run_simulation(scenario, env, controllers, logger, None)
+    assert len(DataLogger.read_data(filename)['iterations']) == 3
+
+
+def test_default_format_is_one_json_document(tmp_path):
+    with open(FIXTURE_LOG) as f:
+        data = json.load(f)
+    filename = str(tmp_path / 'log.json')
+    logger = DataLogger(filename)
+    logger.set_obstacles(data['obstacles'])
+    iteration = data['iterations'][0]
+    logger.log_iteration(np.array(iteration['states']), np.array(iteration['goals']), np.array(iteration['controls']), iteration['use_for_training'], iteration['compute_times'])
+    # Readers of the old logs load the file with json.load.
+    with open(filename) as f:
+        assert json.load(f) == {'obstacles': data['obstacles'], 'iterations': [iteration]}
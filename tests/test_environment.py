@@ -0,0 +1,61 @@
+import numpy as np
+import config
+from scenarios import DoorwayScenario
+from environment import Environment
+from data_logger import BlankLogger
+from blank_controller import BlankController
+
+
+class RecordingController(BlankController):
+    def reset_state(self, initial_state, opp_state):
+        self.opp_state = opp_state
+        self.opp_states = getattr(self, 'opp_states', []) + [np.array(opp_state)]
+
+
+def test_agent_without_neighbors_gets_absent_opponent(monkeypatch):
+    monkeypatch.setattr(config, 'simulator_backend', 'numpy')
+    scenario = DoorwayScenario()
+    env = Environment(scenario.initial[:1].copy(), scenario.goals[:1].copy())
+    controller = RecordingController()
+    env.run_simulation(0, [controller], BlankLogger())
+    assert controller.opp_state[0] - scenario.initial[0, 0] == config.absent_opponent_dist
+    assert controller.opp_state[3] == 0.0
+
+
+def test_two_agents_see_each_other_as_opponent(monkeypatch):
+    monkeypatch.setattr(config, 'simulator_backend', 'numpy')
+    scenario = DoorwayScenario()
+    env = Environment(scenario.initial.copy(), scenario.goals.copy())
+    controllers = [RecordingController(), RecordingController()]
+    for sim_iteration in range(3):
+        env.run_simulation(sim_iteration, controllers, BlankLogger())
+    for agent_idx, controller in enumerate(controllers):
+        assert np.array_equal(controller.opp_states, env.history[:-1, 1 - agent_idx])
+
+
+class ConstantSpeedController(RecordingController):
+    def __init__(self, speed):
+        super().__init__()
+        self.speed = speed
+
+    def make_step(self, timestamp, initial_state):
+        return np.array([[self.speed], [0.0]])
+
+
+def test_single_integrator_opponent_speed_between_ticks(monkeypatch):
+    monkeypatch.setattr(config, 'simulator_backend', 'numpy')
+    scenario = DoorwayScenario()
+    env = Environment(scenario.initial.copy(), scenario.goals.copy())
+    # Stepped as single integrators, with the controllers called on every plant step within the tick.
+    monkeypatch.setattr(config, 'dynamics', config.DynamicsModel.SINGLE_INTEGRATOR)
+    monkeypatch.setattr(config, 'plant_ts', config.sim_ts / 4)
+    monkeypatch.setattr(config, 'controller_periods', {'ConstantSpeedController': config.sim_ts / 4})
+    speeds = [0.3, 0.1]
+    controllers = [ConstantSpeedController(speed) for speed in speeds]
+    for sim_iteration in range(3):
+        env.run_simulation(sim_iteration, controllers, BlankLogger())
+    for agent_idx, controller in enumerate(controllers):
+        opp_speeds = [opp_state[-1] for opp_state in controller.opp_states]
+        assert len(opp_speeds) == 12
+        assert opp_speeds[0] == 0.0
+        assert np.allclose(opp_speeds[1:], speeds[1 - agent_idx])
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import run_experiments
+from gen_policy_table import GRIDS
+from explicit_policy_controller import PolicyTable, get_policy_features
+
+# A 2 x 3 grid over the first two features. The other features have a single grid point.
+AXES = [np.array([0.0, 1.0]), np.array([0.0, 1.0, 2.0])] + [np.array([0.0])] * 6
+FEATURES = np.array([0.5, 0.5, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0])
+
+
+def get_table(failed_idxs):
+    controls = np.zeros((2, 3) + (1,) * 6 + (2,))
+    controls[1, 0, ..., 0] = 1.0
+    controls[0, 1, ..., 0] = 100.0
+    controls[1, 1, ..., 0] = 3.0
+    success = np.ones(controls.shape[:-1], dtype=bool)
+    for idx in failed_idxs:
+        success[idx] = False
+    return PolicyTable(AXES, controls, success)
+
+
+def test_failed_corners_are_left_out():
+    assert np.allclose(get_table([]).interpolate(FEATURES), [26.0, 0.0])
+    # The (0, 1) solve did not converge, so the other three corners share its weight.
+    assert np.allclose(get_table([(0, 1)]).interpolate(FEATURES), [4.0 / 3.0, 0.0])
+
+
+def test_cell_without_converged_corners():
+    table = get_table([(0, 0), (1, 0), (0, 1), (1, 1)])
+    # Falls back to the nearest converged grid point, (0, 2) or (1, 2).
+    assert np.allclose(table.interpolate(FEATURES), [0.0, 0.0])
+    with pytest.raises(ValueError):
+        get_table([(i, j) for i in range(2) for j in range(3)]).interpolate(FEATURES)
+
+
+@pytest.mark.parametrize('success', [None, np.array([[True, False, True], [True, True, False]]).reshape((2, 3) + (1,) * 6)])
+def test_save_and_load(tmp_path, success):
+    table = get_table([])
+    table.success = success
+    filename = str(tmp_path / 'table.npz')
+    table.save(filename, scenario='Doorway', agent_idx=0)
+    loaded = PolicyTable.load(filename)
+    assert np.array_equal(loaded.controls, table.controls)
+    if success is None:
+        assert loaded.success is None
+    else:
+        assert np.array_equal(loaded.success, success)
+    assert loaded.metadata['scenario'] == 'Doorway'
+
+
+@pytest.mark.parametrize('scenario_type, agent_idx', list(GRIDS))
+def test_grid_covers_start_and_goal(scenario_type, agent_idx):
+    scenario = run_experiments.get_scenario(scenario_type)
+    goal = scenario.goals[agent_idx]
+    axes = GRIDS[(scenario_type, agent_idx)]
+    # Both agents at their start, and both at their goal.
+    for states in [scenario.initial, scenario.goals]:
+        features = get_policy_features(states[agent_idx], states[1 - agent_idx], goal)
+        # The speeds are covered by construction.
+        for feature_idx in [0, 1, 2, 4, 5, 6]:
+            axis = axes[feature_idx]
+            if len(axis) == 1:
+                # A fixed feature only has to be close, e.g. the Doorway opponent starts turned towards its goal.
+                assert abs(features[feature_idx] - axis[0]) <= np.pi / 8
+            else:
+                assert axis[0] - 1e-9 <= features[feature_idx] <= axis[-1] + 1e-9
@@ -0,0 +1,53 @@
+import os
+from types import SimpleNamespace
+import numpy as np
+from conftest import REPO_DIR
+from data_logger import DataLogger
+from metrics import MetricsAccumulator, gather_all_metric_data, summarize_solver_stats, load_desired_path
+
+FIXTURE_LOG = os.path.join(REPO_DIR, 'datasets', 'doorway_scenario_suite_5', 's_doorway_-0.5_0.3_2.0_0.15_False_0.0_l_0_faster_off0.json')
+DESIRED_PATHS_DIR = os.path.join(REPO_DIR, 'experiment_results', 'desired_paths')
+
+
+def get_fixture_run():
+    data = DataLogger.read_data(FIXTURE_LOG)
+    states = np.array([iteration['states'] for iteration in data['iterations']])
+    goals = np.array(data['iterations'][0]['goals'])
+    scenario = SimpleNamespace(initial=states[0], goals=goals, obstacles=data['obstacles'])
+    compute_history = np.random.default_rng(0).uniform(0.0, 0.1, (len(states), 2))
+    return scenario, states, compute_history
+
+
+def check_accumulator(desired_path_0=None, desired_path_1=None):
+    scenario, states, compute_history = get_fixture_run()
+    expected = gather_all_metric_data(scenario, states[:, 0], states[:, 1], scenario.goals, compute_history, desired_path_0=desired_path_0, desired_path_1=desired_path_1)
+    accumulator = MetricsAccumulator(scenario, scenario.goals, desired_path_0=desired_path_0, desired_path_1=desired_path_1)
+    for tick_states, compute_times in zip(states, compute_history):
+        accumulator.update(tick_states)
+        accumulator.add_compute(compute_times)
+    assert np.allclose(accumulator.get_metric_data(), expected, rtol=1e-12, atol=0.0)
+
+
+def test_accumulator_matches_gather_all_metric_data():
+    check_accumulator()
+
+
+def test_accumulator_matches_with_desired_paths():
+    check_accumulator(load_desired_path(os.path.join(DESIRED_PATHS_DIR, 'Doorway_MPC_0.json'), 0), load_desired_path(os.path.join(DESIRED_PATHS_DIR, 'Doorway_MPC_1.json'), 1))
+
+
+def test_accumulator_with_single_point_desired_path():
+    scenario, _, _ = get_fixture_run()
+    check_accumulator(scenario.goals[:1, :2], scenario.goals[1:, :2])
+
+
+def get_stats(fallback, success=False):
+    return {'iter_count': 10, 'success': success, 't_nlp_eval': 0.01, 't_linear_algebra': 0.02, 'fallback': fallback}
+
+
+def test_fallback_rate_counts_applied_fallbacks_only():
+    solver_stats_history = [[get_stats(None, success=True)], [get_stats('iterate')], [get_stats('previous_plan')], [get_stats('unavailable')]]
+    avg_iters, max_iters, fail_rate, _, _, fallback_rate = summarize_solver_stats(solver_stats_history, 0)
+    assert fail_rate == 0.75
+    assert fallback_rate == 0.5
+
@@ -0,0 +1,73 @@
+import os
+import json
+import numpy as np
+import config
+from conftest import REPO_DIR
+from mpc_cbf import MPC
+from scenarios import DoorwayScenario
+from environment import Environment
+from data_logger import BlankLogger
+from simulation import run_simulation
+
+# Controls of DoorwayScenario() with the default config over the first 3 s, from the baseline commit, which rebuilt the
+# NLP every tick and left the liveness constraint out on ticks where it is not active.
+BASELINE_CONTROLS = os.path.join(REPO_DIR, 'tests', 'data', 'doorway_baseline_controls.json')
+
+
+class OmittedLivenessMPC(MPC):
+    """Builds the NLP like the baseline: the liveness constraint is only added on ticks where it is active."""
+    def add_liveliness_constraint(self, mpc):
+        if self.liveness_params['live_active'] == 1.0:
+            super().add_liveliness_constraint(mpc)
+
+
+class NearbyObstaclesMPC(MPC):
+    """Builds the NLP like the baseline, with constraints for only the obstacles that culling puts in the slots."""
+    def set_states(self, initial_state, opp_state):
+        super().set_states(initial_state, opp_state)
+        self.static_obs = [(obs_x, obs_y, obs_r) for obs_x, obs_y, obs_r, active in self.get_obs_slot_values() if active == 1.0]
+
+
+def run_doorway(monkeypatch, controller_class, runtime):
+    monkeypatch.setattr(config, 'runtime', runtime)
+    monkeypatch.setattr(config, 'plot_end', False)
+    scenario = DoorwayScenario()
+    env = Environment(scenario.initial.copy(), scenario.goals.copy())
+    controllers = [controller_class(agent_idx=agent_idx, opp_gamma=config.opp_gamma, obs_gamma=config.obs_gamma, live_gamma=config.liveliness_gamma, liveness_thresh=config.liveness_threshold, goal=scenario.goals[agent_idx, :], static_obs=scenario.obstacles.copy()) for agent_idx in range(2)]
+    _, u_cum = run_simulation(scenario, env, controllers, BlankLogger(), None)
+    iter_counts = [[stats['iter_count'] for stats in tick_stats] for tick_stats in env.solver_stats_history]
+    return np.array(u_cum), iter_counts
+
+
+def test_default_config_matches_baseline(monkeypatch):
+    with open(BASELINE_CONTROLS) as f:
+        baseline = json.load(f)
+    u_cum, _ = run_doorway(monkeypatch, MPC, baseline['runtime'])
+    assert np.allclose(u_cum, baseline['controls'], rtol=0.0, atol=1e-9)
+
+
+def test_inactive_liveness_matches_omitted_constraint(monkeypatch):
+    # The liveness constraint is not active on the first tick.
+    u_cum, iter_counts = run_doorway(monkeypatch, MPC, 1.0)
+    ref_u_cum, ref_iter_counts = run_doorway(monkeypatch, OmittedLivenessMPC, 1.0)
+    assert iter_counts == ref_iter_counts
+    assert np.allclose(u_cum, ref_u_cum, rtol=0.0, atol=1e-13)
+
+
+def test_empty_obstacle_slots_match_omitted_constraints(monkeypatch):
+    monkeypatch.setattr(config, 'mpc_cull_static_obs', True)
+    u_cum, iter_counts = run_doorway(monkeypatch, MPC, 1.0)
+    monkeypatch.setattr(config, 'mpc_cull_static_obs', False)
+    ref_u_cum, ref_iter_counts = run_doorway(monkeypatch, NearbyObstaclesMPC, 1.0)
+    assert iter_counts == ref_iter_counts
+    assert np.allclose(u_cum, ref_u_cum, rtol=0.0, atol=1e-13)
+
+
+def test_empty_neighbor_slots_match_opponent_only(monkeypatch):
+    # With two agents the extra neighbor slot stays empty, so the NLP is the two-agent one of the baseline.
+    monkeypatch.setattr(config, 'num_neighbors', 2)
+    u_cum, iter_counts = run_doorway(monkeypatch, MPC, 1.0)
+    monkeypatch.setattr(config, 'num_neighbors', 1)
+    ref_u_cum, ref_iter_counts = run_doorway(monkeypatch, MPC, 1.0)
+    assert iter_counts == ref_iter_counts
+    assert np.allclose(u_cum, ref_u_cum, rtol=0.0, atol=1e-13)
@@ -0,0 +1,54 @@
+import numpy as np
+import config
+import run_experiments
+from run_experiments import get_mpc_live_controllers, get_scenario
+from qp_mpc_cbf import QPMPC
+from environment import Environment
+
+
+class FailingSolver:
+    """Wraps a QP solver and reports every solve as failed."""
+    def __init__(self, solver):
+        self.solver = solver
+
+    def __call__(self, **kwargs):
+        return self.solver(**kwargs)
+
+    def stats(self):
+        return dict(self.solver.stats(), success=False)
+
+
+def test_failed_solve_applies_previous_plan(monkeypatch):
+    monkeypatch.setattr(config, 'simulator_backend', 'numpy')
+    monkeypatch.setattr(run_experiments, 'SCENARIO', 'Doorway')
+    scenario = get_scenario('Doorway')
+    env = Environment(scenario.initial.copy(), scenario.goals.copy())
+    controllers = get_mpc_live_controllers(scenario, True, controller_class=QPMPC)
+    for controller in controllers:
+        controller.initialize_controller(env)
+    controller = controllers[0]
+    x0 = scenario.initial[0].copy()
+    controller.reset_state(x0, scenario.initial[1].copy())
+    controller.make_step(0.0, x0)
+    assert controller.solver_stats['success'] and controller.solver_stats['fallback'] is None
+    X_prev, U_prev = controller.prev_plan
+
+    controller.qp_solver = FailingSolver(controller.qp_solver)
+    u1 = controller.make_step(config.sim_ts, x0)
+    assert controller.solver_stats['fallback'] == 'previous_plan'
+    assert np.array_equal(u1.ravel(), U_prev[:, 1])
+    assert np.array_equal(controller.prev_plan[0][:, :-1], X_prev[:, 1:])
+
+
+def test_failed_first_solve_has_no_plan(monkeypatch):
+    monkeypatch.setattr(run_experiments, 'SCENARIO', 'Doorway')
+    scenario = get_scenario('Doorway')
+    env = Environment(scenario.initial.copy(), scenario.goals.copy())
+    controller = get_mpc_live_controllers(scenario, True, controller_class=QPMPC)[0]
+    controller.initialize_controller(env)
+    controller.qp_solver = FailingSolver(controller.qp_solver)
+    x0 = scenario.initial[0].copy()
+    controller.reset_state(x0, scenario.initial[1].copy())
+    controller.make_step(0.0, x0)
+    assert controller.solver_stats['fallback'] == 'unavailable'
+    assert controller.prev_plan is None
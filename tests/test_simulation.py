@@ -0,0 +1,31 @@
+import numpy as np
+import config
+import run_experiments
+from run_experiments import get_mpc_live_controllers, get_scenario
+from environment import Environment
+from data_logger import BlankLogger
+from simulation import run_simulation, fork_simulation
+
+
+# Set by run_experiments.set_mpc_live_config.
+LIVE_CONFIG = ['liveliness', 'mpc_p0_faster', 'opp_gamma', 'obs_gamma', 'liveliness_gamma', 'liveness_threshold', 'runtime', 'mpc_use_new_liveness_filter']
+
+
+def test_forked_branches_match_sequential_branches(monkeypatch):
+    for name in LIVE_CONFIG:
+        monkeypatch.setattr(config, name, getattr(config, name))
+    monkeypatch.setattr(config, 'runtime', 0.8)
+    monkeypatch.setattr(config, 'plot_end', False)
+    monkeypatch.setattr(run_experiments, 'SCENARIO', 'Doorway')
+    scenario = get_scenario('Doorway')
+    env = Environment(scenario.initial.copy(), scenario.goals.copy())
+    run_simulation(scenario, env, get_mpc_live_controllers(scenario, True), BlankLogger(), None, checkpoint_iterations=[2])
+    # Closures, which only reach the workers through the fork.
+    branches = [lambda: get_mpc_live_controllers(scenario, True), lambda: get_mpc_live_controllers(scenario, False)]
+
+    forked = fork_simulation(scenario, env.checkpoints[2], branches, num_workers=2)
+    sequential = fork_simulation(scenario, env.checkpoints[2], branches, num_workers=1)
+    for (x_cum, u_cum, _), (seq_x_cum, seq_u_cum, _) in zip(forked, sequential):
+        assert np.array_equal(x_cum, seq_x_cum) and np.array_equal(u_cum, seq_u_cum)
+    # The first branch continues the run exactly.
+    assert np.array_equal(forked[0][0], env.buffer.get_state_trajectories(4))
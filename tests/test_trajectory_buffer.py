@@ -0,0 +1,74 @@
+import os
+import numpy as np
+import config
+from conftest import REPO_DIR
+from data_logger import DataLogger
+from trajectory_buffer import TrajectoryBuffer
+
+FIXTURE_LOG = os.path.join(REPO_DIR, 'datasets', 'doorway_scenario_suite_5', 's_doorway_-0.5_0.3_2.0_0.15_False_0.0_l_0_faster_off0.json')
+
+
+def get_fixture_ticks():
+    data = DataLogger.read_data(FIXTURE_LOG)
+    states = np.array([iteration['states'] for iteration in data['iterations']])
+    controls = np.array([iteration['controls'] for iteration in data['iterations']])
+    compute_times = np.random.default_rng(0).uniform(0.0, 0.1, (len(states), states.shape[1]))
+    return states, controls, compute_times
+
+
+"""x_cum / u_cum as run_simulation built them from per-tick lists before the buffer, stopping after num_ticks ticks
+and holding the last state for the rest of num_iterations."""
+def accumulate_lists(states, controls, num_ticks, num_iterations):
+    num_agents = states.shape[1]
+    x_cum = [[] for _ in range(num_agents)]
+    u_cum = [[] for _ in range(num_agents)]
+    for tick in range(num_ticks):
+        for agent_idx in range(num_agents):
+            x_cum[agent_idx].append(states[tick, agent_idx])
+            u_cum[agent_idx].append(controls[tick, agent_idx])
+    if num_ticks < num_iterations:
+        for agent_idx in range(num_agents):
+            x_cum[agent_idx].append(states[num_ticks, agent_idx])
+            x_cum[agent_idx] += [x_cum[agent_idx][-1]] * (num_iterations - len(x_cum[agent_idx]))
+            u_cum[agent_idx] += [np.zeros(config.num_controls)] * (num_iterations - len(u_cum[agent_idx]))
+    return np.array(x_cum), np.array(u_cum)
+
+
+def fill_buffer(states, controls, compute_times, num_ticks, capacity):
+    buffer = TrajectoryBuffer(states[0], capacity)
+    for tick in range(num_ticks):
+        buffer.record_tick(controls[tick], compute_times[tick], states[tick + 1])
+    return buffer
+
+
+def test_buffer_matches_list_accumulation():
+    states, controls, compute_times = get_fixture_ticks()
+    num_iterations = len(states) - 1
+    buffer = fill_buffer(states, controls, compute_times, num_iterations, num_iterations)
+    x_cum, u_cum = accumulate_lists(states, controls, num_iterations, num_iterations)
+    assert np.array_equal(buffer.get_state_trajectories(num_iterations), x_cum)
+    assert np.array_equal(buffer.get_control_trajectories(num_iterations), u_cum)
+    assert np.array_equal(buffer.history, states)
+    assert np.array_equal(buffer.compute_history, compute_times[:num_iterations])
+
+
+def test_padding_matches_early_termination():
+    states, controls, compute_times = get_fixture_ticks()
+    num_iterations, num_ticks = len(states) - 1, 25
+    buffer = fill_buffer(states, controls, compute_times, num_ticks, num_iterations)
+    buffer.pad(num_iterations)
+    x_cum, u_cum = accumulate_lists(states, controls, num_ticks, num_iterations)
+    assert np.array_equal(buffer.get_state_trajectories(num_iterations), x_cum)
+    assert np.array_equal(buffer.get_control_trajectories(num_iterations), u_cum)
+    # Padding does not count as ticks.
+    assert buffer.num_ticks == num_ticks and len(buffer.history) == num_ticks + 1
+
+
+def test_buffer_grows_past_capacity():
+    states, controls, compute_times = get_fixture_ticks()
+    num_iterations = len(states) - 1
+    buffer = fill_buffer(states, controls, compute_times, num_iterations, 4)
+    assert buffer.controls.shape[0] >= num_iterations
+    assert np.array_equal(buffer.history, states)
+    assert np.array_equal(buffer.get_control_trajectories(), np.moveaxis(controls[:num_iterations], 0, 1))
+    assert np.array_equal(buffer.compute_history, compute_times[:num_iterations])
@@ -0,0 +1,67 @@
+import os
+import json
+import numpy as np
+from conftest import REPO_DIR
+from data_logger import DataLogger, DataGenerator
+from trajectory_store import data_to_arrays, write_run, read_run, get_run_dirname
+
+FIXTURE_LOG = os.path.join(REPO_DIR, 'datasets', 'doorway_scenario_suite_5', 's_doorway_-0.5_0.3_2.0_0.15_False_0.0_l_0_faster_off0.json')
+
+
+def write_fixture_run(tmp_path):
+    with open(FIXTURE_LOG) as f:
+        data = json.load(f)
+    run_dirname = str(tmp_path / 'fixture.run')
+    write_run(run_dirname, data_to_arrays(data))
+    return data, run_dirname
+
+
+def test_run_dir_matches_json_log(tmp_path):
+    data, run_dirname = write_fixture_run(tmp_path)
+    arrays, meta = read_run(run_dirname, mmap_mode='r')
+    assert meta['num_iterations'] == len(data['iterations'])
+    assert np.array_equal(arrays['states'], [iteration['states'] for iteration in data['iterations']])
+    assert np.array_equal(arrays['goals'], [iteration['goals'] for iteration in data['iterations']])
+    assert np.array_equal(arrays['controls'], [iteration['controls'] for iteration in data['iterations']])
+    assert np.array_equal(arrays['use_for_training'], [iteration['use_for_training'] for iteration in data['iterations']])
+    # Compute times are stored as float32.
+    assert np.allclose(arrays['compute_times'], [iteration['compute_times'] for iteration in data['iterations']], rtol=1e-6)
+    assert np.array_equal(arrays['obstacles'], data['obstacles'])
+
+    read_data = DataLogger.read_data(run_dirname)
+    assert read_data['obstacles'] == arrays['obstacles'].tolist()
+    for iteration, read_iteration in zip(data['iterations'], read_data['iterations']):
+        for key in ['states', 'goals', 'controls', 'use_for_training']:
+            assert read_iteration[key] == iteration[key]
+
+
+def test_run_dir_is_used_only_when_up_to_date(tmp_path):
+    log_filename = str(tmp_path / 'fixture.json')
+    with open(FIXTURE_LOG) as f:
+        data = json.load(f)
+    with open(log_filename, 'w') as f:
+        json.dump(data, f)
+    write_run(get_run_dirname(log_filename), data_to_arrays(data))
+    meta_mtime = os.path.getmtime(os.path.join(get_run_dirname(log_filename), 'meta.json'))
+
+    os.utime(log_filename, (meta_mtime - 1, meta_mtime - 1))
+    assert DataGenerator.get_run_files(str(tmp_path)) == ['fixture.run']
+    # The experiment was run again after the conversion.
+    os.utime(log_filename, (meta_mtime + 1, meta_mtime + 1))
+    assert DataGenerator.get_run_files(str(tmp_path)) == ['fixture.json']
+
+
+def test_log_without_ticks(tmp_path):
+    log_filename = str(tmp_path / 'header_only.jsonl')
+    with open(log_filename, 'w') as f:
+        f.write(json.dumps({'type': 'header', 'obstacles': [[1.0, 0.25, 0.1]], 'goals': None}) + '\n')
+    arrays = DataLogger.read_arrays(log_filename)
+    assert arrays['states'].ndim == 3 and len(arrays['states']) == 0
+    assert arrays['use_for_training'].ndim == 2
+
+    generator = DataGenerator([log_filename, FIXTURE_LOG], False, False, False, 1, False, False, False, False)
+    sample_index = generator.get_sample_index([0, 1])
+    assert np.all(sample_index[:, 0] == 1)
+    inputs, _, _ = generator.get_inputs([0, 1], normalize=False)
+    outputs, _, _ = generator.get_outputs([0, 1], normalize=False)
+    assert len(inputs) == len(outputs) == len(sample_index)
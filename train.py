@@ -69,8 +69,7 @@ if __name__ == "__main__":
 
     generator = DataGenerator(config.train_data_paths, config.x_is_d_goal, config.add_liveness_as_input, config.fixed_liveness_input, config.n_opponents, config.static_obs_xy_only, config.ego_frame_inputs, config.add_new_liveness_as_input, config.add_dist_to_static_obs)
 
-    norm_inputs, input_mean, input_std = generator.get_inputs(agent_idxs=config.agents_to_train_on, normalize=True)
-    norm_outputs, output_mean, output_std = generator.get_outputs(agent_idxs=config.agents_to_train_on, normalize=True)
+    norm_inputs, input_mean, input_std, norm_outputs, output_mean, output_std = generator.get_training_data(config.agents_to_train_on, config.feature_cache_dir)
 
     X_train, X_test, y_train, y_test = train_test_split(norm_inputs, norm_outputs, test_size=0.25, random_state=42, shuffle=True)
     print("Train size:", len(X_train), "Test size:", len(X_test))
@@ -0,0 +1,61 @@
+import config
+import numpy as np
+
+class TrajectoryBuffer:
+    """Preallocated arrays for one run, filled one tick at a time.
+
+    states[k] holds all agents' states at the start of tick k (states[num_ticks] is the current state), controls[k]
+    and compute_times[k] what was applied and spent during tick k. Readers get views, never copies. The per-tick
+    states can carry leading batch dimensions, e.g. (num_scenarios, num_agents, num_states) for BatchedEnvironment.
+    """
+    def __init__(self, initial_states, num_iterations=None):
+        if num_iterations is None:
+            num_iterations = int(config.runtime / config.sim_ts)
+        initial_states = np.asarray(initial_states, dtype=float)
+        self.num_agents = initial_states.shape[-2]
+        self.states = np.zeros((num_iterations + 1,) + initial_states.shape)
+        self.controls = np.zeros((num_iterations,) + initial_states.shape[:-1] + (config.num_controls,))
+        self.compute_times = np.zeros((num_iterations, self.num_agents))
+        self.states[0] = initial_states
+        self.num_ticks = 0
+
+    """Grows the arrays (doubling) when a run goes past the preallocated number of ticks."""
+    def ensure_capacity(self, num_ticks):
+        capacity = self.controls.shape[0]
+        if num_ticks <= capacity:
+            return
+        new_capacity = max(num_ticks, 2 * capacity)
+        self.states = np.concatenate([self.states, np.zeros((new_capacity - capacity,) + self.states.shape[1:])])
+        self.controls = np.concatenate([self.controls, np.zeros((new_capacity - capacity,) + self.controls.shape[1:])])
+        self.compute_times = np.concatenate([self.compute_times, np.zeros((new_capacity - capacity,) + self.compute_times.shape[1:])])
+
+    def record_tick(self, controls, compute_times, new_states):
+        self.ensure_capacity(self.num_ticks + 1)
+        self.controls[self.num_ticks] = controls
+        self.compute_times[self.num_ticks] = compute_times
+        self.states[self.num_ticks + 1] = new_states
+        self.num_ticks += 1
+
+    """Fills ticks past the current one up to num_iterations with the last state held and zero controls."""
+    def pad(self, num_iterations):
+        self.ensure_capacity(num_iterations)
+        self.states[self.num_ticks + 1:num_iterations + 1] = self.states[self.num_ticks]
+        self.controls[self.num_ticks:num_iterations] = 0.0
+
+    @property
+    def history(self):
+        return self.states[:self.num_ticks + 1]
+
+    @property
+    def compute_history(self):
+        return self.compute_times[:self.num_ticks]
+
+    """(..., num_agents, num_iterations, num_states) view of the states at the start of each tick, like x_cum."""
+    def get_state_trajectories(self, num_iterations=None):
+        num_iterations = self.num_ticks if num_iterations is None else num_iterations
+        return np.moveaxis(self.states[:num_iterations], 0, -2)
+
+    """(..., num_agents, num_iterations, num_controls) view of the controls applied in each tick, like u_cum."""
+    def get_control_trajectories(self, num_iterations=None):
+        num_iterations = self.num_ticks if num_iterations is None else num_iterations
+        return np.moveaxis(self.controls[:num_iterations], 0, -2)
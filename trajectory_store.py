@@ -0,0 +1,115 @@
+import os
+import json
+import config
+import numpy as np
+
+# A run is stored as a directory <name>.run with one .npy file per array and a meta.json.
+RUN_SUFFIX = '.run'
+RUN_FORMAT_VERSION = 1
+# Arrays of a run and their dtypes. Per-tick arrays have the tick as their first axis and the agent as their second.
+RUN_ARRAYS = {
+    'states': np.float64,            # (num_iterations, num_agents, num_states)
+    'goals': np.float64,             # (num_iterations, num_agents, goal_size)
+    'controls': np.float64,          # (num_iterations, num_agents, num_controls)
+    'use_for_training': np.bool_,    # (num_iterations, num_agents)
+    'compute_times': np.float32,     # (num_iterations, num_agents), NaN for logs that did not record them
+    'obstacles': np.float64,         # (num_obstacles, 3) rows of x, y, radius
+}
+
+def is_run_dir(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, 'meta.json'))
+
+
+"""Whether a run directory was written after its source log last changed. meta.json is written last, and unlike the
+directory's own mtime it changes when a run is converted again."""
+def is_run_up_to_date(run_dirname, filename):
+    return is_run_dir(run_dirname) and os.path.getmtime(os.path.join(run_dirname, 'meta.json')) >= os.path.getmtime(filename)
+
+
+"""Run directory that the converter writes for a JSON / JSONL log."""
+def get_run_dirname(filename):
+    root, ext = os.path.splitext(filename)
+    return (root if ext in ('.json', '.jsonl') else filename) + RUN_SUFFIX
+
+
+"""Converts a log dict ({'obstacles': ..., 'iterations': [...]}) to the run arrays. Logs from before
+use_for_training was recorded count every tick as a training sample, like DataGenerator always did. A log without
+ticks (e.g. a JSONL log with only its header) gives (0, 0, ...) arrays."""
+def data_to_arrays(data):
+    iterations = data['iterations']
+    num_agents = len(iterations[0]['states']) if len(iterations) > 0 else 0
+    arrays = {
+        'states': [iteration['states'] for iteration in iterations],
+        'goals': [iteration['goals'] for iteration in iterations],
+        'controls': [iteration['controls'] for iteration in iterations],
+        'use_for_training': [iteration.get('use_for_training', [True] * num_agents) for iteration in iterations],
+        'compute_times': [iteration.get('compute_times', [np.nan] * num_agents) for iteration in iterations],
+        'obstacles': data['obstacles'],
+    }
+    arrays = {name: np.array(values, dtype=RUN_ARRAYS[name]) for name, values in arrays.items()}
+    if len(iterations) == 0:
+        arrays['states'] = arrays['states'].reshape(0, 0, config.num_states)
+        arrays['goals'] = arrays['goals'].reshape(0, 0, config.num_states)
+        arrays['controls'] = arrays['controls'].reshape(0, 0, config.num_controls)
+        arrays['use_for_training'] = arrays['use_for_training'].reshape(0, 0)
+        arrays['compute_times'] = arrays['compute_times'].reshape(0, 0)
+    arrays['obstacles'] = arrays['obstacles'].reshape(-1, 3)
+    return arrays
+
+
+"""Per-tick solver stats of a log dict, or None if it did not record any."""
+def get_solver_stats(data):
+    if not any('solver_stats' in iteration for iteration in data['iterations']):
+        return None
+    return [iteration.get('solver_stats') for iteration in data['iterations']]
+
+
+"""Inverse of data_to_arrays, for readers of the log dict."""
+def arrays_to_data(arrays, solver_stats=None):
+    iterations = []
+    for tick in range(len(arrays['states'])):
+        iteration = {
+            'states': arrays['states'][tick].tolist(),
+            'goals': arrays['goals'][tick].tolist(),
+            'controls': arrays['controls'][tick].tolist(),
+            'use_for_training': arrays['use_for_training'][tick].tolist(),
+            'compute_times': arrays['compute_times'][tick].tolist(),
+        }
+        if solver_stats is not None:
+            iteration['solver_stats'] = solver_stats[tick]
+        iterations.append(iteration)
+    return {'obstacles': arrays['obstacles'].tolist(), 'iterations': iterations}
+
+
+"""Writes a run directory. metadata (e.g. the scenario and the source log) and the per-tick solver stats, if the
+log has them, go into meta.json."""
+def write_run(dirname, arrays, metadata=None, solver_stats=None):
+    os.makedirs(dirname, exist_ok=True)
+    for name, dtype in RUN_ARRAYS.items():
+        np.save(os.path.join(dirname, f'{name}.npy'), np.ascontiguousarray(arrays[name], dtype=dtype))
+    meta = {
+        'format_version': RUN_FORMAT_VERSION,
+        'num_iterations': int(arrays['states'].shape[0]),
+        'num_agents': int(arrays['states'].shape[1]),
+        'arrays': {name: {'shape': list(arrays[name].shape), 'dtype': np.dtype(dtype).name} for name, dtype in RUN_ARRAYS.items()},
+        'metadata': metadata if metadata is not None else {},
+    }
+    if solver_stats is not None:
+        meta['solver_stats'] = solver_stats
+    with open(os.path.join(dirname, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+"""Reads a run directory. Returns the arrays and the meta dict.
+
+With mmap_mode='r' the arrays are read-only memory maps of the .npy files: nothing is read until it is indexed,
+and then only the pages holding the indexed rows. Empty arrays cannot be mapped and are loaded normally."""
+def read_run(dirname, mmap_mode=None):
+    with open(os.path.join(dirname, 'meta.json')) as f:
+        meta = json.load(f)
+    arrays = {}
+    for name in RUN_ARRAYS:
+        is_empty = 0 in meta['arrays'][name]['shape']
+        arrays[name] = np.load(os.path.join(dirname, f'{name}.npy'), mmap_mode=None if is_empty else mmap_mode)
+    return arrays, meta
+
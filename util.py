@@ -172,3 +172,155 @@ def perturb_model_input(inputs, scenario_obstacles, num_total_opponents, x_is_d_
 
     return inputs
 
+
+
+"""The batch functions below must give bit-identical results to the scalar ones above (DataGenerator trains on them
+and the controllers run the scalar ones), so they use the same floating point operations:
+- np.dot and LA.norm of a vector go through BLAS ddot, whose rounding differs from a[:, 0]*b[:, 0] + a[:, 1]*b[:, 1].
+  np.matmul of stacked (1, 2) @ (2, 1) vectors calls the same dot routine for each stack.
+- cos, sin and arccos are evaluated one value at a time, like in the scalar functions, since NumPy's vectorized
+  loops are not guaranteed to round like its scalar calls or like math.
+tests/test_batch_features.py checks every flag combination against perturb_model_input."""
+def dot_batch(a, b):
+    return np.matmul(a[..., None, :], b[..., :, None])[..., 0, 0]
+
+
+def norm_batch(a):
+    return np.sqrt(dot_batch(a, a))
+
+
+"""Applies a scalar function (e.g. np.cos or math.cos) to each element of an array."""
+def map_scalar(func, values):
+    values = np.asarray(values, dtype=float)
+    return np.array([func(value) for value in values.ravel()], dtype=float).reshape(values.shape)
+
+
+"""check_intersection for (N, 2) positions and velocities."""
+def check_intersection_batch(ego_pos, opp_pos, ego_vel, opp_vel):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ego_vel_uvec = ego_vel / norm_batch(ego_vel)[:, None]
+        opp_vel_uvec = opp_vel / norm_batch(opp_vel)[:, None]
+    dx = opp_pos[:, 0] - ego_pos[:, 0]
+    dy = opp_pos[:, 1] - ego_pos[:, 1]
+    det = opp_vel_uvec[:, 0] * ego_vel_uvec[:, 1] - opp_vel_uvec[:, 1] * ego_vel_uvec[:, 0]
+    u = (dy * opp_vel_uvec[:, 0] - dx * opp_vel_uvec[:, 1]) * det
+    v = (dy * ego_vel_uvec[:, 0] - dx * ego_vel_uvec[:, 1]) * det
+    return (u > 0) & (v > 0)
+
+
+"""get_ray_intersection_point for (N, 2) positions and (N,) headings. Returns the points and whether the rays
+intersect (where they do not, get_ray_intersection_point returns None and the point is meaningless)."""
+def get_ray_intersection_point_batch(ego_pos, ego_theta, opp_pos, opp_theta):
+    ego_vel = np.stack([map_scalar(np.cos, ego_theta), map_scalar(np.sin, ego_theta)], axis=1)
+    opp_vel = np.stack([map_scalar(np.cos, opp_theta), map_scalar(np.sin, opp_theta)], axis=1)
+    intersecting = check_intersection_batch(ego_pos, opp_pos, ego_vel, opp_vel)
+
+    x1, y1 = ego_pos[:, 0], ego_pos[:, 1]
+    x2, y2 = (ego_pos + ego_vel).T
+    x3, y3 = opp_pos[:, 0], opp_pos[:, 1]
+    x4, y4 = (opp_pos + opp_vel).T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        px = ( (x1*y2-y1*x2)*(x3-x4)-(x1-x2)*(x3*y4-y3*x4) ) / ( (x1-x2)*(y3-y4)-(y1-y2)*(x3-x4) )
+        py = ( (x1*y2-y1*x2)*(y3-y4)-(y1-y2)*(x3*y4-y3*x4) ) / ( (x1-x2)*(y3-y4)-(y1-y2)*(x3-x4) )
+    return np.stack([px, py], axis=1), intersecting
+
+
+"""Liveness, intersecting and is_live of calculate_all_metrics for (N, 4) ego and opponent states."""
+def calculate_liveness_batch(ego_states, opp_states, liveness_thresh):
+    ego_vel_vec = np.stack([map_scalar(np.cos, ego_states[:, 2]), map_scalar(np.sin, ego_states[:, 2])], axis=1) * ego_states[:, 3:4]
+    opp_vel_vec = np.stack([map_scalar(np.cos, opp_states[:, 2]), map_scalar(np.sin, opp_states[:, 2])], axis=1) * opp_states[:, 3:4]
+    vel_diff = opp_vel_vec - ego_vel_vec
+    pos_diff = opp_states[:, :2] - ego_states[:, :2]
+    dot_product = dot_batch(pos_diff, vel_diff) / (norm_batch(pos_diff) * norm_batch(vel_diff) + EPSILON)
+    l = np.pi - map_scalar(np.arccos, np.clip(dot_product, -1, 1))
+
+    intersecting = check_intersection_batch(ego_states[:, :2], opp_states[:, :2], ego_vel_vec, opp_vel_vec)
+    if config.consider_intersects:
+        is_live = (l > liveness_thresh) | ~intersecting
+    else:
+        is_live = l > liveness_thresh
+    return l, intersecting, is_live
+
+
+"""rotate about the origin by angle for arrays of points, with math.cos and math.sin like rotate."""
+def rotate_batch(px, py, angle):
+    cos_angle = map_scalar(math.cos, angle).reshape(angle.shape + (1,) * (px.ndim - angle.ndim))
+    sin_angle = map_scalar(math.sin, angle).reshape(angle.shape + (1,) * (px.ndim - angle.ndim))
+    return cos_angle * px - sin_angle * py, sin_angle * px + cos_angle * py
+
+
+def perturb_model_input_batch(ego_states, opp_states, goals, scenario_obstacles, num_total_opponents, x_is_d_goal, add_liveness_as_input, fixed_liveness_input, static_obs_xy_only, ego_frame_inputs, add_new_liveness_as_input, add_dist_to_static_obs):
+    """Vectorized perturb_model_input for N samples that share the same obstacles.
+
+    ego_states and opp_states are (N, 4), goals (N, >=2). Returns the (N, num_inputs) matrix whose rows are what
+    perturb_model_input returns for each sample, with the liveness computed from the states as in
+    calculate_all_metrics.
+    """
+    ego_states = np.asarray(ego_states, dtype=float).reshape(-1, 4)
+    opp_states = np.asarray(opp_states, dtype=float).reshape(-1, 4)
+    goals = np.asarray(goals, dtype=float)
+    obstacles = np.asarray(scenario_obstacles, dtype=float).reshape(-1, 3)
+    num_samples = len(ego_states)
+
+    ego_pos, ego_theta, ego_vel = ego_states[:, :2], ego_states[:, 2], ego_states[:, 3]
+    opp_pos, opp_theta, opp_vel = opp_states[:, :2], opp_states[:, 2], opp_states[:, 3]
+    # Nearest obstacles first. A stable sort keeps equidistant obstacles in their listed order, like sorted().
+    obs_dists = norm_batch(ego_pos[:, None, :] - obstacles[None, :, :2])
+    obs_order = np.argsort(obs_dists, axis=1, kind='stable')[:, :num_total_opponents - 1]
+    agent_obs = obstacles[obs_order]
+
+    if x_is_d_goal:
+        inputs = np.stack([goals[:, 0] - ego_pos[:, 0], goals[:, 1] - ego_pos[:, 1], ego_theta, ego_vel, opp_pos[:, 0] - ego_pos[:, 0], opp_pos[:, 1] - ego_pos[:, 1], opp_theta, opp_vel], axis=1)
+        if ego_frame_inputs:
+            inputs[:, 0], inputs[:, 1] = rotate_batch(inputs[:, 0], inputs[:, 1], -ego_theta)
+            inputs[:, 4], inputs[:, 5] = rotate_batch(inputs[:, 4], inputs[:, 5], -ego_theta)
+            # The new liveness input below uses this relative heading too.
+            opp_theta = inputs[:, 6] - ego_theta
+            inputs[:, 2] = 0.0
+            inputs[:, 6] = opp_theta
+    else:
+        inputs = np.concatenate([ego_states, opp_states], axis=1)
+
+    obs_x, obs_y = agent_obs[:, :, 0], agent_obs[:, :, 1]
+    if x_is_d_goal:
+        obs_inp_x, obs_inp_y = obs_x - ego_pos[:, 0:1], obs_y - ego_pos[:, 1:2]
+        if ego_frame_inputs:
+            obs_inp_x, obs_inp_y = rotate_batch(obs_inp_x, obs_inp_y, -ego_theta)
+    else:
+        obs_inp_x, obs_inp_y = obs_x, obs_y
+    obs_inp = [obs_inp_x, obs_inp_y]
+    if not static_obs_xy_only:
+        obs_inp += [np.zeros(obs_x.shape), np.zeros(obs_x.shape)]
+    if static_obs_xy_only and add_dist_to_static_obs:
+        # Per obstacle with Python floats, like perturb_model_input's obs_x ** 2 (pow, not a multiplication).
+        obs_norms = np.array([np.sqrt(x ** 2 + y ** 2) for x, y in obstacles[:, :2].tolist()], dtype=float)
+        obs_inp.append(obs_norms[obs_order])
+    columns = [inputs, np.stack(obs_inp, axis=-1).reshape(num_samples, agent_obs.shape[1] * len(obs_inp))]
+
+    if add_liveness_as_input:
+        l, intersecting, _ = calculate_liveness_batch(ego_states, opp_states, config.liveness_threshold)
+        liveness = np.where(intersecting, l, np.pi if fixed_liveness_input else 0.0)
+        columns.append(liveness[:, None])
+
+    if add_new_liveness_as_input:
+        center_intersection, center_intersecting = get_ray_intersection_point_batch(ego_pos, ego_theta, opp_pos, opp_theta)
+        vec_to_opp = opp_pos - ego_pos
+        with np.errstate(divide='ignore', invalid='ignore'):
+            unit_vec_to_opp = vec_to_opp / norm_batch(vec_to_opp)[:, None]
+        initial_closest_to_opp = ego_pos + unit_vec_to_opp * (config.agent_radius)
+        opp_closest_to_initial = opp_pos - unit_vec_to_opp * (config.agent_radius)
+        intersection, intersecting = get_ray_intersection_point_batch(initial_closest_to_opp, ego_theta, opp_closest_to_initial, opp_theta)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d0 = norm_batch(initial_closest_to_opp - intersection)
+            d1 = norm_batch(opp_closest_to_initial - intersection)
+            d0_center = norm_batch(ego_pos - center_intersection)
+            d1_center = norm_batch(opp_pos - center_intersection)
+            t0 = d0_center / ego_vel
+            t1 = d1_center / opp_vel
+            # t0 < t1: the ego agent is faster.
+            barrier = np.where(t0 < t1, d1 / opp_vel - d0 / ego_vel, d0 / ego_vel - d1 / opp_vel)
+        valid = center_intersecting & intersecting & (ego_vel != 0) & (opp_vel != 0)
+        columns.append(np.where(valid, barrier, 10.0)[:, None])
+
+    return np.concatenate(columns, axis=1)
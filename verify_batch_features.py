@@ -0,0 +1,68 @@
+import sys
+import time
+import itertools
+import config
+import numpy as np
+from data_logger import DataGenerator
+from util import perturb_model_input, perturb_model_input_batch, calculate_all_metrics
+
+# Logs (folders, files or converted run directories) to check the features on.
+DATA_PATHS = ['datasets/doorway_scenario_suite_5', 'datasets/intersection_scenario_suite2']
+AGENT_IDXS = [0, 1]
+# Numbers of opponents to check, including fewer slots than obstacles and more.
+NUM_OPPONENTS = [1, 3, 6, 40]
+# Flags of perturb_model_input, in its argument order.
+FLAGS = ['x_is_d_goal', 'add_liveness_as_input', 'fixed_liveness_input', 'static_obs_xy_only', 'ego_frame_inputs', 'add_new_liveness_as_input', 'add_dist_to_static_obs']
+
+"""Features of every sample of a run through the scalar perturb_model_input, as DataGenerator used to build them."""
+def get_scalar_features(run, sample_index, num_opponents, flags):
+    obstacles = run['obstacles'].tolist()
+    data = []
+    for _, tick, agent_idx in sample_index:
+        ego_state, opp_state = np.array(run['states'][tick, agent_idx]), np.array(run['states'][tick, 1 - agent_idx])
+        metrics = calculate_all_metrics(ego_state, opp_state, config.liveness_threshold)
+        inputs = ego_state.tolist() + opp_state.tolist()
+        data.append(np.array(perturb_model_input(inputs, obstacles, num_opponents, *flags, run['goals'][tick, agent_idx].tolist(), metrics)))
+    return np.array(data).reshape(len(sample_index), -1)
+
+
+def get_batch_features(run, sample_index, num_opponents, flags):
+    ticks, agent_idxs = sample_index[:, 1], sample_index[:, 2]
+    return perturb_model_input_batch(run['states'][ticks, agent_idxs], run['states'][ticks, 1 - agent_idxs], run['goals'][ticks, agent_idxs], run['obstacles'], num_opponents, *flags)
+
+
+if __name__ == '__main__':
+    generator = DataGenerator(DATA_PATHS, False, False, False, 1, False, False, False, False)
+    sample_index = generator.get_sample_index(AGENT_IDXS)
+    run_sample_index = generator.split_sample_index(sample_index)
+    print(f"Checking {len(sample_index)} samples from {len(generator.runs)} runs")
+
+    num_checked, mismatches = 0, []
+    scalar_time, batch_time = 0.0, 0.0
+    for num_opponents in NUM_OPPONENTS:
+        for flags in itertools.product([False, True], repeat=len(FLAGS)):
+            for run_idx, run in enumerate(generator.runs):
+                run_samples = run_sample_index[run_idx]
+                if len(run_samples) == 0:
+                    continue
+                start = time.time()
+                # The scalar path warns on the divisions by zero that both paths handle the same way.
+                with np.errstate(all='ignore'):
+                    scalar_features = get_scalar_features(run, run_samples, num_opponents, flags)
+                scalar_time += time.time() - start
+                start = time.time()
+                batch_features = get_batch_features(run, run_samples, num_opponents, flags)
+                batch_time += time.time() - start
+
+                num_checked += 1
+                if scalar_features.shape != batch_features.shape or not np.array_equal(scalar_features, batch_features, equal_nan=True):
+                    max_diff = np.nanmax(np.abs(scalar_features - batch_features)) if scalar_features.shape == batch_features.shape else np.inf
+                    mismatches.append((num_opponents, dict(zip(FLAGS, flags)), run_idx, max_diff))
+
+    print(f"{num_checked} (flags, num_opponents, run) combinations, scalar {scalar_time:.2f}s, batch {batch_time:.2f}s ({scalar_time / batch_time:.0f}x)")
+    for num_opponents, flags, run_idx, max_diff in mismatches[:20]:
+        print(f"Mismatch: run {run_idx}, num_opponents {num_opponents}, {flags}, max abs difference {max_diff:.3e}")
+    if len(mismatches) > 0:
+        print(f"{len(mismatches)} combinations are not bit-identical")
+        sys.exit(1)
+    print("All features are bit-identical")